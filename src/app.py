@@ -1,44 +1,157 @@
 import asyncio
 from contextlib import asynccontextmanager
+from typing import Any, Dict
 import uvicorn
 from fastapi import FastAPI
-from src.config import APP_HOST, APP_PORT, APP_RELOAD, APP_LOG_LEVEL
+from src.config import (
+    logger,
+    APP_HOST,
+    APP_PORT,
+    APP_RELOAD,
+    APP_WORKERS,
+    APP_LOG_LEVEL,
+    COMMAND_TRANSPORT,
+    SIMULATION_ENABLED,
+    STREAM_ENABLED,
+    DEVICE_CACHE_ENABLED,
+    METRICS_ENABLED,
+    PROFILING_ENABLED,
+    PROFILING_STACK_SAMPLING,
+    REDIS_READ_FROM_REPLICAS,
+    WRITE_COALESCING_ENABLED,
+)
 from src.routers.device import router as device_router
+from src.routers.admin import router as admin_router
+from src.routers.stream import router as stream_router
+from src.routers.metrics import router as metrics_router
+from src.infrastructure.metrics import MetricsMiddleware
+from src.infrastructure.profiling import RequestProfiler, start_stack_sampler, stop_stack_sampler
+from src.infrastructure.leader_lease import run_as_leader
 from src.infrastructure.pubsub_listener import pubsub_listener
+from src.infrastructure.stream_listener import stream_listener
+from src.infrastructure.redis_client import close_redis_client
+from src.infrastructure.replica_router import start_replica_router, stop_replica_router
+from src.infrastructure.update_broker import start_update_broker, stop_update_broker, get_update_broker
+from src.services.device_cache import enable_device_cache, disable_device_cache
+from src.services.device_store import BACKEND_REDIS, RedisDeviceStore, init_device_store, close_device_store
+from src.services.simulation import start_simulation, stop_simulation
+from src.services.write_coalescer import enable_write_coalescer, disable_write_coalescer
 import os
 
 
 
 
 listener_task = None
+leader_task = None
+
+
+async def _leader_job(store, listen: bool) -> None:
+    """
+    Work that must run once per deployment, not once per worker: the
+    Pub/Sub command listener (every subscriber receives every command) and
+    the simulation, started here or through POST /admin/simulation.
+    """
+    if SIMULATION_ENABLED:
+        await start_simulation(store)
+    try:
+        if listen:
+            await pubsub_listener(store)
+        else:
+            await asyncio.Future()
+    finally:
+        await stop_simulation()
 
 
 @asynccontextmanager
 async def lifespan(_app: FastAPI):
-    global listener_task
+    global listener_task, leader_task
+
+    store = await init_device_store()
+
+    if WRITE_COALESCING_ENABLED:
+        enable_write_coalescer()
+
+    if REDIS_READ_FROM_REPLICAS:
+        if isinstance(store, RedisDeviceStore):
+            await start_replica_router(store.client)
+        else:
+            logger.warning(f"Replica reads need a single Redis master, not a {type(store).__name__}; reads stay on the store")
+
+    listen = os.getenv("ENABLE_PUBSUB", "true").lower() == "true"
+
+    if store.backend == BACKEND_REDIS:
+        if listen and COMMAND_TRANSPORT == "stream":
+            # the consumer group already spreads entries over the workers
+            listener_task = asyncio.create_task(stream_listener(store))
+            listen = False
+        # always elected: the admin API starts the simulation in the leader only
+        leader_task = asyncio.create_task(run_as_leader(store.client, lambda: _leader_job(store, listen)))
+    else:
+        # the in-memory store lives in this process, so there is nothing to coordinate
+        if listen and COMMAND_TRANSPORT == "stream":
+            logger.warning("The stream command transport needs Redis; no command listener started")
+        elif listen:
+            listener_task = asyncio.create_task(pubsub_listener(store))
+        if SIMULATION_ENABLED:
+            await start_simulation(store)
 
-    if os.getenv("ENABLE_PUBSUB", "true").lower() == "true":
-        listener_task = asyncio.create_task(pubsub_listener())
+    if STREAM_ENABLED or DEVICE_CACHE_ENABLED:
+        broker = await start_update_broker(store)
+        if DEVICE_CACHE_ENABLED:
+            enable_device_cache(broker)
+
+    if PROFILING_ENABLED and PROFILING_STACK_SAMPLING:
+        start_stack_sampler()
 
     yield
 
-    if listener_task and not listener_task.done():
-        listener_task.cancel()
-        try:
-            await listener_task
-        except asyncio.CancelledError:
-            pass
+    stop_stack_sampler()
+    await stop_simulation()
+    disable_device_cache(get_update_broker())
+    await stop_update_broker()
+
+    for task in (leader_task, listener_task):
+        if task and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+    listener_task = leader_task = None
+
+    await disable_write_coalescer()
+    await stop_replica_router()
+    await close_device_store()
+    await close_redis_client()
 
 
 app = FastAPI(title="IOT device simulator", lifespan=lifespan)
 app.include_router(device_router)
+app.include_router(admin_router)
+app.include_router(stream_router)
+
+if METRICS_ENABLED:
+    app.include_router(metrics_router)
+    app.add_middleware(MetricsMiddleware)
+
+if PROFILING_ENABLED:
+    app.add_middleware(RequestProfiler)
+
+
+def server_options() -> Dict[str, Any]:
+    reload = APP_RELOAD
+    if reload and APP_WORKERS > 1:
+        # uvicorn would silently start a single reloading process instead
+        logger.warning(f"APP_RELOAD is ignored with APP_WORKERS={APP_WORKERS}, starting the workers without reload")
+        reload = False
+    return {
+        "host": APP_HOST,
+        "port": APP_PORT,
+        "reload": reload,
+        "workers": APP_WORKERS,
+        "log_level": APP_LOG_LEVEL,
+    }
 
 
 if __name__ == "__main__":
-    uvicorn.run(
-        "src.app:app",
-        host=APP_HOST,
-        port=APP_PORT,
-        reload=APP_RELOAD,
-        log_level=APP_LOG_LEVEL,
-    )
+    uvicorn.run("src.app:app", **server_options())
@@ -1,5 +1,6 @@
 import os
 import logging
+import socket
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -31,10 +32,116 @@ APP_MODULE = os.getenv("APP_MODULE", "src.app:app")
 APP_HOST = os.getenv("APP_HOST", "127.0.0.1")
 APP_PORT = int(os.getenv("APP_PORT", "8000"))
 APP_RELOAD = os.getenv("APP_RELOAD", "false").lower() in ("true", "1", "t")
+# uvicorn worker processes; background work that must run once (the Pub/Sub
+# command listener, the startup simulation) is run by an elected leader
+APP_WORKERS = int(os.getenv("APP_WORKERS", "1"))
+LEADER_KEY = os.getenv("LEADER_KEY", "app:leader")
+LEADER_LEASE_SECONDS = float(os.getenv("LEADER_LEASE_SECONDS", "10"))
 
 DEVICE_COMMAND_CHANNEL = os.getenv("DEVICE_COMMAND_CHANNEL", "device_commands")
+# the command listeners (Pub/Sub and stream) reconnect after a lost connection
+# with jittered exponential backoff (seconds); with Sentinel the Pub/Sub one
+# also checks every PUBSUB_FAILOVER_CHECK_INTERVAL seconds whether the master moved
+PUBSUB_RECONNECT_BASE = float(os.getenv("PUBSUB_RECONNECT_BASE", "0.1"))
+PUBSUB_RECONNECT_MAX = float(os.getenv("PUBSUB_RECONNECT_MAX", "5"))
+PUBSUB_FAILOVER_CHECK_INTERVAL = float(os.getenv("PUBSUB_FAILOVER_CHECK_INTERVAL", "2"))
+
+# "pubsub" (fire-and-forget channel) or "stream" (Redis Stream with a consumer group)
+COMMAND_TRANSPORT = os.getenv("COMMAND_TRANSPORT", "pubsub").lower()
+COMMAND_STREAM = os.getenv("COMMAND_STREAM", "device_commands_stream")
+COMMAND_STREAM_GROUP = os.getenv("COMMAND_STREAM_GROUP", "command-workers")
+COMMAND_STREAM_CONSUMER = os.getenv("COMMAND_STREAM_CONSUMER", f"{socket.gethostname()}-{os.getpid()}")
+COMMAND_STREAM_BATCH = int(os.getenv("COMMAND_STREAM_BATCH", "100"))
+COMMAND_STREAM_BLOCK_MS = int(os.getenv("COMMAND_STREAM_BLOCK_MS", "1000"))
+COMMAND_STREAM_MAXLEN = int(os.getenv("COMMAND_STREAM_MAXLEN", "100000"))
+COMMAND_STREAM_CLAIM_IDLE_MS = int(os.getenv("COMMAND_STREAM_CLAIM_IDLE_MS", "30000"))
+COMMAND_STREAM_CLAIM_INTERVAL = float(os.getenv("COMMAND_STREAM_CLAIM_INTERVAL", "15"))
 
 
 USE_REDIS_SENTINEL = os.getenv("USE_REDIS_SENTINEL", "false").lower() in ("true", "1", "t")
 REDIS_SENTINELS = os.getenv("REDIS_SENTINELS", "redis-sentinel:26379")
 REDIS_MASTER_NAME = os.getenv("REDIS_MASTER_NAME", "mymaster")
+
+# Serve device reads (list / get) from replicas: discovered through Sentinel,
+# or the fixed "host:port[/db]" list in REDIS_REPLICAS. "round_robin" or
+# "least_latency"; replicas that are down or lag more than the limit are
+# skipped, and reads fall back to the master.
+REDIS_READ_FROM_REPLICAS = os.getenv("REDIS_READ_FROM_REPLICAS", "false").lower() in ("true", "1", "t")
+REDIS_REPLICAS = os.getenv("REDIS_REPLICAS", "")
+REDIS_REPLICA_SELECTION = os.getenv("REDIS_REPLICA_SELECTION", "round_robin").lower()
+REDIS_REPLICA_MAX_LAG_MS = int(os.getenv("REDIS_REPLICA_MAX_LAG_MS", "1000"))
+REDIS_REPLICA_CHECK_INTERVAL = float(os.getenv("REDIS_REPLICA_CHECK_INTERVAL", "1"))
+
+HISTORY_MAX_ENTRIES = int(os.getenv("HISTORY_MAX_ENTRIES", "1000"))
+HISTORY_MAX_AGE_SECONDS = int(os.getenv("HISTORY_MAX_AGE_SECONDS", str(7 * 24 * 3600)))
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "100"))
+
+REGISTRY_BATCH_SIZE = int(os.getenv("REGISTRY_BATCH_SIZE", "500"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "1000"))
+
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", "5"))
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "2"))
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", "30"))
+REDIS_RETRIES = int(os.getenv("REDIS_RETRIES", "3"))
+REDIS_SOCKET_KEEPALIVE = os.getenv("REDIS_SOCKET_KEEPALIVE", "true").lower() in ("true", "1", "t")
+
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "500"))
+BULK_CONCURRENCY = int(os.getenv("BULK_CONCURRENCY", "4"))
+
+COMMAND_WORKERS = int(os.getenv("COMMAND_WORKERS", "8"))
+COMMAND_QUEUE_SIZE = int(os.getenv("COMMAND_QUEUE_SIZE", "10000"))
+COMMAND_OVERFLOW_POLICY = os.getenv("COMMAND_OVERFLOW_POLICY", "block").lower()
+COMMAND_DRAIN_TIMEOUT = float(os.getenv("COMMAND_DRAIN_TIMEOUT", "10"))
+
+SIMULATION_ENABLED = os.getenv("SIMULATION_ENABLED", "false").lower() in ("true", "1", "t")
+SIMULATION_RATE = float(os.getenv("SIMULATION_RATE", "1000"))
+SIMULATION_BATCH_SIZE = int(os.getenv("SIMULATION_BATCH_SIZE", "500"))
+SIMULATION_TICK_SECONDS = float(os.getenv("SIMULATION_TICK_SECONDS", "0.05"))
+
+SEED_CHUNK_SIZE = int(os.getenv("SEED_CHUNK_SIZE", "1000"))
+
+STREAM_ENABLED = os.getenv("STREAM_ENABLED", "true").lower() in ("true", "1", "t")
+STREAM_CLIENT_BUFFER = int(os.getenv("STREAM_CLIENT_BUFFER", "100"))
+# "disconnect" (drop slow clients) or "drop_oldest" (skip their oldest buffered updates)
+STREAM_OVERFLOW_POLICY = os.getenv("STREAM_OVERFLOW_POLICY", "disconnect").lower()
+STREAM_MAX_CLIENTS = int(os.getenv("STREAM_MAX_CLIENTS", "10000"))
+STREAM_HEARTBEAT_SECONDS = float(os.getenv("STREAM_HEARTBEAT_SECONDS", "15"))
+
+# In-process device cache, invalidated through the device:updates:* channels.
+# Keep it off where reads must never be stale.
+DEVICE_CACHE_ENABLED = os.getenv("DEVICE_CACHE_ENABLED", "false").lower() in ("true", "1", "t")
+DEVICE_CACHE_SIZE = int(os.getenv("DEVICE_CACHE_SIZE", "10000"))
+DEVICE_CACHE_TTL_SECONDS = float(os.getenv("DEVICE_CACHE_TTL_SECONDS", "30"))
+
+# Items per chunk when a large JSON array or NDJSON response is written incrementally
+JSON_CHUNK_SIZE = int(os.getenv("JSON_CHUNK_SIZE", "1000"))
+
+# /metrics endpoint plus per-route and per-Redis-command instrumentation
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("true", "1", "t")
+
+# Opt-in request profiling: keeps requests slower than PROFILING_SLOW_MS plus a
+# PROFILING_SAMPLE_RATE fraction of the rest, with a time breakdown per request
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() in ("true", "1", "t")
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", "0.01"))
+PROFILING_SLOW_MS = float(os.getenv("PROFILING_SLOW_MS", "500"))
+PROFILING_BUFFER_SIZE = int(os.getenv("PROFILING_BUFFER_SIZE", "100"))
+# Also sample the event loop's stack to attach a trace to every capture
+PROFILING_STACK_SAMPLING = os.getenv("PROFILING_STACK_SAMPLING", "false").lower() in ("true", "1", "t")
+PROFILING_STACK_INTERVAL_MS = float(os.getenv("PROFILING_STACK_INTERVAL_MS", "5"))
+
+# Merge commands a device receives within the window into one write, history
+# entry and event (HTTP commands and the command listener)
+WRITE_COALESCING_ENABLED = os.getenv("WRITE_COALESCING_ENABLED", "false").lower() in ("true", "1", "t")
+WRITE_COALESCE_WINDOW_MS = float(os.getenv("WRITE_COALESCE_WINDOW_MS", "50"))
+
+# "redis" or "memory": an in-process store (dicts, indexes and in-memory pub/sub)
+# for single-node simulations and benchmarks without Redis
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "redis").lower()
+
+# Spread devices over several Redis nodes by consistent hashing of the device
+# id, e.g. "redis-a:6379,redis-b:6379/1". Empty: everything on DB_HOST/Sentinel.
+# DB_HOST (or the Sentinel master) keeps the command stream and leader lease.
+REDIS_SHARDS = os.getenv("REDIS_SHARDS", "")
+# points per shard on the hash ring; more points, more even spread
+REDIS_SHARD_VNODES = int(os.getenv("REDIS_SHARD_VNODES", "160"))
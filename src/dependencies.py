@@ -1,71 +1,39 @@
 import redis.asyncio as redis
-from redis.asyncio.sentinel import Sentinel
-from functools import lru_cache
-from typing import AsyncGenerator, List, Tuple
+from fastapi import Depends, Query
 
-from src.config import (
-    DB_HOST,
-    DB_PORT,
-    REDIS_DB,
-    USE_REDIS_SENTINEL,
-    REDIS_SENTINELS,
-    REDIS_MASTER_NAME,
-    logger,
-)
+from src.infrastructure.redis_client import get_redis_client
+from src.infrastructure.replica_router import get_replica_router
+from src.services.device_store import DeviceStore, get_device_store, init_device_store
 
-# ---------- helpers ----------
-
-def _parse_sentinels(value: str) -> List[Tuple[str, int]]:
-    """
-    "host1:26379,host2:26379" -> [(host1,26379),(host2,26379)]
-    """
-    result = []
-    for item in value.split(","):
-        host, port = item.strip().split(":")
-        result.append((host, int(port)))
-    return result
 
+# ---------- FastAPI dependency ----------
 
-@lru_cache(maxsize=1)
-def _get_sentinel() -> Sentinel:
-    sentinels = _parse_sentinels(REDIS_SENTINELS)
-    logger.info(f"Connecting to Redis Sentinel(s): {sentinels}")
-    return Sentinel(
-        sentinels,
-        socket_timeout=0.5,
-        decode_responses=True,
-        db=REDIS_DB,
-    )
+async def get_redis() -> redis.Redis:
+    """
+    Shared, pooled Redis client (direct or via Sentinel).
 
+    The client is created once in the application lifespan; connection health
+    is checked by the pool, so requests no longer pay for a PING.
+    """
+    return await get_redis_client()
 
-# ---------- FastAPI dependency ----------
 
-async def get_redis() -> AsyncGenerator[redis.Redis, None]:
+async def get_store() -> DeviceStore:
     """
-    Redis dependency with Sentinel support.
+    The device store selected by STORAGE_BACKEND, created in the lifespan.
     """
+    return get_device_store() or await init_device_store()
 
-    if USE_REDIS_SENTINEL:
-        sentinel = _get_sentinel()
-        client = sentinel.master_for(
-            service_name=REDIS_MASTER_NAME,
-            socket_timeout=0.5,
-        )
-        logger.debug("Using Redis via Sentinel")
-
-    else:
-        client = redis.Redis(
-            host=DB_HOST,
-            port=DB_PORT,
-            db=REDIS_DB,
-            decode_responses=True,
-            socket_timeout=0.5,
-        )
-        logger.debug("Using direct Redis connection")
 
-    try:
-        # sanity check
-        await client.ping()
-        yield client
-    finally:
-        await client.aclose()
+async def get_read_store(
+    consistent: bool = Query(False, description="Read from the master, e.g. right after a write (read-your-writes)"),
+    store: DeviceStore = Depends(get_store),
+) -> DeviceStore:
+    """
+    The store for read-only endpoints: a healthy replica when
+    REDIS_READ_FROM_REPLICAS is on, the store itself otherwise.
+    """
+    router = get_replica_router()
+    if router is None:
+        return store
+    return router.read_store(store, consistent)
@@ -0,0 +1,195 @@
+import asyncio
+import math
+import time
+import zlib
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from src.config import (
+    logger,
+    COMMAND_WORKERS,
+    COMMAND_QUEUE_SIZE,
+    COMMAND_OVERFLOW_POLICY,
+    COMMAND_DRAIN_TIMEOUT,
+)
+
+OVERFLOW_BLOCK = "block"
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_DROP_NEWEST = "drop_newest"
+OVERFLOW_POLICIES = (OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST)
+
+# may return a future when the command completes later, e.g. a coalesced write
+Handler = Callable[[Dict[str, Any]], Awaitable[Optional[asyncio.Future]]]
+# called with True once the command was applied, False when it failed or was dropped
+DoneCallback = Callable[[bool], None]
+QueueItem = Tuple[float, Dict[str, Any], Optional[DoneCallback]]
+
+_active_pool: Optional["CommandWorkerPool"] = None
+
+
+def active_pool_stats() -> Dict[str, Any]:
+    if _active_pool is None:
+        return {"running": False}
+    return {"running": True, **_active_pool.stats()}
+
+
+class CommandWorkerPool:
+    """
+    Fixed set of consumer coroutines fed by bounded queues.
+
+    Every worker owns one queue and commands are routed by a hash of their
+    device id, so commands for the same device run one after another while
+    different devices are processed in parallel.
+    """
+
+    def __init__(
+        self,
+        handler: Handler,
+        workers: int = COMMAND_WORKERS,
+        queue_size: int = COMMAND_QUEUE_SIZE,
+        overflow: str = COMMAND_OVERFLOW_POLICY,
+    ):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy '{overflow}', expected one of {OVERFLOW_POLICIES}")
+
+        self._handler = handler
+        self._overflow = overflow
+        self._per_worker = max(1, math.ceil(queue_size / workers))
+        self._queues: List[asyncio.Queue] = [asyncio.Queue(maxsize=self._per_worker) for _ in range(workers)]
+        self._tasks: List[asyncio.Task] = []
+        self._accepting = False
+
+        self.in_flight = 0
+        self.processed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    def start(self) -> None:
+        global _active_pool
+        _active_pool = self
+        self._accepting = True
+        self._tasks = [
+            asyncio.create_task(self._worker(queue), name=f"command-worker-{i}")
+            for i, queue in enumerate(self._queues)
+        ]
+        logger.info(f"Started {len(self._tasks)} command workers ({self._overflow}, {self._per_worker} per queue)")
+
+    def _queue_for(self, device_id: Optional[str]) -> asyncio.Queue:
+        index = zlib.crc32(str(device_id).encode("utf-8")) % len(self._queues)
+        return self._queues[index]
+
+    async def submit(self, payload: Dict[str, Any], on_done: Optional[DoneCallback] = None) -> bool:
+        """
+        Enqueue a command. Returns False when it was dropped by the overflow policy.
+
+        `on_done(ok)` is called once the command has been processed: with True
+        when it was applied, with False when the handler failed or the command
+        was dropped, so a durable transport can leave it to be retried.
+        """
+        if not self._accepting:
+            logger.warning(f"Command pool is stopped, dropping command: {payload}")
+            self.dropped += 1
+            if on_done is not None:
+                on_done(False)
+            return False
+
+        queue = self._queue_for(payload.get("device_id"))
+        item: QueueItem = (time.monotonic(), payload, on_done)
+
+        if not queue.full() or self._overflow == OVERFLOW_BLOCK:
+            await queue.put(item)
+            return True
+
+        self.dropped += 1
+        if self._overflow == OVERFLOW_DROP_NEWEST:
+            logger.warning(f"Command queue full, dropping newest command for {payload.get('device_id')}")
+            if on_done is not None:
+                on_done(False)
+            return False
+
+        _, oldest, oldest_done = queue.get_nowait()
+        queue.task_done()
+        if oldest_done is not None:
+            oldest_done(False)
+        logger.warning(f"Command queue full, dropping oldest command for {oldest.get('device_id')}")
+        queue.put_nowait(item)
+        return True
+
+    async def _worker(self, queue: asyncio.Queue) -> None:
+        while True:
+            enqueued_at, payload, on_done = await queue.get()
+
+            self.last_lag = time.monotonic() - enqueued_at
+            self.max_lag = max(self.max_lag, self.last_lag)
+            self.in_flight += 1
+            deferred = False
+            ok = False
+            try:
+                outcome = await self._handler(payload)
+                if isinstance(outcome, asyncio.Future):
+                    # the handler finishes later, e.g. a coalesced write
+                    deferred = True
+                    outcome.add_done_callback(lambda f, p=payload, d=on_done: self._finish_deferred(f, p, d))
+                else:
+                    self.processed += 1
+                    ok = True
+            except Exception as e:
+                self.failed += 1
+                logger.exception(f"Command processing failed for payload {payload}: {e}")
+            finally:
+                self.in_flight -= 1
+                queue.task_done()
+                if on_done is not None and not deferred:
+                    on_done(ok)
+
+    def _finish_deferred(self, future: asyncio.Future, payload: Dict[str, Any], on_done: Optional[DoneCallback]) -> None:
+        ok = not future.cancelled() and future.exception() is None
+        if ok:
+            self.processed += 1
+        else:
+            self.failed += 1
+            error = "cancelled" if future.cancelled() else future.exception()
+            logger.error(f"Command processing failed for payload {payload}: {error}")
+        if on_done is not None:
+            on_done(ok)
+
+    async def stop(self, drain: bool = True, timeout: float = COMMAND_DRAIN_TIMEOUT) -> None:
+        """
+        Stop accepting commands, wait for queued and in-flight work to finish
+        (up to `timeout` seconds) and shut the workers down.
+        """
+        global _active_pool
+        self._accepting = False
+
+        if drain and self._tasks:
+            try:
+                await asyncio.wait_for(asyncio.gather(*(q.join() for q in self._queues)), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Command pool drain timed out with {self.queue_depth} commands left")
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if _active_pool is self:
+            _active_pool = None
+        logger.info(f"Command workers stopped, {self.processed} processed, {self.failed} failed")
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(q.qsize() for q in self._queues)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": len(self._queues),
+            "overflow_policy": self._overflow,
+            "queue_depth": self.queue_depth,
+            "queue_capacity": self._per_worker * len(self._queues),
+            "in_flight": self.in_flight,
+            "processed": self.processed,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "last_lag_ms": round(self.last_lag * 1000, 3),
+            "max_lag_ms": round(self.max_lag * 1000, 3),
+        }
@@ -0,0 +1,145 @@
+import asyncio
+import os
+import socket
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import redis.asyncio as redis
+
+from src.config import logger, LEADER_KEY, LEADER_LEASE_SECONDS
+
+# extend / release the lease only while we still own it
+RENEW_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+RELEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+_leadership: Optional["Leadership"] = None
+
+
+class Leadership:
+    """
+    Runs `job` in exactly one process of a deployment, using a Redis key
+    with a TTL as the lease.
+
+    Every process calls `run()`. The holder of the lease renews it every
+    third of the lease time and runs the job. The others retry at the
+    same pace and take over once the lease expires, e.g. because the
+    leader crashed. A leader that fails to renew cancels its job before
+    the lease can pass to someone else.
+    """
+
+    def __init__(
+        self,
+        r: redis.Redis,
+        job: Callable[[], Awaitable[Any]],
+        key: str = LEADER_KEY,
+        lease: float = LEADER_LEASE_SECONDS,
+    ):
+        self._r = r
+        self._job = job
+        self._key = key
+        self._lease_ms = int(lease * 1000)
+        self._interval = lease / 3
+        self.token = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+        self.leader = False
+        self.elections_won = 0
+        self.leases_lost = 0
+        self.job_failures = 0
+
+    async def _acquire(self) -> bool:
+        return bool(await self._r.set(self._key, self.token, nx=True, px=self._lease_ms))
+
+    async def _renew(self) -> bool:
+        return bool(await self._r.eval(RENEW_LUA, 1, self._key, self.token, self._lease_ms))
+
+    async def _release(self) -> None:
+        await self._r.eval(RELEASE_LUA, 1, self._key, self.token)
+
+    async def run(self) -> None:
+        while True:
+            try:
+                acquired = await self._acquire()
+            except Exception as e:
+                logger.error(f"Leader election on {self._key} failed: {e}")
+                acquired = False
+
+            if acquired:
+                await self._lead()
+            await asyncio.sleep(self._interval)
+
+    async def _lead(self) -> None:
+        self.leader = True
+        self.elections_won += 1
+        logger.info(f"{self.token} is the leader ({self._key}), starting the coordinated job")
+        job = asyncio.create_task(self._job())
+
+        try:
+            while not job.done():
+                await asyncio.wait([job], timeout=self._interval)
+                if job.done():
+                    break
+                try:
+                    renewed = await self._renew()
+                except Exception as e:
+                    logger.error(f"Could not renew the lease on {self._key}: {e}")
+                    renewed = False
+                if not renewed:
+                    self.leases_lost += 1
+                    logger.warning(f"{self.token} lost the lease on {self._key}, stopping the coordinated job")
+                    break
+
+            if job.done() and not job.cancelled() and job.exception() is not None:
+                self.job_failures += 1
+                logger.error(f"Coordinated job failed: {job.exception()}")
+        finally:
+            self.leader = False
+            if not job.done():
+                job.cancel()
+                await asyncio.gather(job, return_exceptions=True)
+            try:
+                # shield: on shutdown hand the lease over right away instead of letting it expire
+                await asyncio.shield(self._release())
+            except Exception as e:
+                logger.warning(f"Could not release the lease on {self._key}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "key": self._key,
+            "token": self.token,
+            "leader": self.leader,
+            "lease_seconds": self._lease_ms / 1000,
+            "elections_won": self.elections_won,
+            "leases_lost": self.leases_lost,
+            "job_failures": self.job_failures,
+        }
+
+
+async def run_as_leader(r: redis.Redis, job: Callable[[], Awaitable[Any]], **settings) -> None:
+    """
+    Take part in the election until cancelled; `job` runs while this
+    process holds the lease.
+    """
+    global _leadership
+    leadership = _leadership = Leadership(r, job, **settings)
+    try:
+        await leadership.run()
+    finally:
+        if _leadership is leadership:
+            _leadership = None
+
+
+def leadership_stats() -> Dict[str, Any]:
+    if _leadership is None:
+        return {"coordinated": False}
+    return {"coordinated": True, **_leadership.stats()}
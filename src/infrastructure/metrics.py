@@ -0,0 +1,245 @@
+import bisect
+import math
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import redis.asyncio as redis
+from redis.asyncio.client import Pipeline
+
+from src.infrastructure.profiling import STAGE_REDIS, record_stage
+
+# A small in-process metrics registry rendered in the Prometheus text format.
+# Recording is a dict lookup plus an addition (and a bisect for histograms),
+# cheap enough to leave on for every request and every Redis call.
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[str, ...]
+# name, type, help, [(suffix, labels, value)]
+Family = Tuple[str, str, str, List[Tuple[str, Dict[str, str], float]]]
+Collector = Callable[[], Iterable[Family]]
+
+_metrics: List["_Metric"] = []
+_collectors: List[Collector] = []
+
+
+class _Metric(ABC):
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        _metrics.append(self)
+
+    def _labels(self, values: Labels) -> Dict[str, str]:
+        return dict(zip(self.labelnames, values))
+
+    @abstractmethod
+    def family(self) -> Family:
+        """
+        The metric and its current samples, ready to render.
+        """
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, labels: Labels = (), amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, labels: Labels = ()) -> float:
+        return self._values.get(labels, 0)
+
+    def family(self) -> Family:
+        samples = [("_total", self._labels(labels), value) for labels, value in self._values.items()]
+        return self.name, self.type, self.documentation, samples
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self._bounds = tuple(buckets)
+        # per label set: [bucket counts..., +Inf count, sum]
+        self._values: Dict[Labels, List[float]] = {}
+
+    def observe(self, value: float, labels: Labels = ()) -> None:
+        state = self._values.get(labels)
+        if state is None:
+            state = self._values[labels] = [0] * (len(self._bounds) + 2)
+        state[bisect.bisect_left(self._bounds, value)] += 1
+        state[-1] += value
+
+    def count(self, labels: Labels = ()) -> int:
+        state = self._values.get(labels)
+        return int(sum(state[:-1])) if state else 0
+
+    def family(self) -> Family:
+        samples = []
+        for labels, state in self._values.items():
+            base = self._labels(labels)
+            cumulative = 0
+            for bound, count in zip(self._bounds + (math.inf,), state[:-1]):
+                cumulative += count
+                samples.append(("_bucket", {**base, "le": _format_bound(bound)}, cumulative))
+            samples.append(("_count", base, cumulative))
+            samples.append(("_sum", base, state[-1]))
+        return self.name, self.type, self.documentation, samples
+
+
+def _format_bound(bound: float) -> str:
+    return "+Inf" if bound == math.inf else repr(bound)
+
+
+def register_collector(collector: Collector) -> None:
+    """
+    Register a callable that reports point-in-time values (gauges) at scrape time.
+    """
+    if collector not in _collectors:
+        _collectors.append(collector)
+
+
+def stats_collector(prefix: str, stats: Callable[[], Dict[str, Any]], documentation: str) -> Collector:
+    """
+    Expose every numeric value of an existing `*_stats()` dict as a gauge
+    named `<prefix>_<key>`, so the admin endpoints and /metrics stay in sync.
+    """
+    def collect() -> Iterable[Family]:
+        for key, value in stats().items():
+            if isinstance(value, (bool, int, float)):
+                yield f"{prefix}_{key}", "gauge", f"{documentation} ({key})", [("", {}, value)]
+    return collect
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, bool) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def render() -> str:
+    families: List[Family] = [metric.family() for metric in _metrics]
+    for collector in _collectors:
+        families.extend(collector())
+
+    lines = []
+    for name, metric_type, documentation, samples in families:
+        lines.append(f"# HELP {name} {documentation}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for suffix, labels, value in samples:
+            label_text = ",".join(f'{key}="{_escape(str(val))}"' for key, val in labels.items())
+            sample = f"{name}{suffix}{{{label_text}}}" if label_text else f"{name}{suffix}"
+            lines.append(f"{sample} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# ---------- application metrics ----------
+
+HTTP_REQUESTS = Counter("http_requests", "HTTP requests by route and status", ("method", "route", "status"))
+HTTP_LATENCY = Histogram("http_request_duration_seconds", "HTTP request latency by route", ("method", "route"))
+
+REDIS_COMMANDS = Counter("redis_commands", "Redis round trips by command (PIPELINE for a pipeline)", ("command",))
+REDIS_ERRORS = Counter("redis_command_errors", "Redis round trips that raised", ("command",))
+REDIS_LATENCY = Histogram("redis_command_duration_seconds", "Redis round-trip latency by command", ("command",))
+REDIS_PIPELINED = Counter("redis_pipelined_commands", "Commands sent inside pipelines")
+
+DEVICE_UPDATES = Counter("device_updates", "Device update script results by outcome", ("status",))
+DEVICE_EVENT_SUBSCRIBERS = Counter(
+    "device_event_subscribers",
+    "Subscribers that received published device events on the command channel",
+)
+
+
+# ---------- instrumentation ----------
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording request count and latency per route
+    template (not per raw path, which keeps the label set bounded).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            method = scope["method"]
+            HTTP_LATENCY.observe(time.perf_counter() - started, (method, path))
+            HTTP_REQUESTS.inc((method, path, str(status[0])))
+
+
+class InstrumentedPipeline(Pipeline):
+    async def execute(self, raise_on_error: bool = True):
+        size = len(self.command_stack)
+        started = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error=raise_on_error)
+        except Exception:
+            REDIS_ERRORS.inc(("PIPELINE",))
+            raise
+        finally:
+            if size:
+                elapsed = time.perf_counter() - started
+                record_stage(STAGE_REDIS, elapsed)
+                REDIS_LATENCY.observe(elapsed, ("PIPELINE",))
+                REDIS_COMMANDS.inc(("PIPELINE",))
+                REDIS_PIPELINED.inc(amount=size)
+
+
+class InstrumentedRedis(redis.Redis):
+    """
+    Redis client that records a count and latency for every round trip, and
+    adds the time to the current request profile when there is one.
+    """
+
+    async def execute_command(self, *args, **options):
+        command = str(args[0]).upper()
+        started = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        except Exception:
+            REDIS_ERRORS.inc((command,))
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            record_stage(STAGE_REDIS, elapsed)
+            REDIS_LATENCY.observe(elapsed, (command,))
+            REDIS_COMMANDS.inc((command,))
+
+    def pipeline(self, transaction: bool = True, shard_hint: Optional[str] = None) -> Pipeline:
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
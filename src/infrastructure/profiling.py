@@ -0,0 +1,281 @@
+import contextlib
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from src.config import (
+    logger,
+    PROFILING_SAMPLE_RATE,
+    PROFILING_SLOW_MS,
+    PROFILING_BUFFER_SIZE,
+    PROFILING_STACK_INTERVAL_MS,
+)
+
+# Opt-in request profiling. While a request is profiled its RequestProfile
+# sits in a context variable; the Redis client, model validation and
+# serialization add their elapsed time to it. With profiling off nothing
+# sets the variable and every hook is a single ContextVar lookup.
+
+STAGE_REDIS = "redis"
+STAGE_VALIDATION = "validation"
+STAGE_SERIALIZATION = "serialization"
+STAGES = (STAGE_REDIS, STAGE_VALIDATION, STAGE_SERIALIZATION)
+
+REASON_SLOW = "slow"
+REASON_SAMPLED = "sampled"
+
+TRACE_TOP_STACKS = 20
+_MAX_STACK_DEPTH = 64
+
+_current: ContextVar[Optional["RequestProfile"]] = ContextVar("request_profile", default=None)
+_NOT_PROFILED = contextlib.nullcontext()
+
+_sampler: Optional["StackSampler"] = None
+
+
+class RequestProfile:
+    __slots__ = ("started", "seconds", "calls")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.seconds = dict.fromkeys(STAGES, 0.0)
+        self.calls = dict.fromkeys(STAGES, 0)
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.seconds[stage] += seconds
+        self.calls[stage] += 1
+
+
+class _StageTimer:
+    __slots__ = ("profile", "stage", "started")
+
+    def __init__(self, profile: RequestProfile, stage: str):
+        self.profile = profile
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, *_exc):
+        self.profile.add(self.stage, time.perf_counter() - self.started)
+
+
+def current_profile() -> Optional[RequestProfile]:
+    return _current.get()
+
+
+def timed(stage: str):
+    """
+    Context manager adding the block's duration to the current request
+    profile; a shared no-op when the request is not profiled.
+    """
+    profile = _current.get()
+    return _NOT_PROFILED if profile is None else _StageTimer(profile, stage)
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    profile = _current.get()
+    if profile is not None:
+        profile.add(stage, seconds)
+
+
+class ProfileBuffer:
+    """
+    Ring buffer of the most recent captures.
+    """
+
+    def __init__(self, size: int = PROFILING_BUFFER_SIZE):
+        self._captures: Deque[Dict[str, Any]] = deque(maxlen=size)
+        self.profiled = 0
+        self.captured = Counter()
+
+    def add(self, capture: Dict[str, Any]) -> None:
+        self._captures.append(capture)
+        self.captured[capture["reason"]] += 1
+
+    def captures(self, limit: Optional[int] = None, reason: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Captures, newest first.
+        """
+        result = [c for c in reversed(self._captures) if reason is None or c["reason"] == reason]
+        return result[:limit] if limit is not None else result
+
+    def clear(self) -> None:
+        self._captures.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "buffered": len(self._captures),
+            "buffer_size": self._captures.maxlen,
+            "profiled": self.profiled,
+            "captured_slow": self.captured[REASON_SLOW],
+            "captured_sampled": self.captured[REASON_SAMPLED],
+        }
+
+
+_buffer = ProfileBuffer()
+
+
+def get_profile_buffer() -> ProfileBuffer:
+    return _buffer
+
+
+class StackSampler:
+    """
+    Sampling profiler for the event loop thread: a daemon thread records the
+    loop's current Python stack every `interval` seconds into a bounded
+    history, from which the stacks seen during a request are taken.
+
+    Requests share the loop, so a trace also contains whatever ran
+    concurrently; stacks ending in the selector mean the loop was idle.
+    """
+
+    def __init__(self, thread_id: int, interval: float, max_samples: int = 100_000):
+        self._thread_id = thread_id
+        self._interval = interval
+        self._samples: Deque[Tuple[float, str]] = deque(maxlen=max_samples)
+        self._labels: Dict[Any, str] = {}
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread.join()
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = f"{os.path.basename(code.co_filename)}:{code.co_name}"
+        return label
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self._interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None and len(stack) < _MAX_STACK_DEPTH:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self._samples.append((time.perf_counter(), ";".join(reversed(stack))))
+
+    def trace(self, started: float, finished: float, top: int = TRACE_TOP_STACKS) -> Dict[str, Any]:
+        """
+        Collapsed stacks (outermost frame first) sampled between two
+        perf_counter readings, most frequent first.
+        """
+        stacks = Counter(stack for at, stack in list(self._samples) if started <= at <= finished)
+        return {
+            "interval_ms": self._interval * 1000,
+            "samples": sum(stacks.values()),
+            "stacks": [{"stack": stack, "samples": count} for stack, count in stacks.most_common(top)],
+        }
+
+
+def start_stack_sampler(interval_ms: float = PROFILING_STACK_INTERVAL_MS) -> StackSampler:
+    """
+    Start sampling the calling thread, which must be the event loop thread.
+    """
+    global _sampler
+    if _sampler is None:
+        _sampler = StackSampler(threading.get_ident(), interval_ms / 1000)
+        _sampler.start()
+        logger.info(f"Stack sampler started ({interval_ms} ms interval)")
+    return _sampler
+
+
+def stop_stack_sampler() -> None:
+    global _sampler
+    if _sampler is not None:
+        _sampler.stop()
+        _sampler = None
+
+
+class RequestProfiler:
+    """
+    ASGI middleware profiling every request and keeping the ones slower than
+    `slow_ms` plus a random `sample_rate` fraction of the rest.
+    """
+
+    def __init__(
+        self,
+        app,
+        sample_rate: float = PROFILING_SAMPLE_RATE,
+        slow_ms: float = PROFILING_SLOW_MS,
+        buffer: Optional[ProfileBuffer] = None,
+    ):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.buffer = buffer if buffer is not None else _buffer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile()
+        token = _current.set(profile)
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _current.reset(token)
+            finished = time.perf_counter()
+            self.buffer.profiled += 1
+
+            duration_ms = (finished - profile.started) * 1000
+            if duration_ms >= self.slow_ms:
+                reason = REASON_SLOW
+            elif self.sample_rate > 0 and random.random() < self.sample_rate:
+                reason = REASON_SAMPLED
+            else:
+                reason = None
+
+            if reason is not None:
+                self.buffer.add(_capture(scope, status[0], profile, finished, duration_ms, reason))
+
+
+def _capture(
+    scope: Dict[str, Any],
+    status: int,
+    profile: RequestProfile,
+    finished: float,
+    duration_ms: float,
+    reason: str,
+) -> Dict[str, Any]:
+    breakdown = {stage: round(seconds * 1000, 3) for stage, seconds in profile.seconds.items()}
+    breakdown["other"] = round(max(duration_ms - sum(breakdown.values()), 0.0), 3)
+
+    capture = {
+        "reason": reason,
+        "method": scope["method"],
+        "path": scope["path"],
+        "route": getattr(scope.get("route"), "path", None),
+        "status": status,
+        "finished_at": datetime.now(timezone.utc).isoformat(),
+        "duration_ms": round(duration_ms, 3),
+        "breakdown_ms": breakdown,
+        "calls": dict(profile.calls),
+    }
+    if _sampler is not None:
+        capture["trace"] = _sampler.trace(profile.started, finished)
+    return capture
+
+
+def profiling_stats() -> Dict[str, Any]:
+    return {"stack_sampling": _sampler is not None, **_buffer.stats()}
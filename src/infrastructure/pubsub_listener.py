@@ -1,37 +1,177 @@
 import asyncio
 import json
-import redis.asyncio as aioredis
+import time
+from typing import Any, Dict, Optional, Tuple
 
-from src.config import logger, DB_HOST, DB_PORT, DEVICE_COMMAND_CHANNEL
+from redis.backoff import ExponentialWithJitterBackoff
+
+from src.config import (
+    logger,
+    DEVICE_COMMAND_CHANNEL,
+    PUBSUB_FAILOVER_CHECK_INTERVAL,
+    PUBSUB_RECONNECT_BASE,
+    PUBSUB_RECONNECT_MAX,
+    REDIS_MASTER_NAME,
+    USE_REDIS_SENTINEL,
+)
+from src.infrastructure.command_workers import CommandWorkerPool
+from src.infrastructure.redis_client import build_listener_client, get_sentinel
 from src.services.commands_service import process_command_message
+from src.services.device_store import BACKEND_REDIS, DeviceStore
+from src.services.write_coalescer import flush_write_coalescer
 
-async def pubsub_listener():
-    redis = aioredis.Redis(host=DB_HOST, port=DB_PORT)
-    await redis.ping()
-    pubsub = redis.pubsub()
+_stats = {
+    "connected": False,
+    "connects": 0,
+    "reconnects": 0,
+    "disconnects": 0,
+    "downtime_seconds": 0.0,
+    "last_downtime_seconds": 0.0,
+    "received": 0,
+    "invalid": 0,
+}
+_down_since: Optional[float] = None
 
-    try:
-        await pubsub.subscribe(DEVICE_COMMAND_CHANNEL)
-        logger.info(f"Subscribed to Redis channel: {DEVICE_COMMAND_CHANNEL}")
 
-        async for message in pubsub.listen():
-            if message['type'] == 'message':
-                try:
-                    data = message['data']
-                    if isinstance(data, bytes):
-                        data = data.decode('utf-8')
+class MasterMoved(Exception):
+    """
+    Sentinel promoted another node while the subscription was still open.
+    """
+
+
+def pubsub_stats() -> Dict[str, Any]:
+    stats = dict(_stats)
+    if _down_since is not None:
+        # the outage in progress counts too
+        stats["downtime_seconds"] += time.monotonic() - _down_since
+    stats["downtime_seconds"] = round(stats["downtime_seconds"], 3)
+    return {"channel": DEVICE_COMMAND_CHANNEL, **stats}
+
+
+def _connected() -> None:
+    global _down_since
+    _stats["connected"] = True
+    _stats["connects"] += 1
+    if _down_since is not None:
+        downtime = time.monotonic() - _down_since
+        _stats["reconnects"] += 1
+        _stats["downtime_seconds"] += downtime
+        _stats["last_downtime_seconds"] = round(downtime, 3)
+        _down_since = None
+        logger.info(f"Resubscribed to {DEVICE_COMMAND_CHANNEL} after {downtime:.2f}s without it")
+
+
+def _stopped() -> None:
+    global _down_since
+    _stats["connected"] = False
+    if _down_since is not None:
+        _stats["downtime_seconds"] += time.monotonic() - _down_since
+        _down_since = None
+
+
+def _disconnected() -> None:
+    global _down_since
+    _stats["connected"] = False
+    if _down_since is None:
+        _down_since = time.monotonic()
+        _stats["disconnects"] += 1
+
+
+async def _sentinel_master() -> Optional[Tuple[str, int]]:
+    if not USE_REDIS_SENTINEL:
+        return None
+    host, port = await get_sentinel().discover_master(REDIS_MASTER_NAME)
+    return host, int(port)
 
-                    command_payload = json.loads(data)
-                    asyncio.create_task(process_command_message(redis, command_payload))
 
-                except json.JSONDecodeError:
-                    logger.error(f"Failed to decode JSON message: {message['data']}")
-                except Exception as e:
-                    logger.error(f"Error in Pub/Sub message stream: {e}")
+async def _consume(pubsub, pool: CommandWorkerPool, master: Optional[Tuple[str, int]]) -> None:
+    next_check = time.monotonic() + PUBSUB_FAILOVER_CHECK_INTERVAL
+
+    while True:
+        message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+        if message is not None and message["type"] == "message":
+            _stats["received"] += 1
+            data = message["data"]
+            if isinstance(data, bytes):
+                data = data.decode("utf-8")
+            try:
+                await pool.submit(json.loads(data))
+            except json.JSONDecodeError:
+                _stats["invalid"] += 1
+                logger.error(f"Failed to decode JSON message: {data}")
+            except Exception as e:
+                logger.error(f"Error in Pub/Sub message stream: {e}")
+
+        if master is not None and time.monotonic() >= next_check:
+            next_check = time.monotonic() + PUBSUB_FAILOVER_CHECK_INTERVAL
+            # a failover can leave the old connection open, e.g. to a demoted master
+            try:
+                current = await _sentinel_master()
+            except Exception as e:
+                logger.warning(f"Could not ask Sentinel for the master: {e}")
+                continue
+            if current != master:
+                raise MasterMoved(f"master moved from {master[0]}:{master[1]} to {current[0]}:{current[1]}")
+
+
+async def pubsub_listener(store: Optional[DeviceStore] = None):
+    """
+    Apply commands published on DEVICE_COMMAND_CHANNEL through `store`.
+
+    With Redis the channel is read on a dedicated connection to the master
+    (Sentinel or DB_HOST), which also applies the commands when no store is
+    given; an in-memory store delivers the channel itself.
+
+    A lost connection is retried with jittered exponential backoff, and the
+    channel is subscribed again on the new connection. Through Sentinel
+    every reconnect resolves the master anew. Commands published while the
+    listener is away are lost; use COMMAND_TRANSPORT=stream when that
+    matters.
+    """
+    redis = None
+    if store is None or store.backend == BACKEND_REDIS:
+        redis = build_listener_client()
+    target = store if store is not None else redis
+
+    async def handle(payload: Dict[str, Any]) -> Optional[asyncio.Future]:
+        return await process_command_message(target, payload)
+
+    pool = CommandWorkerPool(handle)
+    pool.start()
+    backoff = ExponentialWithJitterBackoff(base=PUBSUB_RECONNECT_BASE, cap=PUBSUB_RECONNECT_MAX)
+    failures = 0
+
+    try:
+        while True:
+            pubsub = redis.pubsub() if redis is not None else store.pubsub()
+            try:
+                master = await _sentinel_master() if redis is not None else None
+                await pubsub.subscribe(DEVICE_COMMAND_CHANNEL)
+                logger.info(f"Subscribed to Redis channel: {DEVICE_COMMAND_CHANNEL}")
+                _connected()
+                failures = 0
+                await _consume(pubsub, pool, master)
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                _disconnected()
+                delay = backoff.compute(failures)
+                failures += 1
+                logger.warning(f"Pub/Sub listener lost {DEVICE_COMMAND_CHANNEL} ({e}), reconnecting in {delay:.2f}s")
+                await asyncio.sleep(delay)
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    # the connection is already gone
+                    pass
 
-    except ConnectionRefusedError:
-        logger.critical("Could not connect to Redis for Pub/Sub. Listener failed to start.")
     finally:
-        await pubsub.unsubscribe(DEVICE_COMMAND_CHANNEL)
-        await redis.aclose()
+        _stopped()
+        await pool.stop()
+        # coalesced writes still waiting for their window use this connection
+        await flush_write_coalescer()
+        if redis is not None:
+            await redis.aclose()
         logger.info("Pub/Sub listener connection closed.")
@@ -1,34 +1,164 @@
 import asyncio
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple
+
 import redis.asyncio as redis
-from redis.exceptions import ConnectionError, TimeoutError
+from redis.asyncio.retry import Retry
+from redis.asyncio.sentinel import Sentinel
+from redis.backoff import ExponentialWithJitterBackoff, NoBackoff
 
-from src.config import DB_HOST, DB_PORT, REDIS_DB, logger
+from src.config import (
+    DB_HOST,
+    DB_PORT,
+    REDIS_DB,
+    USE_REDIS_SENTINEL,
+    REDIS_SENTINELS,
+    REDIS_MASTER_NAME,
+    REDIS_MAX_CONNECTIONS,
+    REDIS_POOL_TIMEOUT,
+    REDIS_SOCKET_TIMEOUT,
+    REDIS_HEALTH_CHECK_INTERVAL,
+    REDIS_SOCKET_KEEPALIVE,
+    REDIS_RETRIES,
+    REDIS_SHARDS,
+    METRICS_ENABLED,
+    PROFILING_ENABLED,
+    logger,
+)
+from src.infrastructure.metrics import InstrumentedRedis
 
 _client: redis.Redis | None = None
 _lock = asyncio.Lock()
 
 
+# ---------- helpers ----------
+
+def _parse_sentinels(value: str) -> List[Tuple[str, int]]:
+    """
+    "host1:26379,host2:26379" -> [(host1,26379),(host2,26379)]
+    """
+    result = []
+    for item in value.split(","):
+        host, port = item.strip().split(":")
+        result.append((host, int(port)))
+    return result
+
+
+@lru_cache(maxsize=1)
+def get_sentinel() -> Sentinel:
+    sentinels = _parse_sentinels(REDIS_SENTINELS)
+    logger.info(f"Connecting to Redis Sentinel(s): {sentinels}")
+    return Sentinel(
+        sentinels,
+        socket_timeout=0.5,
+        decode_responses=True,
+        db=REDIS_DB,
+    )
+
+
+def parse_nodes(value: str) -> List[Tuple[str, int, int]]:
+    """
+    "host1:6379,host2:6380/2" -> [(host1,6379,REDIS_DB),(host2,6380,2)]
+    """
+    result = []
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        address, _, db = item.partition("/")
+        host, port = address.split(":")
+        result.append((host, int(port), int(db) if db else REDIS_DB))
+    return result
+
+
+def _connection_kwargs() -> Dict[str, Any]:
+    return {
+        "decode_responses": True,
+        "socket_connect_timeout": 2,
+        "socket_timeout": REDIS_SOCKET_TIMEOUT,
+        "socket_keepalive": REDIS_SOCKET_KEEPALIVE,
+        "health_check_interval": REDIS_HEALTH_CHECK_INTERVAL,
+        "max_connections": REDIS_MAX_CONNECTIONS,
+        # a pool passed to Redis.from_pool does not get the client's default retry policy
+        "retry": Retry(ExponentialWithJitterBackoff(base=0.05, cap=1), REDIS_RETRIES),
+    }
+
+
+# ---------- shared client ----------
+
+def _client_class() -> type:
+    return InstrumentedRedis if METRICS_ENABLED or PROFILING_ENABLED else redis.Redis
+
+
 def build_client() -> redis.Redis:
-    return redis.Redis(
+    """
+    Build the application-wide pooled client, either for the Sentinel master
+    or for the directly configured Redis.
+    """
+    if USE_REDIS_SENTINEL:
+        logger.info(f"Creating Redis pool via Sentinel for master '{REDIS_MASTER_NAME}'")
+        return get_sentinel().master_for(
+            service_name=REDIS_MASTER_NAME,
+            redis_class=_client_class(),
+            **_connection_kwargs(),
+        )
+
+    logger.info(f"Creating Redis pool for {DB_HOST}:{DB_PORT}, db={REDIS_DB}")
+    pool = redis.BlockingConnectionPool(
         host=DB_HOST,
         port=DB_PORT,
         db=REDIS_DB,
-        decode_responses=True,
-        socket_connect_timeout=2,
-        socket_timeout=2,
+        timeout=REDIS_POOL_TIMEOUT,
+        **_connection_kwargs(),
     )
+    return _client_class().from_pool(pool)
 
 
-async def get_redis_client() -> redis.Redis:
-    global _client
+def build_node_client(host: str, port: int, db: int = REDIS_DB, **overrides) -> redis.Redis:
+    """
+    A pooled client for one node, with the shared client's settings.
+    """
+    pool = redis.BlockingConnectionPool(
+        host=host,
+        port=port,
+        db=db,
+        timeout=REDIS_POOL_TIMEOUT,
+        **{**_connection_kwargs(), **overrides},
+    )
+    return _client_class().from_pool(pool)
 
-    if _client is not None:
-        try:
-            await _client.ping()
-            return _client
-        except (ConnectionError, TimeoutError):
-            logger.warning("Redis connection lost. Reconnecting...")
-            _client = None
+
+def build_listener_client(host: str | None = None, port: int | None = None) -> redis.Redis:
+    """
+    A client for a long-lived subscription: the Sentinel master, or
+    DB_HOST / `host`. It does not retry, so a lost connection reaches the
+    listener, which reconnects with its own backoff and counts the outage.
+    """
+    no_retry = Retry(NoBackoff(), 0)
+    if USE_REDIS_SENTINEL and host is None:
+        return get_sentinel().master_for(
+            service_name=REDIS_MASTER_NAME,
+            redis_class=_client_class(),
+            **{**_connection_kwargs(), "retry": no_retry},
+        )
+    return build_node_client(host or DB_HOST, port or DB_PORT, REDIS_DB, retry=no_retry)
+
+
+def build_shard_clients(value: str = REDIS_SHARDS) -> Dict[str, redis.Redis]:
+    """
+    One pooled client per shard, keyed by "host:port/db"; empty when
+    sharding is off.
+    """
+    clients = {}
+    for host, port, db in parse_nodes(value):
+        name = f"{host}:{port}/{db}"
+        logger.info(f"Creating Redis pool for shard {name}")
+        clients[name] = build_node_client(host, port, db)
+    return clients
+
+
+async def init_redis_client() -> redis.Redis:
+    global _client
 
     async with _lock:
         if _client is None:
@@ -37,9 +167,38 @@ async def get_redis_client() -> redis.Redis:
         return _client
 
 
+async def get_redis_client() -> redis.Redis:
+    if _client is not None:
+        return _client
+    return await init_redis_client()
+
+
 async def close_redis_client() -> None:
     global _client
     async with _lock:
         if _client is not None:
             await _client.aclose()
             _client = None
+
+
+def client_pool_stats(client: redis.Redis) -> Dict[str, Any]:
+    pool = client.connection_pool
+    in_use = len(pool._in_use_connections)
+    available = len(pool._available_connections)
+    return {
+        "max_connections": pool.max_connections,
+        "in_use": in_use,
+        "available": available,
+        "created": in_use + available,
+    }
+
+
+def pool_stats() -> Dict[str, Any]:
+    if _client is None:
+        return {"initialized": False}
+
+    return {
+        "initialized": True,
+        "mode": "sentinel" if USE_REDIS_SENTINEL else "direct",
+        **client_pool_stats(_client),
+    }
@@ -0,0 +1,328 @@
+import asyncio
+import itertools
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import redis.asyncio as redis
+from redis.asyncio.retry import Retry
+from redis.backoff import NoBackoff
+from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
+
+from src.config import (
+    logger,
+    REDIS_DB,
+    REDIS_MASTER_NAME,
+    REDIS_REPLICAS,
+    REDIS_REPLICA_CHECK_INTERVAL,
+    REDIS_REPLICA_MAX_LAG_MS,
+    REDIS_REPLICA_SELECTION,
+    REGISTRY_BATCH_SIZE,
+    USE_REDIS_SENTINEL,
+)
+from src.infrastructure.redis_client import build_node_client, get_sentinel, parse_nodes
+from src.services.device_store import HistoryRecord, RedisDeviceStore
+
+# written to the master every check; a replica's copy shows how far behind it is
+HEARTBEAT_KEY = "replication:heartbeat"
+
+SELECT_ROUND_ROBIN = "round_robin"
+SELECT_LEAST_LATENCY = "least_latency"
+SELECTIONS = (SELECT_ROUND_ROBIN, SELECT_LEAST_LATENCY)
+
+# weight of the newest sample in the latency average
+_LATENCY_ALPHA = 0.3
+
+# errors that mean the replica is gone, as opposed to a bad request
+_REPLICA_DOWN = (RedisConnectionError, RedisTimeoutError)
+
+_router: Optional["ReplicaRouter"] = None
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+class Replica:
+    def __init__(self, name: str, client: redis.Redis):
+        self.name = name
+        self.client = client
+        self.healthy = False
+        self.lag_ms: Optional[int] = None
+        self.latency_ms: Optional[float] = None
+        self.error: Optional[str] = None
+        self.reads = 0
+        self.failures = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "healthy": self.healthy,
+            "lag_ms": self.lag_ms,
+            "latency_ms": round(self.latency_ms, 3) if self.latency_ms is not None else None,
+            "reads": self.reads,
+            "failures": self.failures,
+            "error": self.error,
+        }
+
+
+class ReplicaReadStore(RedisDeviceStore):
+    """
+    A RedisDeviceStore that reads from a replica and writes to the master.
+    A replica that fails mid-request is marked down and the read is
+    finished on the master, so callers never see the failover.
+    """
+
+    authoritative = False
+
+    def __init__(self, master: redis.Redis, replica: Replica, router: "ReplicaRouter"):
+        super().__init__(master)
+        self.replica = replica
+        self._replica_store = RedisDeviceStore(replica.client)
+        self._router = router
+
+    async def _read(self, method: str, *args):
+        # once the replica failed, the rest of the request stays on the master
+        if self.replica.healthy:
+            try:
+                return await getattr(self._replica_store, method)(*args)
+            except _REPLICA_DOWN as e:
+                self._router.replica_failed(self.replica, e)
+        return await getattr(RedisDeviceStore, method)(self, *args)
+
+    async def get(self, device_id: str) -> Dict[str, str]:
+        return await self._read("get", device_id)
+
+    async def get_many(self, device_ids: List[str], fields: Optional[List[str]] = None) -> List[Dict[str, str]]:
+        return await self._read("get_many", device_ids, fields)
+
+    async def exists(self, device_id: str) -> bool:
+        return await self._read("exists", device_id)
+
+    async def history(
+        self,
+        device_id: str,
+        since: Optional[int] = None,
+        until: Optional[int] = None,
+        limit: Optional[int] = None,
+        order: str = "desc",
+    ) -> Optional[List[HistoryRecord]]:
+        return await self._read("history", device_id, since, until, limit, order)
+
+    async def iter_batches(
+        self,
+        filters: Optional[Dict[str, str]] = None,
+        batch_size: int = REGISTRY_BATCH_SIZE,
+        after: Optional[str] = None,
+    ) -> AsyncIterator[List[str]]:
+        if self.replica.healthy:
+            walk = self._replica_store.iter_batches(filters, batch_size=batch_size, after=after)
+            try:
+                async for batch in walk:
+                    if batch:
+                        after = batch[-1]
+                    yield batch
+                return
+            except _REPLICA_DOWN as e:
+                self._router.replica_failed(self.replica, e)
+            finally:
+                await walk.aclose()
+
+        # the registry is walked in id order, so the master can pick up where the replica stopped
+        async for batch in RedisDeviceStore.iter_batches(self, filters, batch_size=batch_size, after=after):
+            yield batch
+
+
+class ReplicaRouter:
+    """
+    Spreads device reads over the master's replicas.
+
+    Replicas come from Sentinel (`discover_slaves`, which already leaves
+    out replicas Sentinel considers down) or from a fixed list. Every
+    `interval` the router writes a millisecond timestamp to HEARTBEAT_KEY
+    on the master and reads it back from every replica: the difference is
+    the replica's replication lag (at the resolution of the interval), the
+    round trip feeds its latency average. Replicas that do not answer, have
+    no heartbeat yet or lag more than `max_lag_ms` get no reads; when none
+    is left, reads go to the master.
+    """
+
+    def __init__(
+        self,
+        master: redis.Redis,
+        replicas: Optional[str] = None,
+        selection: str = REDIS_REPLICA_SELECTION,
+        max_lag_ms: int = REDIS_REPLICA_MAX_LAG_MS,
+        interval: float = REDIS_REPLICA_CHECK_INTERVAL,
+    ):
+        if selection not in SELECTIONS:
+            raise ValueError(f"Unknown replica selection '{selection}', expected one of {SELECTIONS}")
+        self.master = master
+        self.selection = selection
+        self.max_lag_ms = max_lag_ms
+        self.interval = interval
+        self._static = parse_nodes(REDIS_REPLICAS if replicas is None else replicas)
+        self.replicas: Dict[str, Replica] = {}
+        self._turn = itertools.count()
+        self._task: Optional[asyncio.Task] = None
+
+        self.master_reads = 0
+        self.consistent_reads = 0
+        self.failovers = 0
+
+    # ---------- membership ----------
+
+    async def _discover(self) -> List[Tuple[str, int, int]]:
+        if self._static or not USE_REDIS_SENTINEL:
+            return self._static
+        slaves = await get_sentinel().discover_slaves(REDIS_MASTER_NAME)
+        return [(host, int(port), REDIS_DB) for host, port in slaves]
+
+    async def _sync_members(self) -> None:
+        try:
+            nodes = await self._discover()
+        except Exception as e:
+            # keep the current set; the health checks still run against it
+            logger.warning(f"Replica discovery failed: {e}")
+            return
+
+        names = {f"{host}:{port}/{db}": (host, port, db) for host, port, db in nodes}
+        for name in set(self.replicas) - set(names):
+            logger.info(f"Replica {name} left, no more reads go there")
+            await self.replicas.pop(name).client.aclose()
+        for name in set(names) - set(self.replicas):
+            host, port, db = names[name]
+            logger.info(f"Found replica {name}")
+            # no retries: a replica that does not answer right away is skipped, not waited for
+            self.replicas[name] = Replica(name, build_node_client(host, port, db, retry=Retry(NoBackoff(), 0)))
+
+    # ---------- health ----------
+
+    async def _probe(self, replica: Replica) -> Tuple[Optional[int], float]:
+        started = time.perf_counter()
+        value = await replica.client.get(HEARTBEAT_KEY)
+        return (int(value) if value else None), (time.perf_counter() - started) * 1000
+
+    async def check(self) -> None:
+        """
+        One round: refresh the replica set, grade every replica against the
+        master's heartbeat and write the next heartbeat.
+        """
+        await self._sync_members()
+        replicas = list(self.replicas.values())
+        master_value, *probes = await asyncio.gather(
+            self.master.get(HEARTBEAT_KEY),
+            *(self._probe(replica) for replica in replicas),
+            return_exceptions=True,
+        )
+        master_beat = None if isinstance(master_value, Exception) or not master_value else int(master_value)
+
+        for replica, probe in zip(replicas, probes):
+            if isinstance(probe, Exception):
+                replica.healthy, replica.lag_ms, replica.error = False, None, str(probe) or type(probe).__name__
+                continue
+
+            beat, latency = probe
+            replica.latency_ms = latency if replica.latency_ms is None else (
+                _LATENCY_ALPHA * latency + (1 - _LATENCY_ALPHA) * replica.latency_ms
+            )
+            replica.lag_ms = max(0, master_beat - beat) if master_beat is not None and beat is not None else None
+            if replica.lag_ms is None:
+                replica.healthy, replica.error = False, "no heartbeat"
+            elif replica.lag_ms > self.max_lag_ms:
+                replica.healthy, replica.error = False, f"lagging {replica.lag_ms} ms"
+            else:
+                replica.healthy, replica.error = True, None
+
+        try:
+            await self.master.set(HEARTBEAT_KEY, _now_ms())
+        except Exception as e:
+            logger.warning(f"Could not write the replication heartbeat: {e}")
+
+    def replica_failed(self, replica: Replica, error: Exception) -> None:
+        replica.healthy = False
+        replica.error = str(error) or type(error).__name__
+        replica.failures += 1
+        self.failovers += 1
+        logger.warning(f"Read from replica {replica.name} failed, finishing it on the master: {error}")
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.check()
+            except Exception as e:
+                logger.error(f"Replica health check failed: {e}")
+
+    async def start(self) -> None:
+        await self.check()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await asyncio.gather(*(replica.client.aclose() for replica in self.replicas.values()))
+        self.replicas.clear()
+
+    # ---------- routing ----------
+
+    def pick(self) -> Optional[Replica]:
+        healthy = [replica for replica in self.replicas.values() if replica.healthy]
+        if not healthy:
+            return None
+        if self.selection == SELECT_LEAST_LATENCY:
+            return min(healthy, key=lambda replica: replica.latency_ms)
+        return healthy[next(self._turn) % len(healthy)]
+
+    def read_store(self, store: RedisDeviceStore, consistent: bool = False) -> RedisDeviceStore:
+        """
+        The store to serve one read request from. `consistent` reads go to
+        the master so a client sees its own writes.
+        """
+        if consistent:
+            self.consistent_reads += 1
+            return store
+        replica = self.pick()
+        if replica is None:
+            self.master_reads += 1
+            return store
+        replica.reads += 1
+        return ReplicaReadStore(store.client, replica, self)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "selection": self.selection,
+            "max_lag_ms": self.max_lag_ms,
+            "healthy": sum(replica.healthy for replica in self.replicas.values()),
+            "replica_reads": sum(replica.reads for replica in self.replicas.values()),
+            "master_reads": self.master_reads,
+            "consistent_reads": self.consistent_reads,
+            "failovers": self.failovers,
+            "replicas": {name: replica.stats() for name, replica in self.replicas.items()},
+        }
+
+
+def get_replica_router() -> Optional[ReplicaRouter]:
+    return _router
+
+
+async def start_replica_router(master: redis.Redis, **settings) -> ReplicaRouter:
+    global _router
+    if _router is None:
+        router = ReplicaRouter(master, **settings)
+        await router.start()
+        _router = router
+    return _router
+
+
+async def stop_replica_router() -> None:
+    global _router
+    if _router is not None:
+        await _router.stop()
+        _router = None
+
+
+def replica_router_stats() -> Dict[str, Any]:
+    if _router is None:
+        return {"enabled": False}
+    return {"enabled": True, **_router.stats()}
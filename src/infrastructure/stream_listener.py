@@ -0,0 +1,218 @@
+import asyncio
+import json
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import redis.asyncio as aioredis
+from redis.backoff import ExponentialWithJitterBackoff
+from redis.exceptions import ResponseError
+
+from src.config import (
+    logger,
+    COMMAND_STREAM,
+    COMMAND_STREAM_GROUP,
+    COMMAND_STREAM_CONSUMER,
+    COMMAND_STREAM_BATCH,
+    COMMAND_STREAM_BLOCK_MS,
+    COMMAND_STREAM_CLAIM_IDLE_MS,
+    COMMAND_STREAM_CLAIM_INTERVAL,
+    PUBSUB_RECONNECT_BASE,
+    PUBSUB_RECONNECT_MAX,
+)
+from src.infrastructure.command_workers import CommandWorkerPool
+from src.infrastructure.redis_client import build_listener_client
+from src.services.commands_service import process_command_message
+from src.services.device_store import DeviceStore
+from src.services.write_coalescer import flush_write_coalescer
+
+StreamEntry = Tuple[str, Optional[Dict[str, str]]]
+
+_stats = {
+    "connected": False,
+    "reconnects": 0,
+    "disconnects": 0,
+    "read": 0,
+    "claimed": 0,
+    "acked": 0,
+    "invalid": 0,
+    "failed": 0,
+}
+
+
+def stream_stats() -> Dict[str, Any]:
+    return {"stream": COMMAND_STREAM, "group": COMMAND_STREAM_GROUP, "consumer": COMMAND_STREAM_CONSUMER, **_stats}
+
+
+async def ensure_consumer_group(r: aioredis.Redis) -> None:
+    # checked first, so reconnecting to an existing group is no BUSYGROUP error
+    if await r.exists(COMMAND_STREAM):
+        groups = await r.xinfo_groups(COMMAND_STREAM)
+        if any(group["name"] == COMMAND_STREAM_GROUP for group in groups):
+            return
+    try:
+        await r.xgroup_create(COMMAND_STREAM, COMMAND_STREAM_GROUP, id="0", mkstream=True)
+        logger.info(f"Created consumer group {COMMAND_STREAM_GROUP} on stream {COMMAND_STREAM}")
+    except ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+def _on_done(entry_id: str, acks: List[str], held: Set[str]):
+    def done(ok: bool) -> None:
+        if ok:
+            # held until the ack is sent, so a claim round in between skips it
+            acks.append(entry_id)
+        else:
+            # not acknowledged: the entry stays pending and is claimed again later
+            held.discard(entry_id)
+            _stats["failed"] += 1
+    return done
+
+
+async def _dispatch(pool: CommandWorkerPool, entries: List[StreamEntry], acks: List[str], held: Set[str]) -> None:
+    """
+    Hand entries to the workers; `held` tracks the ones this consumer is
+    still working on or has yet to acknowledge, successful ones are queued
+    in `acks`.
+    """
+    for entry_id, fields in entries:
+        if not fields:
+            # entry was trimmed away while pending
+            acks.append(entry_id)
+            continue
+
+        try:
+            payload = json.loads(fields.get("payload", ""))
+        except json.JSONDecodeError:
+            logger.error(f"Failed to decode stream entry {entry_id}: {fields}")
+            _stats["invalid"] += 1
+            acks.append(entry_id)
+            continue
+
+        held.add(entry_id)
+        await pool.submit(payload, on_done=_on_done(entry_id, acks, held))
+
+
+async def _flush_acks(r: aioredis.Redis, acks: List[str], held: Set[str]) -> None:
+    if not acks:
+        return
+    entry_ids = acks[:]
+    del acks[:len(entry_ids)]
+    _stats["acked"] += await r.xack(COMMAND_STREAM, COMMAND_STREAM_GROUP, *entry_ids)
+    held.difference_update(entry_ids)
+
+
+async def _claim_stale(r: aioredis.Redis, pool: CommandWorkerPool, acks: List[str], held: Set[str]) -> None:
+    """
+    Take over entries that another (dead) consumer read but never
+    acknowledged, and retry our own failed ones. Entries still waiting in
+    our own queues are idle too, but must not be dispatched twice.
+    """
+    start_id = "0-0"
+    while True:
+        reply = await r.xautoclaim(
+            COMMAND_STREAM,
+            COMMAND_STREAM_GROUP,
+            COMMAND_STREAM_CONSUMER,
+            min_idle_time=COMMAND_STREAM_CLAIM_IDLE_MS,
+            start_id=start_id,
+            count=COMMAND_STREAM_BATCH,
+        )
+        start_id, entries = reply[0], [entry for entry in reply[1] if entry[0] not in held]
+        if entries:
+            _stats["claimed"] += len(entries)
+            logger.info(f"Reclaimed {len(entries)} pending commands from {COMMAND_STREAM}")
+            await _dispatch(pool, entries, acks, held)
+        if start_id == "0-0":
+            return
+
+
+def _raise_if_cancelled() -> None:
+    # on Python 3.11 the asyncio.wait_for redis-py uses for socket writes can
+    # swallow a cancellation that arrives as the write completes
+    task = asyncio.current_task()
+    if task is not None and task.cancelling():
+        raise asyncio.CancelledError()
+
+
+async def _consume(r: aioredis.Redis, pool: CommandWorkerPool, acks: List[str], held: Set[str]) -> None:
+    next_claim = 0.0
+    while True:
+        _raise_if_cancelled()
+        if time.monotonic() >= next_claim:
+            await _claim_stale(r, pool, acks, held)
+            next_claim = time.monotonic() + COMMAND_STREAM_CLAIM_INTERVAL
+
+        response = await r.xreadgroup(
+            COMMAND_STREAM_GROUP,
+            COMMAND_STREAM_CONSUMER,
+            {COMMAND_STREAM: ">"},
+            count=COMMAND_STREAM_BATCH,
+            block=COMMAND_STREAM_BLOCK_MS,
+        )
+        for _, entries in response or []:
+            _stats["read"] += len(entries)
+            await _dispatch(pool, entries, acks, held)
+
+        await _flush_acks(r, acks, held)
+
+
+async def stream_listener(store: Optional[DeviceStore] = None):
+    """
+    Consume the command stream on a dedicated connection to the master
+    (Sentinel or DB_HOST); commands are applied through `store` when given
+    (e.g. a sharded store), else on the same connection.
+
+    A lost connection is retried with jittered exponential backoff and the
+    consumer group is ensured again on the new connection. Entries read but
+    not yet acknowledged stay pending meanwhile, and successful ones are
+    acknowledged once the connection is back.
+    """
+    redis = build_listener_client()
+    target = store if store is not None else redis
+
+    async def handle(payload: Dict[str, Any]) -> Optional[asyncio.Future]:
+        return await process_command_message(target, payload)
+
+    pool = CommandWorkerPool(handle)
+    pool.start()
+    acks: List[str] = []
+    held: Set[str] = set()
+    backoff = ExponentialWithJitterBackoff(base=PUBSUB_RECONNECT_BASE, cap=PUBSUB_RECONNECT_MAX)
+    failures = 0
+
+    try:
+        while True:
+            try:
+                await ensure_consumer_group(redis)
+                logger.info(f"Consuming {COMMAND_STREAM} as {COMMAND_STREAM_GROUP}/{COMMAND_STREAM_CONSUMER}")
+                _stats["connected"] = True
+                if failures:
+                    _stats["reconnects"] += 1
+                failures = 0
+                await _consume(redis, pool, acks, held)
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                _raise_if_cancelled()
+                if _stats["connected"]:
+                    _stats["disconnects"] += 1
+                _stats["connected"] = False
+                delay = backoff.compute(failures)
+                failures += 1
+                logger.warning(f"Command stream listener lost {COMMAND_STREAM} ({e}), reconnecting in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    finally:
+        _stats["connected"] = False
+        await pool.stop()
+        # coalesced writes still waiting for their window use this connection
+        await flush_write_coalescer()
+        try:
+            await _flush_acks(redis, acks, held)
+        except Exception as e:
+            # left pending, claimed again by the next consumer
+            logger.warning(f"Could not acknowledge {len(acks)} stream entries on shutdown: {e}")
+        await redis.aclose()
+        logger.info("Command stream listener connection closed.")
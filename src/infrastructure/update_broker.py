@@ -0,0 +1,270 @@
+import asyncio
+import fnmatch
+from typing import Callable, Dict, List, Optional, Set
+
+from src.config import (
+    logger,
+    STREAM_CLIENT_BUFFER,
+    STREAM_OVERFLOW_POLICY,
+    STREAM_MAX_CLIENTS,
+)
+from src.services.device_store import StoreLike
+
+UPDATES_PATTERN = "device:updates:*"
+_CHANNEL_PREFIX = "device:updates:"
+
+OVERFLOW_DISCONNECT = "disconnect"
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_POLICIES = (OVERFLOW_DISCONNECT, OVERFLOW_DROP_OLDEST)
+
+CLOSED_SLOW_CONSUMER = "slow_consumer"
+CLOSED_SHUTDOWN = "shutdown"
+
+# called with (device_id, raw JSON message) for every update
+UpdateCallback = Callable[[str, str], None]
+# called every time the pattern subscription is (re)established
+SubscribeCallback = Callable[[], None]
+# called every time the pattern subscription is lost
+DisconnectCallback = Callable[[], None]
+
+_broker: Optional["UpdateBroker"] = None
+
+
+class BrokerFull(Exception):
+    pass
+
+
+class Subscription:
+    """
+    One client's view of the update stream: a bounded buffer of raw JSON
+    messages for a single device, a device id pattern, or the whole fleet.
+    """
+
+    def __init__(self, device_id: Optional[str], pattern: Optional[str], buffer_size: int, overflow: str):
+        self.device_id = device_id
+        self.pattern = pattern
+        self.overflow = overflow
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=buffer_size)
+        self.delivered = 0
+        self.dropped = 0
+        self.closed_reason: Optional[str] = None
+
+    def matches(self, device_id: str) -> bool:
+        return self.pattern is None or fnmatch.fnmatchcase(device_id, self.pattern)
+
+    def offer(self, message: str) -> bool:
+        """
+        Buffer a message without blocking. Returns False once the subscription
+        has been closed, e.g. because the client fell too far behind.
+        """
+        if self.closed_reason is not None:
+            return False
+
+        if self.queue.full():
+            if self.overflow == OVERFLOW_DISCONNECT:
+                self.close(CLOSED_SLOW_CONSUMER)
+                return False
+            self.queue.get_nowait()
+            self.dropped += 1
+
+        self.queue.put_nowait(message)
+        self.delivered += 1
+        return True
+
+    def close(self, reason: str) -> None:
+        if self.closed_reason is not None:
+            return
+        self.closed_reason = reason
+        # the buffer is discarded so the end marker is seen right away
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[str]:
+        """
+        Next message, None when the subscription is closed. Raises
+        asyncio.TimeoutError when nothing arrived within `timeout`.
+        """
+        if timeout is None:
+            return await self.queue.get()
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+class UpdateBroker:
+    """
+    One pattern subscription to every `device:updates:*` channel per process,
+    fanned out in memory to any number of streaming clients and callbacks.
+    """
+
+    def __init__(
+        self,
+        r: StoreLike,
+        buffer_size: int = STREAM_CLIENT_BUFFER,
+        overflow: str = STREAM_OVERFLOW_POLICY,
+        max_clients: int = STREAM_MAX_CLIENTS,
+    ):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy '{overflow}', expected one of {OVERFLOW_POLICIES}")
+
+        self._r = r
+        self._buffer_size = buffer_size
+        self._overflow = overflow
+        self._max_clients = max_clients
+        self._by_device: Dict[str, Set[Subscription]] = {}
+        self._wide: Set[Subscription] = set()
+        self._callbacks: List[UpdateCallback] = []
+        self._subscribe_callbacks: List[SubscribeCallback] = []
+        self._disconnect_callbacks: List[DisconnectCallback] = []
+        self._task: Optional[asyncio.Task] = None
+        self._ready = asyncio.Event()
+
+        self.received = 0
+        self.disconnected = 0
+
+    # ---------- lifecycle ----------
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run(), name="update-broker")
+        await self._ready.wait()
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+        for subscription in list(self._wide) + [s for subs in self._by_device.values() for s in subs]:
+            subscription.close(CLOSED_SHUTDOWN)
+        self._by_device.clear()
+        self._wide.clear()
+
+    async def _run(self) -> None:
+        while True:
+            pubsub = self._r.pubsub()
+            try:
+                await pubsub.psubscribe(UPDATES_PATTERN)
+                logger.info(f"Update broker subscribed to {UPDATES_PATTERN}")
+                for callback in self._subscribe_callbacks:
+                    callback()
+                self._ready.set()
+
+                while True:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message is not None and message["type"] == "pmessage":
+                        self.publish_local(message["channel"][len(_CHANNEL_PREFIX):], message["data"])
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Update broker subscription failed, resubscribing: {e}")
+                for callback in self._disconnect_callbacks:
+                    try:
+                        callback()
+                    except Exception as callback_error:
+                        logger.error(f"Disconnect callback failed: {callback_error}")
+                self._ready.set()
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+    # ---------- fan-out ----------
+
+    def publish_local(self, device_id: str, message: str) -> None:
+        self.received += 1
+
+        for callback in self._callbacks:
+            try:
+                callback(device_id, message)
+            except Exception as e:
+                logger.error(f"Update callback failed for {device_id}: {e}")
+
+        targets = list(self._by_device.get(device_id, ()))
+        targets.extend(s for s in self._wide if s.matches(device_id))
+        for subscription in targets:
+            if not subscription.offer(message):
+                self.disconnected += subscription.closed_reason == CLOSED_SLOW_CONSUMER
+                self.unsubscribe(subscription)
+
+    def add_callback(self, callback: UpdateCallback) -> None:
+        self._callbacks.append(callback)
+
+    def remove_callback(self, callback: UpdateCallback) -> None:
+        if callback in self._callbacks:
+            self._callbacks.remove(callback)
+
+    def add_subscribe_callback(self, callback: SubscribeCallback) -> None:
+        self._subscribe_callbacks.append(callback)
+
+    def remove_subscribe_callback(self, callback: SubscribeCallback) -> None:
+        if callback in self._subscribe_callbacks:
+            self._subscribe_callbacks.remove(callback)
+
+    def add_disconnect_callback(self, callback: DisconnectCallback) -> None:
+        self._disconnect_callbacks.append(callback)
+
+    def remove_disconnect_callback(self, callback: DisconnectCallback) -> None:
+        if callback in self._disconnect_callbacks:
+            self._disconnect_callbacks.remove(callback)
+
+    def subscribe(self, device_id: Optional[str] = None, pattern: Optional[str] = None) -> Subscription:
+        """
+        Subscribe to one device, to device ids matching a glob pattern, or to
+        every device when neither is given.
+        """
+        if self.clients >= self._max_clients:
+            raise BrokerFull(f"Too many streaming clients ({self._max_clients})")
+
+        subscription = Subscription(device_id, pattern, self._buffer_size, self._overflow)
+        if device_id is not None:
+            self._by_device.setdefault(device_id, set()).add(subscription)
+        else:
+            self._wide.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        if subscription.device_id is None:
+            self._wide.discard(subscription)
+            return
+
+        subscribers = self._by_device.get(subscription.device_id)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._by_device[subscription.device_id]
+
+    @property
+    def clients(self) -> int:
+        return len(self._wide) + sum(len(subs) for subs in self._by_device.values())
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "clients": self.clients,
+            "devices_watched": len(self._by_device),
+            "received": self.received,
+            "slow_consumers_disconnected": self.disconnected,
+        }
+
+
+def get_update_broker() -> Optional[UpdateBroker]:
+    return _broker
+
+
+async def start_update_broker(r: StoreLike, **settings) -> UpdateBroker:
+    global _broker
+    if _broker is None:
+        _broker = UpdateBroker(r, **settings)
+        await _broker.start()
+    return _broker
+
+
+async def stop_update_broker() -> None:
+    global _broker
+    if _broker is not None:
+        await _broker.stop()
+        _broker = None
+
+
+def update_broker_stats() -> Dict[str, int]:
+    if _broker is None:
+        return {"running": False}
+    return {"running": True, **_broker.stats()}
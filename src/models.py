@@ -1,4 +1,6 @@
-from pydantic import BaseModel
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel, Field, model_validator
 
 
 class DeviceBase(BaseModel):
@@ -15,4 +17,65 @@ class Device(DeviceBase):
 class ReturnObject(BaseModel):
     device_id: str
     status: str
-    message: str
\ No newline at end of file
+    message: str
+
+
+class HistoryEntry(BaseModel):
+    id: str
+    timestamp: int
+    changes: Dict[str, str]
+
+
+class BulkCommandItem(BaseModel):
+    device_id: str
+    command: Dict[str, Any]
+
+
+class DeviceSelector(BaseModel):
+    ids: Optional[List[str]] = None
+    type: Optional[str] = None
+    status: Optional[str] = None
+    online: Optional[bool] = None
+
+    @model_validator(mode="after")
+    def check_selector(self):
+        filters = (self.type, self.status, self.online)
+        if self.ids is not None and any(f is not None for f in filters):
+            raise ValueError("Select devices either by ids or by filters, not both")
+        if self.ids is None and all(f is None for f in filters):
+            raise ValueError("Selector must contain ids or at least one filter")
+        return self
+
+    def filters(self) -> Dict[str, str]:
+        values = {"type": self.type, "status": self.status, "online": self.online}
+        return {k: str(v).lower() if isinstance(v, bool) else v for k, v in values.items() if v is not None}
+
+
+class BulkCommandRequest(BaseModel):
+    commands: Optional[List[BulkCommandItem]] = None
+    command: Optional[Dict[str, Any]] = None
+    selector: Optional[DeviceSelector] = None
+
+    @model_validator(mode="after")
+    def check_mode(self):
+        if self.commands is not None:
+            if self.command is not None or self.selector is not None:
+                raise ValueError("Use either 'commands' or 'command' with 'selector', not both")
+        elif self.command is None or self.selector is None:
+            raise ValueError("Provide 'commands' or both 'command' and 'selector'")
+        return self
+
+
+class BulkCommandResult(BaseModel):
+    total: int = 0
+    applied: List[str] = Field(default_factory=list)
+    idempotent: List[str] = Field(default_factory=list)
+    not_found: List[str] = Field(default_factory=list)
+    invalid: List[str] = Field(default_factory=list)
+    failed: List[str] = Field(default_factory=list)
+
+
+class SimulationSettings(BaseModel):
+    target_rate: Optional[float] = Field(None, gt=0)
+    batch_size: Optional[int] = Field(None, gt=0)
+    seed: Optional[int] = None
@@ -0,0 +1,121 @@
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+from src.config import COMMAND_TRANSPORT, PROFILING_ENABLED
+from src.dependencies import get_store
+from src.models import SimulationSettings
+from src.services.device_store import DeviceStore
+from src.services.sharded_store import ShardedDeviceStore
+from src.services.simulation import start_simulation, stop_simulation, simulation_stats
+from src.infrastructure.command_workers import active_pool_stats
+from src.infrastructure.leader_lease import leadership_stats
+from src.infrastructure.pubsub_listener import pubsub_stats
+from src.infrastructure.stream_listener import stream_stats
+from src.infrastructure.redis_client import pool_stats
+from src.infrastructure.replica_router import replica_router_stats
+from src.infrastructure.update_broker import update_broker_stats
+from src.infrastructure.profiling import get_profile_buffer, profiling_stats
+from src.services.device_cache import device_cache_stats
+from src.services.write_coalescer import write_coalescer_stats
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["Admin"]
+)
+
+
+@router.get("/redis/pool")
+async def redis_pool_stats():
+    return pool_stats()
+
+
+@router.get("/redis/replicas")
+async def redis_replica_stats():
+    return replica_router_stats()
+
+
+@router.get("/shards")
+async def get_shard_stats(r: DeviceStore = Depends(get_store)):
+    if not isinstance(r, ShardedDeviceStore):
+        return {"sharded": False}
+    return await r.shard_stats()
+
+
+@router.get("/commands/listener")
+async def command_listener_stats():
+    stats = {"transport": COMMAND_TRANSPORT, **active_pool_stats()}
+    if COMMAND_TRANSPORT == "stream":
+        stats.update(stream_stats())
+    else:
+        stats.update(pubsub_stats())
+    return stats
+
+
+@router.get("/leader")
+async def get_leadership_stats():
+    return leadership_stats()
+
+
+@router.get("/stream")
+async def update_stream_stats():
+    return update_broker_stats()
+
+
+@router.get("/cache")
+async def get_device_cache_stats():
+    return device_cache_stats()
+
+
+@router.get("/coalescing")
+async def get_write_coalescing_stats():
+    return write_coalescer_stats()
+
+
+@router.get("/simulation")
+async def get_simulation():
+    return simulation_stats()
+
+
+def _require_leader() -> None:
+    # with several workers the simulation runs in the elected leader only
+    stats = leadership_stats()
+    if stats["coordinated"] and not stats["leader"]:
+        raise HTTPException(
+            status_code=409,
+            detail=f"The simulation is controlled by the leader worker; {stats['token']} is not the leader",
+        )
+
+
+@router.post("/simulation")
+async def run_simulation(settings: SimulationSettings, r: DeviceStore = Depends(get_store)):
+    _require_leader()
+    await start_simulation(r, **settings.model_dump(exclude_none=True))
+    return simulation_stats()
+
+
+@router.delete("/simulation")
+async def halt_simulation():
+    _require_leader()
+    await stop_simulation()
+    return simulation_stats()
+
+
+@router.get("/profiles")
+async def get_request_profiles(
+    limit: int = Query(20, ge=1, le=1000),
+    reason: Optional[str] = Query(None, description="Only 'slow' or 'sampled' captures"),
+):
+    """
+    Most recent request profiles, newest first.
+    """
+    return {
+        "enabled": PROFILING_ENABLED,
+        **profiling_stats(),
+        "captures": get_profile_buffer().captures(limit=limit, reason=reason),
+    }
+
+
+@router.delete("/profiles")
+async def clear_request_profiles():
+    get_profile_buffer().clear()
+    return {"enabled": PROFILING_ENABLED, **profiling_stats()}
@@ -1,9 +1,27 @@
-from typing import List
-from fastapi import APIRouter, Depends
-import redis.asyncio as redis
-from src.dependencies import get_redis
-from src.models import Device, ReturnObject
-from src.services.device_service import list_devices, fetch_device, apply_command
+from typing import List, Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from src.config import MAX_PAGE_SIZE, HISTORY_PAGE_SIZE, JSON_CHUNK_SIZE
+from src.dependencies import get_read_store, get_store
+from src.models import Device, ReturnObject, BulkCommandRequest, BulkCommandResult, HistoryEntry
+from src.services.device_service import (
+    list_devices,
+    stream_devices,
+    fetch_device,
+    fetch_device_history,
+    apply_command,
+    apply_bulk_commands,
+)
+from src.services.device_store import DeviceStore
+from src.serialization import (
+    NDJSON_MEDIA_TYPE,
+    FastJSONResponse,
+    aiter_json_array,
+    aiter_ndjson,
+    iter_json_array,
+    iter_ndjson,
+    wants_ndjson,
+)
 
 router = APIRouter(
     prefix="/devices",
@@ -16,16 +34,82 @@ async def basic_status_check():
 
 
 @router.get("/", response_model=List[Device])
-async def get_devices(r: redis.Redis = Depends(get_redis)):
-    return await list_devices(r)
+async def get_devices(
+    request: Request,
+    device_type: Optional[str] = Query(None, alias="type", description="Only devices of this type"),
+    status: Optional[str] = Query(None, description="Only devices with this status"),
+    online: Optional[bool] = Query(None, description="Only online / offline devices"),
+    fields: Optional[str] = Query(None, description="Comma separated list of fields to return, e.g. id,status"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Page size"),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from the X-Next-Cursor header"),
+    stream: bool = Query(False, description="Stream the result batch by batch (no X-Next-Cursor)"),
+    r: DeviceStore = Depends(get_read_store),
+):
+    filters = {"type": device_type, "status": status, "online": online}
+    filters = {k: str(v).lower() if isinstance(v, bool) else v for k, v in filters.items() if v is not None}
+
+    requested_fields = _parse_fields(fields)
+
+    if stream:
+        # one registry batch in memory at a time; a client disconnect stops the generator
+        batches = stream_devices(r, filters=filters, fields=requested_fields, limit=limit, cursor=cursor)
+        if wants_ndjson(request.headers.get("accept")):
+            return StreamingResponse(aiter_ndjson(batches), media_type=NDJSON_MEDIA_TYPE)
+        return StreamingResponse(aiter_json_array(batches), media_type="application/json")
+
+    devices, next_cursor = await list_devices(
+        r,
+        filters=filters,
+        fields=requested_fields,
+        limit=limit,
+        cursor=cursor,
+    )
+
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+
+    # devices are validated once in the service; responses are serialized
+    # directly, response_model only documents the endpoint
+    if wants_ndjson(request.headers.get("accept")):
+        return StreamingResponse(iter_ndjson(devices), media_type=NDJSON_MEDIA_TYPE, headers=headers)
+    if len(devices) > JSON_CHUNK_SIZE:
+        return StreamingResponse(iter_json_array(devices), media_type="application/json", headers=headers)
+    return FastJSONResponse(devices, headers=headers)
+
+
+def _parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    if not fields:
+        return None
+
+    requested = list(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    unknown = set(requested) - set(Device.model_fields)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    return requested or None
+
+
+@router.post("/commands", response_model=BulkCommandResult)
+async def send_bulk_commands(request: BulkCommandRequest, r: DeviceStore = Depends(get_store)):
+    return await apply_bulk_commands(r, request)
 
 
 @router.get("/{device_id}", response_model=Device)
-async def get_device(device_id: str, r: redis.Redis = Depends(get_redis)):
-    return await fetch_device(r, device_id)
+async def get_device(device_id: str, r: DeviceStore = Depends(get_read_store)):
+    return FastJSONResponse(await fetch_device(r, device_id))
+
+
+@router.get("/{device_id}/history", response_model=List[HistoryEntry])
+async def get_device_history(
+    device_id: str,
+    since: Optional[int] = Query(None, ge=0, description="Oldest entry to return, epoch milliseconds"),
+    until: Optional[int] = Query(None, ge=0, description="Newest entry to return, epoch milliseconds"),
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    order: Literal["asc", "desc"] = Query("desc"),
+    r: DeviceStore = Depends(get_store),
+):
+    entries = await fetch_device_history(r, device_id, since=since, until=until, limit=limit, order=order)
+    return FastJSONResponse(entries)
 
 
 @router.post("/{device_id}/command", response_model=ReturnObject)
-async def send_command(device_id: str, command: dict, r: redis.Redis = Depends(get_redis)):
+async def send_command(device_id: str, command: dict, r: DeviceStore = Depends(get_store)):
     return await apply_command(r, device_id, command)
-from typing import List
@@ -0,0 +1,36 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from src.infrastructure import metrics
+from src.infrastructure.command_workers import active_pool_stats
+from src.infrastructure.leader_lease import leadership_stats
+from src.infrastructure.pubsub_listener import pubsub_stats
+from src.infrastructure.redis_client import pool_stats
+from src.infrastructure.replica_router import replica_router_stats
+from src.infrastructure.stream_listener import stream_stats
+from src.infrastructure.update_broker import update_broker_stats
+from src.services.device_cache import device_cache_stats
+from src.services.simulation import simulation_stats
+from src.services.write_coalescer import write_coalescer_stats
+
+router = APIRouter(tags=["Metrics"])
+
+# point-in-time values are read from the existing stats functions on every scrape
+metrics.register_collector(metrics.stats_collector("redis_pool", pool_stats, "Shared Redis connection pool"))
+metrics.register_collector(metrics.stats_collector("redis_replicas", replica_router_stats, "Reads routed to Redis replicas"))
+metrics.register_collector(metrics.stats_collector("command_listener", active_pool_stats, "Command listener worker pool"))
+metrics.register_collector(metrics.stats_collector("command_pubsub", pubsub_stats, "Command Pub/Sub listener"))
+metrics.register_collector(metrics.stats_collector("command_stream", stream_stats, "Command stream consumer"))
+metrics.register_collector(metrics.stats_collector("leader", leadership_stats, "Leader election for once-per-deployment work"))
+metrics.register_collector(metrics.stats_collector("update_broker", update_broker_stats, "Device update broker"))
+metrics.register_collector(metrics.stats_collector("device_cache", device_cache_stats, "In-process device cache"))
+metrics.register_collector(metrics.stats_collector("simulation", simulation_stats, "Telemetry simulation"))
+metrics.register_collector(metrics.stats_collector("write_coalescer", write_coalescer_stats, "Write coalescing"))
+
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """
+    Prometheus text exposition of request, Redis and listener metrics.
+    """
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
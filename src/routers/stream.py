@@ -0,0 +1,115 @@
+import asyncio
+import json
+from typing import AsyncIterator, Optional
+import anyio
+from fastapi import APIRouter, HTTPException, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from src.config import STREAM_ENABLED, STREAM_HEARTBEAT_SECONDS
+from src.infrastructure.update_broker import (
+    BrokerFull,
+    CLOSED_SHUTDOWN,
+    Subscription,
+    UpdateBroker,
+    get_update_broker,
+)
+
+router = APIRouter(
+    prefix="/stream",
+    tags=["Streaming"]
+)
+
+# WebSocket close codes
+WS_GOING_AWAY = 1001
+WS_TRY_AGAIN_LATER = 1013
+
+
+def _subscribe(broker: Optional[UpdateBroker], device_id: Optional[str], pattern: Optional[str]) -> Subscription:
+    # the broker may also run for the device cache alone
+    if broker is None or not STREAM_ENABLED:
+        raise HTTPException(status_code=503, detail="Update streaming is disabled")
+    try:
+        return broker.subscribe(device_id=device_id, pattern=pattern)
+    except BrokerFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+async def sse_events(
+    broker: UpdateBroker,
+    subscription: Subscription,
+    heartbeat: float = STREAM_HEARTBEAT_SECONDS,
+) -> AsyncIterator[str]:
+    try:
+        yield ": connected\n\n"
+        while True:
+            try:
+                message = await subscription.get(timeout=heartbeat)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+
+            if message is None:
+                yield f"event: close\ndata: {json.dumps({'reason': subscription.closed_reason})}\n\n"
+                return
+            yield f"event: device_update\ndata: {message}\n\n"
+    finally:
+        broker.unsubscribe(subscription)
+
+
+@router.get("/events")
+async def stream_events(
+    device_id: Optional[str] = Query(None, description="Only updates of this device"),
+    pattern: Optional[str] = Query(None, description="Only devices whose id matches this glob, e.g. device-1*"),
+):
+    """
+    Server-Sent Events stream of device updates: one device, a pattern of
+    device ids, or the whole fleet when no filter is given.
+    """
+    broker = get_update_broker()
+    subscription = _subscribe(broker, device_id, pattern)
+
+    return StreamingResponse(
+        sse_events(broker, subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.websocket("/ws")
+async def stream_websocket(
+    websocket: WebSocket,
+    device_id: Optional[str] = None,
+    pattern: Optional[str] = None,
+):
+    broker = get_update_broker()
+    try:
+        subscription = _subscribe(broker, device_id, pattern)
+    except HTTPException as e:
+        await websocket.close(code=WS_TRY_AGAIN_LATER, reason=e.detail)
+        return
+
+    await websocket.accept()
+
+    async def forward(cancel_scope: anyio.CancelScope) -> None:
+        while True:
+            message = await subscription.get()
+            if message is None:
+                code = WS_GOING_AWAY if subscription.closed_reason == CLOSED_SHUTDOWN else WS_TRY_AGAIN_LATER
+                await websocket.close(code=code, reason=subscription.closed_reason)
+                break
+            await websocket.send_text(message)
+        cancel_scope.cancel()
+
+    async def wait_for_disconnect(cancel_scope: anyio.CancelScope) -> None:
+        try:
+            while True:
+                await websocket.receive_text()
+        except WebSocketDisconnect:
+            pass
+        cancel_scope.cancel()
+
+    try:
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(forward, tg.cancel_scope)
+            tg.start_soon(wait_for_disconnect, tg.cancel_scope)
+    finally:
+        broker.unsubscribe(subscription)
@@ -0,0 +1,58 @@
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+import redis.asyncio as aioredis
+from src.config import DB_HOST, DB_PORT, REDIS_DB, REGISTRY_BATCH_SIZE
+from src.infrastructure.redis_client import build_shard_clients
+from src.services.device_snapshot import ProgressReporter, export_devices
+from src.services.sharded_store import ShardedDeviceStore
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export all devices as NDJSON, one device per line.")
+    parser.add_argument("path", nargs="?", type=Path, default=None, help="output file (stdout if omitted)")
+    parser.add_argument("--batch-size", type=int, default=REGISTRY_BATCH_SIZE, help="devices per pipeline")
+    return parser.parse_args()
+
+
+def print_progress(count: int, rate: float):
+    print(f"  {count} devices exported ({rate:,.0f}/s)", file=sys.stderr)
+
+
+async def export_database(path=None, batch_size: int = REGISTRY_BATCH_SIZE):
+    r = aioredis.Redis(
+        host=DB_HOST,
+        port=DB_PORT,
+        db=REDIS_DB,
+        decode_responses=True,
+    )
+    # with REDIS_SHARDS the export walks every shard in id order
+    shards = build_shard_clients()
+    store = ShardedDeviceStore(shards, r) if shards else r
+
+    try:
+        await r.ping()
+        print(f"Connected to Redis at {DB_HOST}:{DB_PORT}, db={REDIS_DB}", file=sys.stderr)
+        if shards:
+            print(f"Reading devices from shards {', '.join(shards)}", file=sys.stderr)
+
+        progress = ProgressReporter(print_progress)
+        if path is None:
+            exported = await export_devices(store, sys.stdout, batch_size, progress)
+        else:
+            with open(path, "w", encoding="utf-8") as out:
+                exported = await export_devices(store, out, batch_size, progress)
+
+        print("-" * 40, file=sys.stderr)
+        print(f"Exported {exported} devices ({progress.rate:,.0f}/s)", file=sys.stderr)
+
+    finally:
+        if shards:
+            await store.close()
+        await r.aclose()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    asyncio.run(export_database(args.path, args.batch_size))
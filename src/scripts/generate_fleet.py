@@ -0,0 +1,85 @@
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+import redis.asyncio as aioredis
+from src.config import DB_HOST, DB_PORT, REDIS_DB, SEED_CHUNK_SIZE
+from src.infrastructure.redis_client import build_shard_clients
+from src.services.device_snapshot import ProgressReporter, clear_devices
+from src.services.fleet_generator import DEFAULT_ONLINE_RATIO, write_fleet, write_fleet_ndjson
+from src.services.sharded_store import ShardedDeviceStore
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate a deterministic synthetic device fleet.")
+    parser.add_argument("size", type=int, help="number of devices")
+    parser.add_argument("--seed", type=int, default=0, help="random seed (same seed, same fleet)")
+    parser.add_argument("--online-ratio", type=float, default=DEFAULT_ONLINE_RATIO, help="share of online devices")
+    parser.add_argument("--output", type=Path, default=None, help="write NDJSON here instead of Redis ('-' for stdout)")
+    parser.add_argument("--chunk-size", type=int, default=SEED_CHUNK_SIZE, help="devices per pipeline")
+    parser.add_argument("--no-clean", action="store_true", help="keep existing devices")
+    return parser.parse_args()
+
+
+def print_progress(count: int, rate: float):
+    print(f"  {count} devices generated ({rate:,.0f}/s)", file=sys.stderr)
+
+
+async def generate_into_redis(args):
+    r = aioredis.Redis(
+        host=DB_HOST,
+        port=DB_PORT,
+        db=REDIS_DB,
+        decode_responses=True,
+    )
+    # with REDIS_SHARDS every device goes to its shard
+    shards = build_shard_clients()
+    store = ShardedDeviceStore(shards, r) if shards else r
+
+    try:
+        await r.ping()
+        print(f"Connected to Redis at {DB_HOST}:{DB_PORT}, db={REDIS_DB}", file=sys.stderr)
+        if shards:
+            print(f"Sharding devices over {', '.join(shards)}", file=sys.stderr)
+
+        if not args.no_clean:
+            deleted = 0
+            for target in list(shards.values()) or [r]:
+                deleted += await clear_devices(target, args.chunk_size)
+            print(f"Cleared {deleted} Redis keys", file=sys.stderr)
+
+        progress = ProgressReporter(print_progress)
+        written = await write_fleet(
+            store,
+            args.size,
+            args.seed,
+            chunk_size=args.chunk_size,
+            progress=progress,
+            online_ratio=args.online_ratio,
+        )
+
+        print("-" * 40, file=sys.stderr)
+        print(f"Generated {written} devices ({progress.rate:,.0f}/s)", file=sys.stderr)
+
+    finally:
+        if shards:
+            await store.close()
+        await r.aclose()
+
+
+def main():
+    args = parse_args()
+    if args.output is None:
+        asyncio.run(generate_into_redis(args))
+        return
+
+    if str(args.output) == "-":
+        written = write_fleet_ndjson(sys.stdout, args.size, args.seed, online_ratio=args.online_ratio)
+    else:
+        with open(args.output, "w", encoding="utf-8") as out:
+            written = write_fleet_ndjson(out, args.size, args.seed, online_ratio=args.online_ratio)
+    print(f"Wrote {written} devices", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+import argparse
+import asyncio
+import json
+import logging
+import math
+import random
+import socket
+import sys
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+import redis.asyncio as aioredis
+import uvicorn
+from asgi_lifespan import LifespanManager
+
+from src.config import DB_HOST, DB_PORT, REDIS_DB
+from src.services.device_snapshot import clear_devices
+from src.services.fleet_generator import DEFAULT_STATUS_WEIGHTS, generate_fleet, write_fleet
+
+DEFAULT_MIX: Dict[str, float] = {"list": 50, "get": 35, "command": 10, "bulk": 5}
+PERCENTILES = {"p50": 0.5, "p95": 0.95, "p99": 0.99, "p999": 0.999}
+BULK_SIZE = 20
+LIST_LIMIT = 100
+
+# upper bounds in ms of the latency histogram buckets, roughly log spaced
+HISTOGRAM_BOUNDS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, math.inf)
+
+
+class LatencyRecorder:
+    def __init__(self):
+        self.samples: List[float] = []
+        self.errors = 0
+
+    def record(self, seconds: float, ok: bool) -> None:
+        self.samples.append(seconds)
+        if not ok:
+            self.errors += 1
+
+    def summary(self, elapsed: float) -> Dict[str, Any]:
+        samples = sorted(self.samples)
+        count = len(samples)
+        result: Dict[str, Any] = {
+            "count": count,
+            "errors": self.errors,
+            "rps": count / elapsed if elapsed > 0 else 0.0,
+        }
+        if not count:
+            return result
+
+        for name, p in PERCENTILES.items():
+            # nearest-rank percentile
+            rank = max(math.ceil(p * count) - 1, 0)
+            result[f"{name}_ms"] = samples[rank] * 1000
+        result["mean_ms"] = sum(samples) / count * 1000
+        result["max_ms"] = samples[-1] * 1000
+
+        histogram = {}
+        index = 0
+        for bound in HISTOGRAM_BOUNDS_MS:
+            start = index
+            while index < count and samples[index] * 1000 <= bound:
+                index += 1
+            histogram["+Inf" if bound == math.inf else str(bound)] = index - start
+        result["histogram_ms"] = histogram
+        return result
+
+
+def _build_request(operation: str, device_ids: List[str], rng: random.Random) -> Dict[str, Any]:
+    if operation == "list":
+        params: Dict[str, Any] = {"limit": LIST_LIMIT}
+        if rng.random() < 0.5:
+            params["type"] = rng.choice(list(DEFAULT_STATUS_WEIGHTS))
+        return {"method": "GET", "url": "/devices/", "params": params}
+
+    if operation == "get":
+        return {"method": "GET", "url": f"/devices/{rng.choice(device_ids)}"}
+
+    if operation == "command":
+        status = rng.choice(["active", "idle", "on", "off"])
+        return {"method": "POST", "url": f"/devices/{rng.choice(device_ids)}/command", "json": {"status": status}}
+
+    if operation == "bulk":
+        ids = rng.sample(device_ids, min(BULK_SIZE, len(device_ids)))
+        status = rng.choice(["active", "idle"])
+        return {"method": "POST", "url": "/devices/commands", "json": {
+            "commands": [{"device_id": device_id, "command": {"status": status}} for device_id in ids],
+        }}
+
+    raise ValueError(f"Unknown operation: {operation}")
+
+
+async def run_load(
+    client: httpx.AsyncClient,
+    device_ids: List[str],
+    concurrency: int = 32,
+    requests: Optional[int] = None,
+    duration: Optional[float] = 10.0,
+    mix: Optional[Dict[str, float]] = None,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    """
+    Drive the API with `concurrency` async clients until `requests` have been
+    sent or `duration` seconds have passed, and return per-operation and
+    overall throughput and latency percentiles.
+    """
+    mix = mix or DEFAULT_MIX
+    operations, weights = zip(*mix.items())
+    recorders = {operation: LatencyRecorder() for operation in operations}
+    total = LatencyRecorder()
+    remaining = [requests] if requests is not None else None
+
+    started = time.perf_counter()
+    deadline = started + duration if duration else None
+
+    async def worker(worker_id: int) -> None:
+        rng = random.Random(seed * 1000 + worker_id)
+        while True:
+            if remaining is not None:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            if deadline is not None and time.perf_counter() >= deadline:
+                return
+
+            operation = rng.choices(operations, weights=weights)[0]
+            request = _build_request(operation, device_ids, rng)
+            sent = time.perf_counter()
+            try:
+                response = await client.request(**request)
+                # 404 on a get is not expected with a seeded fleet; count it as an error
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            latency = time.perf_counter() - sent
+
+            recorders[operation].record(latency, ok)
+            total.record(latency, ok)
+
+    async with asyncio.TaskGroup() as tg:
+        for worker_id in range(concurrency):
+            tg.create_task(worker(worker_id))
+
+    elapsed = time.perf_counter() - started
+    return {
+        "concurrency": concurrency,
+        "duration_s": elapsed,
+        "mix": dict(mix),
+        "overall": total.summary(elapsed),
+        "operations": {operation: recorder.summary(elapsed) for operation, recorder in recorders.items()},
+    }
+
+
+def compare_to_baseline(
+    results: Dict[str, Any],
+    baseline: Dict[str, Any],
+    tolerance: float = 0.2,
+) -> List[str]:
+    """
+    Return a description of every regression beyond `tolerance`: throughput
+    falling or p99 latency rising by more than that share of the baseline.
+    """
+    regressions = []
+    sections = {"overall": (results.get("overall", {}), baseline.get("overall", {}))}
+    for operation, current in results.get("operations", {}).items():
+        if operation in baseline.get("operations", {}):
+            sections[operation] = (current, baseline["operations"][operation])
+
+    for name, (current, previous) in sections.items():
+        if previous.get("rps") and current.get("rps", 0) < previous["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: rps {current.get('rps', 0):.1f} < baseline {previous['rps']:.1f}")
+        if previous.get("p99_ms") and current.get("p99_ms", math.inf) > previous["p99_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p99 {current.get('p99_ms', math.inf):.2f}ms > baseline {previous['p99_ms']:.2f}ms")
+    return regressions
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@asynccontextmanager
+async def open_client(target: str = "asgi", url: Optional[str] = None) -> AsyncIterator[httpx.AsyncClient]:
+    """
+    `asgi`: the app in-process through ASGITransport, lifespan included.
+    `uvicorn`: the app served by a local uvicorn on a free port.
+    `url`: an already running server.
+    """
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+
+    if target == "url":
+        async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30) as client:
+            yield client
+        return
+
+    from src.app import app
+
+    if target == "asgi":
+        async with LifespanManager(app) as manager:
+            transport = httpx.ASGITransport(app=manager.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=30) as client:
+                yield client
+        return
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    serve = asyncio.create_task(server.serve())
+    try:
+        while not server.started:
+            if serve.done():
+                serve.result()
+            await asyncio.sleep(0.05)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=30) as client:
+            yield client
+    finally:
+        server.should_exit = True
+        await serve
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    mix = {}
+    for part in value.split(","):
+        operation, _, weight = part.partition("=")
+        mix[operation.strip()] = float(weight)
+    return mix
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Concurrent load test against the device API.")
+    parser.add_argument("--target", choices=("asgi", "uvicorn", "url"), default="asgi")
+    parser.add_argument("--url", default="http://localhost:8008", help="base url for --target url")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to run")
+    parser.add_argument("--requests", type=int, default=None, help="stop after this many requests")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX, help="e.g. list=50,get=35,command=10,bulk=5")
+    parser.add_argument("--fleet-size", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--no-seed", action="store_true", help="use the fleet already in Redis")
+    parser.add_argument("--output", type=Path, default=None, help="write JSON results here")
+    parser.add_argument("--baseline", type=Path, default=None, help="fail on regressions against this JSON")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression share")
+    return parser.parse_args()
+
+
+async def main(args) -> int:
+    # per-request access logs would dominate the measurement
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    device_ids = [device["id"] for device in generate_fleet(args.fleet_size, args.seed)]
+
+    if not args.no_seed:
+        r = aioredis.Redis(host=DB_HOST, port=DB_PORT, db=REDIS_DB, decode_responses=True)
+        try:
+            await clear_devices(r)
+            await write_fleet(r, args.fleet_size, args.seed)
+        finally:
+            await r.aclose()
+        print(f"Seeded {args.fleet_size} devices", file=sys.stderr)
+
+    async with open_client(args.target, args.url) as client:
+        results = await run_load(
+            client,
+            device_ids,
+            concurrency=args.concurrency,
+            requests=args.requests,
+            duration=None if args.requests else args.duration,
+            mix=args.mix,
+            seed=args.seed,
+        )
+    results["target"] = args.target
+    results["fleet_size"] = args.fleet_size
+
+    print(json.dumps({"overall": results["overall"], "operations": results["operations"]}, indent=2))
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+
+    if args.baseline:
+        regressions = compare_to_baseline(results, json.loads(args.baseline.read_text()), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
@@ -0,0 +1,41 @@
+import asyncio
+import redis.asyncio as aioredis
+from src.config import DB_HOST, DB_PORT, REDIS_DB
+from src.infrastructure.redis_client import build_shard_clients
+from src.services.device_registry import rebuild_registry
+
+
+async def repair_registry():
+    r = aioredis.Redis(
+        host=DB_HOST,
+        port=DB_PORT,
+        db=REDIS_DB,
+        decode_responses=True,
+    )
+    # with REDIS_SHARDS every shard keeps its own registry and indexes
+    shards = build_shard_clients()
+    targets = shards or {f"{DB_HOST}:{DB_PORT}/{REDIS_DB}": r}
+
+    try:
+        for name, target in targets.items():
+            await target.ping()
+            print(f"Connected to Redis at {name}")
+
+            result = await rebuild_registry(target)
+
+            print("-" * 40)
+            print(
+                f"Registry of {name} contains {result['devices']} devices "
+                f"({result['added']} added, {result['removed']} stale removed, "
+                f"{result['pruned']} stale index entries removed, "
+                f"{result['migrated']} list histories migrated)"
+            )
+
+    finally:
+        for target in shards.values():
+            await target.aclose()
+        await r.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(repair_registry())
@@ -1,74 +1,82 @@
+import argparse
 import asyncio
-import json
 import os
+import time
 from pathlib import Path
 import redis.asyncio as aioredis
-from src.config import DB_HOST, DB_PORT, REDIS_DB
-
-
-DATA_PATH = Path(__file__).resolve().parents[1] / "tests" / "test_devices.json"
+from src.config import DB_HOST, DB_PORT, REDIS_DB, SEED_CHUNK_SIZE
+from src.infrastructure.redis_client import build_shard_clients
+from src.services.device_snapshot import (
+    ProgressReporter,
+    clear_devices,
+    import_devices,
+    iter_device_records,
+)
+from src.services.sharded_store import ShardedDeviceStore
+
+
+DATA_PATH = Path(os.getenv("SEED_DATA_PATH", Path(__file__).resolve().parents[1] / "test_devices.json"))
 NO_CLEAN = os.getenv("SEED_NO_CLEAN", "false").lower() in ("true", "1", "t")
 
 
-async def clear_devices(r):
-    deleted = 0
+def parse_args():
+    parser = argparse.ArgumentParser(description="Seed Redis with devices from a JSON array or NDJSON file.")
+    parser.add_argument("path", nargs="?", type=Path, default=DATA_PATH, help="devices file (.json or .ndjson)")
+    parser.add_argument("--format", choices=("json", "ndjson"), default=None, help="input format (auto-detected)")
+    parser.add_argument("--chunk-size", type=int, default=SEED_CHUNK_SIZE, help="devices per pipeline")
+    parser.add_argument("--no-clean", action="store_true", default=NO_CLEAN, help="keep existing devices")
+    return parser.parse_args()
 
-    async for key in r.scan_iter(match="device:*"):
-        await r.delete(key)
-        deleted += 1
 
-    async for key in r.scan_iter(match="device:history:*"):
-        await r.delete(key)
-        deleted += 1
+def print_progress(count: int, rate: float):
+    print(f"  {count} devices saved ({rate:,.0f}/s)")
 
-    print(f"Cleared {deleted} Redis keys")
 
-
-async def seed_database():
+async def seed_database(path: Path, file_format=None, chunk_size: int = SEED_CHUNK_SIZE, no_clean: bool = NO_CLEAN):
     r = aioredis.Redis(
         host=DB_HOST,
         port=DB_PORT,
         db=REDIS_DB,
         decode_responses=True,
     )
+    # with REDIS_SHARDS every device goes to its shard
+    shards = build_shard_clients()
+    store = ShardedDeviceStore(shards, r) if shards else r
 
     try:
         await r.ping()
         print(f"Connected to Redis at {DB_HOST}:{DB_PORT}, db={REDIS_DB}")
-        print(f"Loading devices from: {DATA_PATH}")
-
-        if not NO_CLEAN:
-            await clear_devices(r)
+        if shards:
+            print(f"Sharding devices over {', '.join(shards)}")
+        print(f"Loading devices from: {path}")
+
+        if not no_clean:
+            started = time.monotonic()
+            deleted = 0
+            for target in list(shards.values()) or [r]:
+                deleted += await clear_devices(target, chunk_size)
+            print(f"Cleared {deleted} Redis keys in {time.monotonic() - started:.2f}s")
         else:
             print("SEED_NO_CLEAN=true , skipping Redis cleanup")
 
-        with open(DATA_PATH, "r", encoding="utf-8") as f:
-            devices = json.load(f)
-
-        saved_count = 0
-
-        for device in devices:
-            device_id = device.get("id")
-            if not device_id:
-                continue
-
-            key = f"device:{device_id}"
-            data = {
-                k: str(v).lower() if isinstance(v, bool) else str(v)
-                for k, v in device.items()
-                if k != "id"
-            }
-
-            await r.hset(key, mapping=data)
-            print(f"Seeded {key}")
-            saved_count += 1
+        progress = ProgressReporter(print_progress)
+        saved_count = await import_devices(
+            store,
+            iter_device_records(path, file_format),
+            chunk_size=chunk_size,
+            replace_existing=no_clean,
+            progress=progress,
+        )
 
         print("-" * 40)
-        print(f"Successfully seeded {saved_count} devices")
+        print(f"Successfully seeded {saved_count} devices ({progress.rate:,.0f}/s)")
 
     finally:
+        if shards:
+            await store.close()
         await r.aclose()
 
 
 if __name__ == "__main__":
-    asyncio.run(seed_database())
+    args = parse_args()
+    asyncio.run(seed_database(args.path, args.format, args.chunk_size, args.no_clean))
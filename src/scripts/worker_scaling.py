@@ -0,0 +1,156 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+import redis.asyncio as aioredis
+
+from src.config import DB_HOST, DB_PORT, REDIS_DB
+from src.scripts.load_test import DEFAULT_MIX, _free_port, parse_mix, run_load
+from src.services.device_snapshot import clear_devices
+from src.services.fleet_generator import generate_fleet, write_fleet
+
+
+def start_server(workers: int, port: int, env: Optional[Dict[str, str]] = None) -> subprocess.Popen:
+    command = [
+        sys.executable, "-m", "uvicorn", "src.app:app",
+        "--host", "127.0.0.1", "--port", str(port),
+        "--workers", str(workers), "--log-level", "warning", "--no-access-log",
+    ]
+    return subprocess.Popen(command, env={**os.environ, **(env or {})})
+
+
+def wait_until_ready(url: str, server: subprocess.Popen, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with status {server.returncode}")
+        try:
+            if httpx.get(f"{url}/devices/status", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError(f"Server at {url} did not become ready within {timeout}s")
+
+
+def stop_server(server: subprocess.Popen) -> None:
+    server.terminate()
+    try:
+        server.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+
+def _client_process(url: str, device_ids: List[str], concurrency: int, duration: float,
+                    mix: Dict[str, float], seed: int) -> Dict[str, Any]:
+    async def run() -> Dict[str, Any]:
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+        async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30) as client:
+            return await run_load(client, device_ids, concurrency=concurrency, duration=duration, mix=mix, seed=seed)
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    return asyncio.run(run())
+
+
+def measure(
+    workers: int,
+    device_ids: List[str],
+    clients: int = 4,
+    concurrency: int = 64,
+    duration: float = 10.0,
+    mix: Optional[Dict[str, float]] = None,
+    env: Optional[Dict[str, str]] = None,
+) -> Dict[str, Any]:
+    """
+    Serve the app with `workers` uvicorn workers and drive it from `clients`
+    load generator processes, so the client side is not the bottleneck.
+    """
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}"
+    server = start_server(workers, port, env)
+    try:
+        wait_until_ready(url, server)
+        per_client = max(concurrency // clients, 1)
+        with ProcessPoolExecutor(clients) as pool:
+            runs = list(pool.map(
+                _client_process,
+                [url] * clients, [device_ids] * clients, [per_client] * clients,
+                [duration] * clients, [mix or DEFAULT_MIX] * clients, range(clients),
+            ))
+    finally:
+        stop_server(server)
+
+    count = sum(run["overall"]["count"] for run in runs)
+    return {
+        "workers": workers,
+        "requests": count,
+        "errors": sum(run["overall"]["errors"] for run in runs),
+        "rps": sum(run["overall"]["rps"] for run in runs),
+        # the slowest client's percentile, a conservative merge
+        "p99_ms": max(run["overall"].get("p99_ms", 0.0) for run in runs),
+    }
+
+
+def scaling_table(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Add speedup and efficiency (speedup per worker) relative to the
+    smallest worker count.
+    """
+    base = results[0]
+    for result in results:
+        result["speedup"] = result["rps"] / base["rps"] if base["rps"] else 0.0
+        result["efficiency"] = result["speedup"] * base["workers"] / result["workers"]
+    return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Measure API throughput against the number of uvicorn workers.")
+    parser.add_argument("--workers", default="1,2,4", help="comma separated worker counts")
+    parser.add_argument("--clients", type=int, default=4, help="load generator processes")
+    parser.add_argument("--concurrency", type=int, default=64, help="concurrent requests over all clients")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per worker count")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX, help="e.g. list=50,get=35,command=10,bulk=5")
+    parser.add_argument("--fleet-size", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=Path, default=None, help="write JSON results here")
+    return parser.parse_args()
+
+
+async def seed_fleet(size: int, seed: int) -> None:
+    r = aioredis.Redis(host=DB_HOST, port=DB_PORT, db=REDIS_DB, decode_responses=True)
+    try:
+        await clear_devices(r)
+        await write_fleet(r, size, seed)
+    finally:
+        await r.aclose()
+
+
+def main(args) -> int:
+    asyncio.run(seed_fleet(args.fleet_size, args.seed))
+    device_ids = [device["id"] for device in generate_fleet(args.fleet_size, args.seed)]
+
+    results = []
+    for workers in (int(count) for count in args.workers.split(",")):
+        result = measure(workers, device_ids, args.clients, args.concurrency, args.duration, args.mix)
+        print(f"{workers} workers: {result['rps']:.0f} req/s, p99 {result['p99_ms']:.1f} ms", file=sys.stderr)
+        results.append(result)
+
+    results = scaling_table(results)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args()))
@@ -0,0 +1,111 @@
+import json
+from typing import Any, AsyncIterator, Iterable, Iterator, List, Sequence
+
+from fastapi import Response
+from pydantic import BaseModel, TypeAdapter
+
+from src.config import JSON_CHUNK_SIZE
+from src.infrastructure.profiling import STAGE_SERIALIZATION, timed
+
+try:
+    import orjson
+except ImportError:  # optional speed-up, the stdlib encoder produces the same JSON
+    orjson = None
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+_list_adapters = {}
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def _list_adapter(model: type) -> TypeAdapter:
+    adapter = _list_adapters.get(model)
+    if adapter is None:
+        adapter = _list_adapters[model] = TypeAdapter(List[model])
+    return adapter
+
+
+def encode(content: Any) -> bytes:
+    """
+    Serialize already validated models (or lists of them) or plain JSON data
+    without another validation pass.
+    """
+    with timed(STAGE_SERIALIZATION):
+        if isinstance(content, BaseModel):
+            return content.__pydantic_serializer__.to_json(content)
+        if isinstance(content, list) and content and isinstance(content[0], BaseModel):
+            return _list_adapter(type(content[0])).dump_json(content)
+        return dumps(content)
+
+
+class FastJSONResponse(Response):
+    """
+    JSON response for content the service layer has already validated.
+    Returning it from a route skips FastAPI's response_model re-validation,
+    while the declared response_model still documents the endpoint.
+    """
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return encode(content)
+
+
+def iter_json_array(items: Sequence[Any], chunk_size: int = JSON_CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Encode a list as a JSON array in chunks of `chunk_size` items, so a large
+    response is never held as one buffer.
+    """
+    yield b"["
+    for start in range(0, len(items), chunk_size):
+        chunk = encode(list(items[start:start + chunk_size]))
+        # drop the brackets of the chunk's own array
+        yield (b"," if start else b"") + chunk[1:-1]
+    yield b"]"
+
+
+def iter_ndjson(items: Iterable[Any], chunk_size: int = JSON_CHUNK_SIZE) -> Iterator[bytes]:
+    lines: List[bytes] = []
+    for item in items:
+        lines.append(encode(item))
+        if len(lines) >= chunk_size:
+            yield b"\n".join(lines) + b"\n"
+            lines = []
+    if lines:
+        yield b"\n".join(lines) + b"\n"
+
+
+async def aiter_json_array(batches: AsyncIterator[List[Any]]) -> AsyncIterator[bytes]:
+    """
+    Encode batches from an async source as one JSON array, a chunk per batch.
+    The source is closed as soon as the response stops, e.g. on disconnect.
+    """
+    try:
+        yield b"["
+        first = True
+        async for batch in batches:
+            if not batch:
+                continue
+            chunk = encode(batch)
+            yield (b"" if first else b",") + chunk[1:-1]
+            first = False
+        yield b"]"
+    finally:
+        await batches.aclose()
+
+
+async def aiter_ndjson(batches: AsyncIterator[List[Any]]) -> AsyncIterator[bytes]:
+    try:
+        async for batch in batches:
+            if batch:
+                yield b"\n".join(encode(item) for item in batch) + b"\n"
+    finally:
+        await batches.aclose()
+
+
+def wants_ndjson(accept: str) -> bool:
+    return NDJSON_MEDIA_TYPE in (accept or "")
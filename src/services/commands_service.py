@@ -1,12 +1,30 @@
+import asyncio
 import json
-from datetime import datetime
-from typing import Dict
-from src.config import logger
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+from src.config import logger, COMMAND_STREAM, COMMAND_STREAM_MAXLEN
 from src.models import Device
 from src.utils import prepare_for_redis
+from src.services.device_events import (
+    DEVICE_EVENT_TYPE,
+    UPDATE_NOT_FOUND,
+    UPDATE_IDEMPOTENT,
+    UpdateResult,
+)
+from src.services.device_store import StoreLike, as_store
+from src.services.write_coalescer import get_write_coalescer
 
 
-async def process_command_message(r, payload: Dict[str, str]):
+async def process_command_message(r: StoreLike, payload: Dict[str, str]) -> Optional[asyncio.Future]:
+    """
+    Apply a command received by the command listener. With write coalescing
+    the command joins its device's window and the window's future is
+    returned; it resolves once the merged write is done.
+    """
+    if payload.get("type") == DEVICE_EVENT_TYPE:
+        # our own update notifications are published on the command channel too
+        return
+
     device_id = payload.get("device_id")
     command_data = payload.get("command")
 
@@ -14,13 +32,6 @@ async def process_command_message(r, payload: Dict[str, str]):
         logger.error(f"Invalid command payload: {payload}")
         return
 
-    full_device_id = f"device:{device_id}"
-    history_key = f"device:history:{device_id}"
-
-    if not await r.exists(full_device_id):
-        logger.warning(f"Device not found: {device_id}")
-        return
-
     valid_keys = set(Device.model_fields.keys())
     command_data = {k: v for k, v in command_data.items() if k in valid_keys}
 
@@ -29,18 +40,45 @@ async def process_command_message(r, payload: Dict[str, str]):
         return
 
     command = prepare_for_redis(command_data)
+    timestamp = datetime.now(timezone.utc).isoformat()
+
+    coalescer = get_write_coalescer()
+    if coalescer is not None:
+        pending = coalescer.submit(r, device_id, command, timestamp)
+
+        def log_merged(future: asyncio.Future) -> None:
+            # failures are reported by the worker pool
+            if not future.cancelled() and future.exception() is None:
+                _log_result(device_id, command, future.result())
 
-    current = await r.hgetall(full_device_id)
-    if all(current.get(k) == v for k, v in command.items()):
+        pending.add_done_callback(log_merged)
+        return pending
+
+    _log_result(device_id, command, await as_store(r).apply_update(device_id, command, timestamp))
+    return None
+
+
+def _log_result(device_id: str, command: Dict[str, str], result: UpdateResult) -> None:
+    if result.status == UPDATE_NOT_FOUND:
+        logger.warning(f"Device not found: {device_id}")
+        return
+
+    if result.status == UPDATE_IDEMPOTENT:
         logger.info(f"Idempotent command for device {device_id}, skipping")
         return
 
-    await r.hset(full_device_id, mapping=command)
+    logger.info(f"Updated fields {command} for device {device_id}")
 
-    history_entry = {
-        "timestamp": datetime.now().isoformat(),
-        "command": command,
-    }
-    await r.rpush(history_key, json.dumps(history_entry))
 
-    logger.info(f"Updated fields {command} for device {device_id}")
+async def enqueue_command(r, device_id: str, command: Dict[str, Any]) -> str:
+    """
+    Add a command to the command stream (COMMAND_TRANSPORT=stream).
+    The stream is trimmed to roughly COMMAND_STREAM_MAXLEN entries.
+    """
+    payload = json.dumps({"device_id": device_id, "command": command})
+    return await r.xadd(
+        COMMAND_STREAM,
+        {"payload": payload},
+        maxlen=COMMAND_STREAM_MAXLEN,
+        approximate=True,
+    )
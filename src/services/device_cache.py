@@ -0,0 +1,153 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from src.config import logger, DEVICE_CACHE_SIZE, DEVICE_CACHE_TTL_SECONDS
+from src.models import Device
+
+_cache: Optional["DeviceCache"] = None
+
+
+class DeviceCache:
+    """
+    Bounded in-process cache of validated devices with LRU and TTL eviction.
+
+    Entries are dropped when an update for the device is seen. `generation`
+    counts invalidations and every device remembers the generation of its
+    last one, so a read that raced with an update of that device is not
+    stored: take the generation before reading Redis and pass it to `put`.
+    Updates of other devices do not matter.
+
+    While updates cannot be seen (`bypass`) every read is a miss and nothing
+    is stored, until the next `clear`.
+    """
+
+    def __init__(self, max_size: int = DEVICE_CACHE_SIZE, ttl: float = DEVICE_CACHE_TTL_SECONDS):
+        self._max_size = max_size
+        self._ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, Device]]" = OrderedDict()
+        # device id -> generation of its last invalidation, oldest first
+        self._invalidated: "OrderedDict[str, int]" = OrderedDict()
+        # puts older than this are refused for every device, e.g. after clear()
+        # or for devices whose invalidation was forgotten to bound memory
+        self._floor = 0
+        self.bypassed = False
+
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, device_id: str) -> Optional[Device]:
+        if self.bypassed:
+            self.misses += 1
+            return None
+
+        entry = self._entries.get(device_id)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, device = entry
+        if expires_at <= time.monotonic():
+            del self._entries[device_id]
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(device_id)
+        self.hits += 1
+        return device
+
+    def get_many(self, device_ids: Iterable[str]) -> Dict[str, Device]:
+        found = {}
+        for device_id in device_ids:
+            device = self.get(device_id)
+            if device is not None:
+                found[device_id] = device
+        return found
+
+    def put(self, device: Device, generation: int) -> bool:
+        if self.bypassed or generation < self._floor or generation < self._invalidated.get(device.id, 0):
+            return False
+
+        self._entries[device.id] = (time.monotonic() + self._ttl, device)
+        self._entries.move_to_end(device.id)
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        return True
+
+    def invalidate(self, device_id: str, _message: Any = None) -> None:
+        self.generation += 1
+        self._invalidated[device_id] = self.generation
+        self._invalidated.move_to_end(device_id)
+        while len(self._invalidated) > self._max_size:
+            _, forgotten = self._invalidated.popitem(last=False)
+            self._floor = max(self._floor, forgotten)
+        if self._entries.pop(device_id, None) is not None:
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        self.generation += 1
+        self._floor = self.generation
+        self._invalidated.clear()
+        self._entries.clear()
+        self.bypassed = False
+
+    def bypass(self) -> None:
+        self.clear()
+        self.bypassed = True
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self._max_size,
+            "ttl_seconds": self._ttl,
+            "bypassed": self.bypassed,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+
+def get_device_cache() -> Optional[DeviceCache]:
+    return _cache
+
+
+def enable_device_cache(broker, **settings) -> DeviceCache:
+    """
+    Create the process-wide cache and keep it coherent through the update
+    broker: every device update invalidates the entry, the cache is bypassed
+    while the broker is disconnected, and a (re)subscription clears it since
+    updates may have been missed meanwhile.
+    """
+    global _cache
+    if _cache is None:
+        _cache = DeviceCache(**settings)
+        broker.add_callback(_cache.invalidate)
+        broker.add_subscribe_callback(_cache.clear)
+        broker.add_disconnect_callback(_cache.bypass)
+        logger.info(f"Device cache enabled ({_cache.stats()['max_size']} entries, {_cache.stats()['ttl_seconds']}s ttl)")
+    return _cache
+
+
+def disable_device_cache(broker=None) -> None:
+    global _cache
+    if _cache is not None and broker is not None:
+        broker.remove_callback(_cache.invalidate)
+        broker.remove_subscribe_callback(_cache.clear)
+        broker.remove_disconnect_callback(_cache.bypass)
+    _cache = None
+
+
+def device_cache_stats() -> Dict[str, Any]:
+    if _cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **_cache.stats()}
@@ -1,40 +1,357 @@
 import json
+from datetime import datetime, timezone
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+
 import redis.asyncio as redis
+from redis.commands.core import AsyncScript
+from redis.exceptions import WatchError
 
-from src.utils import device_updates_channel
-from src.config import logger, DEVICE_COMMAND_CHANNEL
+from src.utils import (
+    DEVICE_REGISTRY_KEY,
+    DEVICE_INDEXED_FIELDS,
+    device_key,
+    device_index_key,
+    device_history_key,
+    device_updates_channel,
+)
+from src.config import logger, DEVICE_COMMAND_CHANNEL, HISTORY_MAX_ENTRIES, HISTORY_MAX_AGE_SECONDS
+from src.infrastructure.metrics import DEVICE_UPDATES, DEVICE_EVENT_SUBSCRIBERS
 
 
-async def write_history_entry(
-    r: redis.Redis,
-    history_key: str,
+DEVICE_EVENT_TYPE = "device_command_applied"
+# published on the device's update channel when it is deleted
+DEVICE_DELETED_EVENT_TYPE = "device_deleted"
+
+UPDATE_APPLIED = "applied"
+UPDATE_IDEMPOTENT = "idempotent"
+UPDATE_NOT_FOUND = "not_found"
+
+# Applies a command to a device in a single round trip:
+# existence check, idempotency check, hash update, index maintenance,
+# history append and both event publications.
+#
+# Index keys depend on the values a command replaces, so the caller reads
+# the indexed fields first and passes both index keys of every indexed field
+# in KEYS. If one of those fields changed in between the script returns 3
+# without writing and the caller retries with fresh values.
+#
+# History is a stream per device: entry ids carry the epoch-ms timestamp and
+# entries hold only the fields whose value changed. It is capped by count
+# (MAXLEN) and by age (MINID, counted from the Redis clock that also stamps
+# the entry ids); a limit of 0 disables that cap. A legacy list history makes
+# the script return 4 without writing; the caller converts the list to a
+# stream (migrate_list_history) and retries.
+#
+# KEYS: device hash, history stream, registry,
+#       then old and new index key per indexed field in the command
+# ARGV: device id, timestamp, updates channel, command channel ("" to skip),
+#       event type, history max entries, history max age ms, number of indexed
+#       fields, indexed field/expected value pairs, field/value pairs...
+APPLY_UPDATE_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return {0}
+end
+
+if redis.call('TYPE', KEYS[2]).ok == 'list' then
+    return {4}
+end
+
+local device_id = ARGV[1]
+local indexed = tonumber(ARGV[8])
+for i = 1, indexed do
+    local field, expected = ARGV[7 + 2 * i], ARGV[8 + 2 * i]
+    if (redis.call('HGET', KEYS[1], field) or '') ~= expected then
+        return {3}
+    end
+end
+
+local command = {}
+local mapping = {}
+local delta = {}
+for i = 9 + 2 * indexed, #ARGV, 2 do
+    local field, value = ARGV[i], ARGV[i + 1]
+    if redis.call('HGET', KEYS[1], field) ~= value then
+        delta[#delta + 1] = field
+        delta[#delta + 1] = value
+    end
+    command[field] = value
+    mapping[#mapping + 1] = field
+    mapping[#mapping + 1] = value
+end
+
+if #delta == 0 then
+    return {2}
+end
+
+redis.call('HSET', KEYS[1], unpack(mapping))
+redis.call('ZADD', KEYS[3], 0, device_id)
+
+for i = 1, indexed do
+    local field, old = ARGV[7 + 2 * i], ARGV[8 + 2 * i]
+    if old ~= command[field] then
+        redis.call('ZREM', KEYS[2 + 2 * i], device_id)
+        redis.call('ZADD', KEYS[3 + 2 * i], 0, device_id)
+    end
+end
+
+local max_entries = tonumber(ARGV[6])
+if max_entries > 0 then
+    redis.call('XADD', KEYS[2], 'MAXLEN', max_entries, '*', unpack(delta))
+else
+    redis.call('XADD', KEYS[2], '*', unpack(delta))
+end
+local max_age_ms = tonumber(ARGV[7])
+if max_age_ms > 0 then
+    local now = redis.call('TIME')
+    local min_ms = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000) - max_age_ms
+    redis.call('XTRIM', KEYS[2], 'MINID', string.format('%d', min_ms))
+end
+local history_length = redis.call('XLEN', KEYS[2])
+
+local message = cjson.encode({
+    type = ARGV[5],
+    device_id = device_id,
+    updated_fields = command,
+    history_length = history_length,
+    timestamp = ARGV[2],
+})
+
+redis.call('PUBLISH', ARGV[3], message)
+local subscribers = 0
+if ARGV[4] ~= '' then
+    subscribers = redis.call('PUBLISH', ARGV[4], message)
+end
+
+return {1, history_length, subscribers}
+"""
+
+def device_deleted_message(device_id: str) -> str:
+    return json.dumps({"type": DEVICE_DELETED_EVENT_TYPE, "device_id": device_id}, separators=(",", ":"))
+
+
+_STATUSES = {0: UPDATE_NOT_FOUND, 1: UPDATE_APPLIED, 2: UPDATE_IDEMPOTENT}
+# the indexed fields changed after the caller read them
+_STALE_INDEX_VALUES = 3
+# the device still has a list history from before streams
+_LEGACY_HISTORY = 4
+# script runs before a command whose indexed fields keep changing gives up
+_MAX_UPDATE_ATTEMPTS = 5
+
+_apply_update_script: Optional[AsyncScript] = None
+
+
+class UpdateConflict(Exception):
+    """
+    The indexed fields of a device kept changing between the read and the
+    script, on every attempt.
+    """
+
+
+class UpdateResult(NamedTuple):
+    status: str
+    history_length: int = 0
+    subscribers: int = 0
+
+
+def _get_script(r: redis.Redis) -> AsyncScript:
+    global _apply_update_script
+    if _apply_update_script is None:
+        _apply_update_script = r.register_script(APPLY_UPDATE_LUA)
+    return _apply_update_script
+
+
+def _script_arguments(
+    device_id: str,
+    command: Dict[str, str],
     timestamp: str,
-    command: dict,
-) -> int:
-    history_entry = {
-        "timestamp": timestamp,
-        "command": command,
-    }
-    return await r.rpush(history_key, json.dumps(history_entry))
+    publish_commands: bool,
+    previous: Dict[str, str],
+) -> Dict[str, List[str]]:
+    keys = [device_key(device_id), device_history_key(device_id), DEVICE_REGISTRY_KEY]
+    args = [
+        device_id,
+        timestamp,
+        device_updates_channel(device_id),
+        DEVICE_COMMAND_CHANNEL if publish_commands else "",
+        DEVICE_EVENT_TYPE,
+        str(HISTORY_MAX_ENTRIES),
+        str(max(HISTORY_MAX_AGE_SECONDS, 0) * 1000),
+        str(len(previous)),
+    ]
+    for field, old_value in previous.items():
+        keys.extend((device_index_key(field, old_value), device_index_key(field, command[field])))
+        args.extend((field, old_value))
+    for field, value in command.items():
+        args.extend((field, value))
 
+    return {"keys": keys, "args": args}
 
-async def publish_device_events(
+
+def _indexed_fields(command: Dict[str, str]) -> List[str]:
+    return [field for field in command if field in DEVICE_INDEXED_FIELDS]
+
+
+def _previous_values(fields: List[str], values: List[Optional[str]]) -> Dict[str, str]:
+    # a missing field is passed as "", its index key holds no devices
+    return {field: value or "" for field, value in zip(fields, values)}
+
+
+async def _read_indexed_values(r: redis.Redis, updates: Sequence[Tuple[str, Dict[str, str]]]) -> List[Dict[str, str]]:
+    """
+    Current values of the indexed fields each command touches, in one round trip.
+    """
+    fields = [_indexed_fields(command) for _, command in updates]
+    if not any(fields):
+        return [{} for _ in updates]
+
+    async with r.pipeline(transaction=False) as pipe:
+        for (device_id, _), names in zip(updates, fields):
+            if names:
+                pipe.hmget(device_key(device_id), names)
+        replies = iter(await pipe.execute())
+
+    return [_previous_values(names, next(replies)) if names else {} for names in fields]
+
+
+def _legacy_entry_ms(entry: Dict) -> int:
+    moment = datetime.fromisoformat(entry["timestamp"])
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp() * 1000)
+
+
+def _stream_entries(raw: List[str]) -> Tuple[List[Tuple[str, Dict[str, str]]], int]:
+    """
+    Turn legacy `{"timestamp", "command"}` list items into stream entries with
+    ids at their timestamps, kept strictly increasing. Items that cannot be
+    read are counted, not converted.
+    """
+    entries = []
+    dropped = 0
+    last_ms, seq = 0, 0
+    for item in raw:
+        try:
+            entry = json.loads(item)
+            ms = _legacy_entry_ms(entry)
+            fields = {str(field): str(value) for field, value in entry["command"].items()}
+        except (ValueError, TypeError, KeyError, AttributeError):
+            dropped += 1
+            continue
+        if not fields:
+            dropped += 1
+            continue
+
+        if ms <= last_ms:
+            ms, seq = last_ms, seq + 1
+        else:
+            seq = 0
+        last_ms = ms
+        entries.append((f"{ms}-{seq}", fields))
+    return entries, dropped
+
+
+async def migrate_list_history(r: redis.Redis, device_id: str) -> int:
+    """
+    Convert a device's legacy list history into a stream, one entry per list
+    item at its timestamp. The caps apply on the device's next write.
+    Returns the number of entries converted.
+    """
+    key = device_history_key(device_id)
+    async with r.pipeline(transaction=True) as pipe:
+        while True:
+            try:
+                await pipe.watch(key)
+                if await pipe.type(key) != "list":
+                    return 0
+                entries, dropped = _stream_entries(await pipe.lrange(key, 0, -1))
+                pipe.multi()
+                pipe.delete(key)
+                for entry_id, fields in entries:
+                    pipe.xadd(key, fields, id=entry_id)
+                await pipe.execute()
+                break
+            except WatchError:
+                continue
+
+    if dropped:
+        logger.warning(f"Dropped {dropped} unreadable legacy history entries of {device_id}")
+    logger.info(f"Migrated {len(entries)} legacy history entries of {device_id} to a stream")
+    return len(entries)
+
+
+def parse_update_result(raw: List[int]) -> UpdateResult:
+    result = UpdateResult(_STATUSES[int(raw[0])], *(int(v) for v in raw[1:]))
+    DEVICE_UPDATES.inc((result.status,))
+    if result.subscribers:
+        DEVICE_EVENT_SUBSCRIBERS.inc(amount=result.subscribers)
+    return result
+
+
+async def apply_device_update(
     r: redis.Redis,
     device_id: str,
-    updated_fields: dict,
-    history_length: int,
+    command: Dict[str, str],
     timestamp: str,
-) -> None:
-    event = {
-        "type": "device_command_applied",
-        "device_id": device_id,
-        "updated_fields": updated_fields,
-        "history_length": history_length,
-        "timestamp": timestamp,
-    }
-    message = json.dumps(event)
-
-    await r.publish(device_updates_channel(device_id), message)
-
-    subscribers_count = await r.publish(DEVICE_COMMAND_CHANNEL, message)
-    logger.info(f"Published command for {device_id}. Subscribers: {subscribers_count}")
+    publish_commands: bool = True,
+) -> UpdateResult:
+    """
+    Atomically apply an already sanitized, Redis-ready command to a device.
+
+    Uses EVALSHA; if the script cache was flushed the script is reloaded and
+    the call retried transparently. A command touching indexed fields reads
+    them first and is retried if they change before the script runs, up to
+    `_MAX_UPDATE_ATTEMPTS` times before UpdateConflict is raised. A legacy
+    list history is migrated to a stream before the command is applied.
+    """
+    script = _get_script(r)
+    for _ in range(_MAX_UPDATE_ATTEMPTS):
+        previous = (await _read_indexed_values(r, [(device_id, command)]))[0]
+        raw = await script(client=r, **_script_arguments(device_id, command, timestamp, publish_commands, previous))
+        if int(raw[0]) == _LEGACY_HISTORY:
+            await migrate_list_history(r, device_id)
+        elif int(raw[0]) != _STALE_INDEX_VALUES:
+            break
+    else:
+        DEVICE_UPDATES.inc(("conflict",))
+        raise UpdateConflict(f"Indexed fields of {device_id} changed on {_MAX_UPDATE_ATTEMPTS} attempts")
+
+    result = parse_update_result(raw)
+    if result.status == UPDATE_APPLIED:
+        logger.info(f"Published command for {device_id}. Subscribers: {result.subscribers}")
+    return result
+
+
+async def apply_device_updates(
+    r: redis.Redis,
+    updates: Sequence[Tuple[str, Dict[str, str]]],
+    timestamp: str,
+    publish_commands: bool = True,
+) -> List[Union[UpdateResult, Exception]]:
+    """
+    Apply many commands with one pipelined round trip for the indexed values
+    and one for the scripts. Results keep the order of `updates`; a failed
+    command yields its exception.
+    """
+    script = _get_script(r)
+    previous = await _read_indexed_values(r, updates)
+
+    async with r.pipeline(transaction=False) as pipe:
+        pipe.scripts.add(script)
+        for (device_id, command), old_values in zip(updates, previous):
+            arguments = _script_arguments(device_id, command, timestamp, publish_commands, old_values)
+            pipe.evalsha(script.sha, len(arguments["keys"]), *arguments["keys"], *arguments["args"])
+        replies = await pipe.execute(raise_on_error=False)
+
+    results: List[Union[UpdateResult, Exception]] = []
+    for (device_id, command), reply in zip(updates, replies):
+        if isinstance(reply, Exception):
+            results.append(reply)
+        elif int(reply[0]) in (_STALE_INDEX_VALUES, _LEGACY_HISTORY):
+            # raced with another write to the same device, or has a list history to migrate
+            try:
+                results.append(await apply_device_update(r, device_id, command, timestamp, publish_commands))
+            except UpdateConflict as e:
+                results.append(e)
+        else:
+            results.append(parse_update_result(reply))
+    return results
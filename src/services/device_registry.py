@@ -0,0 +1,331 @@
+from typing import AsyncIterator, Dict, Iterable, List, Any, Optional
+
+import redis.asyncio as redis
+from redis.exceptions import WatchError
+
+from src.config import logger, REGISTRY_BATCH_SIZE
+from src.services.device_events import device_deleted_message, migrate_list_history
+from src.utils import (
+    DEVICE_REGISTRY_KEY,
+    DEVICE_INDEXED_FIELDS,
+    DEVICE_INDEX_PREFIX,
+    device_key,
+    device_history_key,
+    device_index_key,
+    device_updates_channel,
+    prepare_for_redis,
+)
+
+
+# The registry and the secondary indexes are sorted sets where every member has
+# score 0, so members are ordered lexicographically by device id and can be
+# walked with ZRANGEBYLEX. Index keys look like `devices:index:<field>:<value>`.
+
+
+def reindex_device(pipe, device_id: str, old: Dict[str, str], new: Dict[str, str]) -> None:
+    """
+    Queue the index changes needed to move a device from `old` to `new` field values.
+    """
+    for field in DEVICE_INDEXED_FIELDS:
+        if field not in new:
+            continue
+
+        old_value = old.get(field)
+        new_value = new[field]
+        if old_value == new_value:
+            continue
+
+        if old_value is not None:
+            pipe.zrem(device_index_key(field, old_value), device_id)
+        pipe.zadd(device_index_key(field, new_value), {device_id: 0})
+
+
+async def register_devices(r: redis.Redis, device_ids: Iterable[str]) -> int:
+    mapping = {device_id: 0 for device_id in device_ids}
+    if not mapping:
+        return 0
+    return await r.zadd(DEVICE_REGISTRY_KEY, mapping)
+
+
+async def unregister_devices(r: redis.Redis, device_ids: Iterable[str]) -> int:
+    device_ids = list(device_ids)
+    if not device_ids:
+        return 0
+    return await r.zrem(DEVICE_REGISTRY_KEY, *device_ids)
+
+
+async def _fetch_indexed_fields(r: redis.Redis, device_ids: List[str]) -> List[Dict[str, str]]:
+    async with r.pipeline(transaction=False) as pipe:
+        for device_id in device_ids:
+            pipe.hmget(device_key(device_id), DEVICE_INDEXED_FIELDS)
+        rows = await pipe.execute()
+
+    return [
+        {field: value for field, value in zip(DEVICE_INDEXED_FIELDS, row) if value is not None}
+        for row in rows
+    ]
+
+
+async def save_devices(
+    r: redis.Redis,
+    devices: Iterable[Dict[str, Any]],
+    replace_existing: bool = True,
+) -> int:
+    """
+    Store device hashes, register their ids and update the secondary indexes.
+
+    With `replace_existing=False` the devices are assumed to be new (e.g. right
+    after a cleanup), which saves the lookup of previously indexed values.
+    """
+    prepared = {}
+    for device in devices:
+        device_id = device.get("id")
+        if not device_id:
+            continue
+        prepared[device_id] = prepare_for_redis({k: v for k, v in device.items() if k != "id"})
+
+    if not prepared:
+        return 0
+
+    device_ids = list(prepared)
+    if replace_existing:
+        previous = await _fetch_indexed_fields(r, device_ids)
+    else:
+        previous = [{} for _ in device_ids]
+
+    async with r.pipeline(transaction=False) as pipe:
+        for device_id, old in zip(device_ids, previous):
+            data = prepared[device_id]
+            pipe.hset(device_key(device_id), mapping=data)
+            pipe.zadd(DEVICE_REGISTRY_KEY, {device_id: 0})
+            reindex_device(pipe, device_id, old, data)
+
+        await pipe.execute()
+    return len(prepared)
+
+
+async def delete_devices(r: redis.Redis, device_ids: Iterable[str]) -> int:
+    device_ids = list(device_ids)
+    if not device_ids:
+        return 0
+
+    previous = await _fetch_indexed_fields(r, device_ids)
+
+    async with r.pipeline(transaction=False) as pipe:
+        for device_id, old in zip(device_ids, previous):
+            pipe.unlink(device_key(device_id), device_history_key(device_id))
+            for field, value in old.items():
+                pipe.zrem(device_index_key(field, value), device_id)
+            # device caches of every process drop the entry
+            pipe.publish(device_updates_channel(device_id), device_deleted_message(device_id))
+        pipe.zrem(DEVICE_REGISTRY_KEY, *device_ids)
+        results = await pipe.execute()
+    return results[-1]
+
+
+async def _iter_lex(r: redis.Redis, key: str, after: Optional[str], batch_size: int) -> AsyncIterator[List[str]]:
+    start = f"({after}" if after is not None else "-"
+    while True:
+        members = await r.zrangebylex(key, start, "+", start=0, num=batch_size)
+        if not members:
+            return
+
+        yield members
+
+        if len(members) < batch_size:
+            return
+        start = f"({members[-1]}"
+
+
+async def iter_registry_batches(
+    r: redis.Redis,
+    batch_size: int = REGISTRY_BATCH_SIZE,
+    after: Optional[str] = None,
+) -> AsyncIterator[List[str]]:
+    async for device_ids in _iter_lex(r, DEVICE_REGISTRY_KEY, after, batch_size):
+        yield device_ids
+
+
+async def iter_matching_batches(
+    r: redis.Redis,
+    filters: Optional[Dict[str, str]] = None,
+    batch_size: int = REGISTRY_BATCH_SIZE,
+    after: Optional[str] = None,
+) -> AsyncIterator[List[str]]:
+    """
+    Yield batches of device ids, in id order, that match every `field=value` filter.
+
+    The smallest matching index drives the walk; membership in the other
+    indexes is checked with pipelined ZSCORE calls.
+    """
+    if not filters:
+        async for device_ids in iter_registry_batches(r, batch_size, after):
+            yield device_ids
+        return
+
+    index_keys = [device_index_key(field, value) for field, value in filters.items()]
+
+    async with r.pipeline(transaction=False) as pipe:
+        for key in index_keys:
+            pipe.zcard(key)
+        sizes = await pipe.execute()
+
+    if not all(sizes):
+        return
+
+    index_keys = [key for _, key in sorted(zip(sizes, index_keys))]
+    driver, others = index_keys[0], index_keys[1:]
+
+    async for candidates in _iter_lex(r, driver, after, batch_size):
+        if not others:
+            yield candidates
+            continue
+
+        async with r.pipeline(transaction=False) as pipe:
+            for device_id in candidates:
+                for key in others:
+                    pipe.zscore(key, device_id)
+            scores = await pipe.execute()
+
+        width = len(others)
+        matched = [
+            device_id
+            for i, device_id in enumerate(candidates)
+            if all(score is not None for score in scores[i * width:(i + 1) * width])
+        ]
+        if matched:
+            yield matched
+
+
+async def fetch_device_hashes(
+    r: redis.Redis,
+    device_ids: List[str],
+    fields: Optional[List[str]] = None,
+) -> List[Dict[str, str]]:
+    """
+    Fetch device hashes in one pipeline. With `fields`, only those hash fields
+    are read (HMGET) and missing values are left out of the result.
+    """
+    async with r.pipeline(transaction=False) as pipe:
+        for device_id in device_ids:
+            if fields:
+                pipe.hmget(device_key(device_id), fields)
+            else:
+                pipe.hgetall(device_key(device_id))
+        rows = await pipe.execute()
+
+    if not fields:
+        return rows
+
+    return [
+        {field: value for field, value in zip(fields, row) if value is not None}
+        for row in rows
+    ]
+
+
+async def _watched(r: redis.Redis, device_ids: List[str], read, write) -> List[Any]:
+    """
+    Read values for `device_ids` and queue writes based on them in one
+    MULTI/EXEC that only commits if none of the device hashes changed in
+    between (WATCH); a concurrent command makes it read again.
+    """
+    async with r.pipeline(transaction=True) as pipe:
+        while True:
+            try:
+                await pipe.watch(*(device_key(device_id) for device_id in device_ids))
+                values = await read()
+                pipe.multi()
+                write(pipe, values)
+                return await pipe.execute()
+            except WatchError:
+                continue
+
+
+async def _index_devices(r: redis.Redis, device_ids: List[str]) -> int:
+    """
+    Add the devices to the registry and to the index of each indexed value
+    they hold. Entries that are already there are left alone.
+    """
+    def write(pipe, indexed: List[Dict[str, str]]) -> None:
+        for device_id, values in zip(device_ids, indexed):
+            reindex_device(pipe, device_id, {}, values)
+        pipe.zadd(DEVICE_REGISTRY_KEY, {device_id: 0 for device_id in device_ids})
+
+    results = await _watched(r, device_ids, lambda: _fetch_indexed_fields(r, device_ids), write)
+    return results[-1]
+
+
+async def _prune_index(r: redis.Redis, key: str, batch_size: int) -> int:
+    """
+    Remove the members of one index whose hash is gone or no longer holds
+    the indexed value.
+    """
+    field, _, value = key[len(DEVICE_INDEX_PREFIX):].partition(":")
+    removed = 0
+
+    async for device_ids in _iter_lex(r, key, None, batch_size):
+        stale: List[str] = []
+
+        def write(pipe, current: List[Dict[str, str]]) -> None:
+            stale[:] = [device_id for device_id, row in zip(device_ids, current) if row.get(field) != value]
+            if stale:
+                pipe.zrem(key, *stale)
+
+        results = await _watched(r, device_ids, lambda: fetch_device_hashes(r, device_ids, [field]), write)
+        if stale:
+            removed += results[0]
+
+    return removed
+
+
+async def rebuild_registry(r: redis.Redis, batch_size: int = REGISTRY_BATCH_SIZE) -> Dict[str, int]:
+    """
+    Reconcile the registry and secondary indexes with the device hashes that
+    actually exist.
+
+    Adds every `device:<id>` hash that is missing from the registry or its
+    indexes, then drops index entries and registry members that no longer
+    match a hash. Nothing is cleared first, so filtered reads keep working
+    during the repair, and every batch is checked against concurrent
+    commands with WATCH. Legacy list histories are converted to streams.
+    """
+    found = set()
+    added = 0
+    batch: List[str] = []
+
+    async for key in r.scan_iter(match="device:*", count=batch_size, _type="hash"):
+        device_id = key.split(":", 1)[1]
+        if ":" in device_id:
+            continue
+        found.add(device_id)
+        batch.append(device_id)
+
+        if len(batch) >= batch_size:
+            added += await _index_devices(r, batch)
+            batch = []
+
+    if batch:
+        added += await _index_devices(r, batch)
+
+    pruned = 0
+    async for key in r.scan_iter(match=f"{DEVICE_INDEX_PREFIX}*", count=batch_size):
+        pruned += await _prune_index(r, key, batch_size)
+
+    stale: List[str] = []
+    async for device_ids in iter_registry_batches(r, batch_size):
+        stale.extend(device_id for device_id in device_ids if device_id not in found)
+
+    removed = 0
+    for i in range(0, len(stale), batch_size):
+        removed += await unregister_devices(r, stale[i:i + batch_size])
+
+    migrated = 0
+    async for key in r.scan_iter(match=device_history_key("*"), count=batch_size, _type="list"):
+        await migrate_list_history(r, key[len(device_history_key("")):])
+        migrated += 1
+
+    logger.info(
+        f"Registry rebuilt: {len(found)} devices, {added} added, {removed} stale removed, "
+        f"{pruned} stale index entries removed, {migrated} list histories migrated"
+    )
+    return {"devices": len(found), "added": added, "removed": removed, "pruned": pruned, "migrated": migrated}
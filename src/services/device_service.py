@@ -1,94 +1,380 @@
+import asyncio
+import time
 from datetime import datetime, timezone
-from typing import List, Dict, Any
+from typing import AsyncIterator, Iterable, List, Dict, Any, Optional, Tuple
 
-import redis.asyncio as redis
 from fastapi import HTTPException
+from pydantic import TypeAdapter
 
-from src.models import Device, ReturnObject
-from src.utils import prepare_device_data, prepare_for_redis
-from src.config import logger
-from src.services.device_events import write_history_entry, publish_device_events
+from src.models import Device, ReturnObject, BulkCommandRequest, BulkCommandResult, HistoryEntry
+from src.utils import (
+    prepare_device_data,
+    prepare_for_redis,
+    device_key,
+    encode_cursor,
+    decode_cursor,
+)
+from src.config import logger, BULK_CHUNK_SIZE, BULK_CONCURRENCY, HISTORY_PAGE_SIZE, REGISTRY_BATCH_SIZE
+from src.services.device_events import (
+    UpdateConflict,
+    UPDATE_APPLIED,
+    UPDATE_NOT_FOUND,
+    UPDATE_IDEMPOTENT,
+)
+from src.services.device_store import DeviceStore, StoreLike, as_store
+from src.services.device_cache import DeviceCache, get_device_cache
+from src.services.write_coalescer import get_write_coalescer
+from src.infrastructure.profiling import STAGE_VALIDATION, record_stage, timed
 
 
-async def list_devices(r: redis.Redis) -> List[Device]:
+_FIELD_ADAPTERS = {name: TypeAdapter(field.annotation) for name, field in Device.model_fields.items()}
+
+
+async def list_devices(
+    r: StoreLike,
+    filters: Optional[Dict[str, str]] = None,
+    fields: Optional[List[str]] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+) -> Tuple[List[Any], Optional[str]]:
+    """
+    Return a page of devices and the cursor for the next page (None on the last page).
+
+    Without `fields` the items are validated `Device` models; with `fields`
+    they are dicts holding only the requested fields.
+    """
     logger.debug("GET /devices path reached")
 
-    devices_list: List[Device] = []
-    device_keys_async = r.scan_iter(match="device:*")
+    devices_list: List[Any] = []
+    has_more = False
+
+    # one item past the page tells whether there is a next page
+    async for items in stream_devices(r, filters, fields, limit=limit + 1 if limit is not None else None, cursor=cursor):
+        for item in items:
+            if limit is not None and len(devices_list) >= limit:
+                has_more = True
+                break
+            devices_list.append(item)
+
+        if has_more:
+            break
+
+    next_cursor = None
+    if has_more and devices_list:
+        last = devices_list[-1]
+        next_cursor = encode_cursor(last["id"] if fields else last.id)
+
+    return devices_list, next_cursor
+
+
+def stream_devices(
+    r: StoreLike,
+    filters: Optional[Dict[str, str]] = None,
+    fields: Optional[List[str]] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    batch_size: Optional[int] = None,
+) -> AsyncIterator[List[Any]]:
+    """
+    Yield the matching devices batch by batch, as list_devices builds them,
+    holding one batch in memory at a time. Batches default to
+    REGISTRY_BATCH_SIZE, or `limit` when that is smaller, so a small page
+    reads about one page of hashes.
 
-    async for key in device_keys_async:
-        device_data_raw = await r.hgetall(key)
+    The cursor is checked before anything is read, so a bad cursor still
+    fails with 400 before a streaming response has started.
+    """
+    after = None
+    if cursor:
+        after = decode_cursor(cursor)
+        if after is None:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    if batch_size is None:
+        batch_size = min(limit, REGISTRY_BATCH_SIZE) if limit is not None else REGISTRY_BATCH_SIZE
+    return _iter_device_batches(as_store(r), filters, fields, limit, after, batch_size)
+
+
+async def _iter_device_batches(
+    store: DeviceStore,
+    filters: Optional[Dict[str, str]],
+    fields: Optional[List[str]],
+    limit: Optional[int],
+    after: Optional[str],
+    batch_size: int,
+) -> AsyncIterator[List[Any]]:
+    cache = get_device_cache()
+    # a cache stores whole devices, so misses read the full hash even for a projection
+    hash_fields = [f for f in fields if f != "id"] if fields and cache is None else None
+    remaining = limit
+
+    async for device_ids in store.iter_batches(filters, batch_size=batch_size, after=after):
+        items = await _load_devices(store, device_ids, fields, hash_fields, cache)
+        if remaining is not None:
+            items = items[:remaining]
+            remaining -= len(items)
+
+        if items:
+            yield items
+        if remaining == 0:
+            return
+
+
+async def _load_devices(
+    store: DeviceStore,
+    device_ids: List[str],
+    fields: Optional[List[str]],
+    hash_fields: Optional[List[str]],
+    cache: Optional[DeviceCache],
+) -> List[Any]:
+    cached = cache.get_many(device_ids) if cache is not None else {}
+    generation = cache.generation if cache is not None else 0
+    missing = [device_id for device_id in device_ids if device_id not in cached]
+    hashes = await store.get_many(missing, hash_fields or None) if missing else []
+    fetched = dict(zip(missing, hashes))
+
+    items: List[Any] = []
+    started = time.perf_counter()
+    for device_id in device_ids:
+        device = cached.get(device_id)
+        if device is not None:
+            items.append(_project(device.model_dump(), fields) if fields else device)
+            continue
+
+        device_data_raw = fetched.get(device_id)
         if not device_data_raw:
+            logger.debug(f"Registered device {device_id} has no data, skipping")
             continue
 
         try:
-            prepared_data = prepare_device_data(key, device_data_raw)
+            prepared_data = prepare_device_data(device_key(device_id), device_data_raw)
+            if fields and cache is None:
+                items.append(_project(prepared_data, fields))
+                continue
+
             device = Device.model_validate(prepared_data)
-            devices_list.append(device)
+            if cache is not None and store.authoritative:
+                cache.put(device, generation)
+            items.append(_project(prepared_data, fields) if fields else device)
         except Exception as e:
-            logger.error(f"Skipping invalid device key {key}. Validation Error: {e}")
+            logger.error(f"Skipping invalid device {device_id}. Validation Error: {e}")
+    record_stage(STAGE_VALIDATION, time.perf_counter() - started)
+
+    return items
 
-    return devices_list
 
+def _project(data: Dict[str, str], fields: List[str]) -> Dict[str, Any]:
+    return {
+        field: _FIELD_ADAPTERS[field].validate_python(data[field])
+        for field in fields
+        if field in data
+    }
 
-async def fetch_device(r: redis.Redis, device_id: str) -> Device:
+
+async def fetch_device(r: StoreLike, device_id: str) -> Device:
     logger.debug(f"GET /devices/{device_id} path reached")
-    full_device_id = f"device:{device_id}"
 
-    if not await r.exists(full_device_id):
-        logger.debug(f"Device not found with ID: {device_id}")
-        raise HTTPException(status_code=404, detail=f"Device not found with id: {device_id}")
+    cache = get_device_cache()
+    if cache is not None:
+        device = cache.get(device_id)
+        if device is not None:
+            return device
+        generation = cache.generation
 
-    device_data_raw = await r.hgetall(full_device_id)
+    store = as_store(r)
+    device_data_raw = await store.get(device_id)
     if not device_data_raw:
+        logger.debug(f"Device not found with ID: {device_id}")
         raise HTTPException(status_code=404, detail=f"Device not found with id: {device_id}")
 
     try:
-        prepared_data = prepare_device_data(full_device_id, device_data_raw)
-        return Device.model_validate(prepared_data)
+        with timed(STAGE_VALIDATION):
+            prepared_data = prepare_device_data(device_key(device_id), device_data_raw)
+            device = Device.model_validate(prepared_data)
     except Exception as e:
         logger.exception(f"failed to fetch device data of device id: {device_id}, error: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch device data")
 
+    if cache is not None and store.authoritative:
+        cache.put(device, generation)
+    return device
 
-async def apply_command(r: redis.Redis, device_id: str, command: Dict[str, Any]) -> ReturnObject:
-    logger.debug(f"POST /devices/{device_id}/command path reached with command {command}")
 
-    full_device_id = f"device:{device_id}"
-    history_key = f"device:history:{device_id}"
+async def fetch_device_history(
+    r: StoreLike,
+    device_id: str,
+    since: Optional[int] = None,
+    until: Optional[int] = None,
+    limit: int = HISTORY_PAGE_SIZE,
+    order: str = "desc",
+) -> List[HistoryEntry]:
+    """
+    Read history entries between `since` and `until` (epoch ms, inclusive)
+    straight from the stream range, newest first unless `order` is "asc".
+    """
+    logger.debug(f"GET /devices/{device_id}/history path reached")
+
+    entries = await as_store(r).history(device_id, since=since, until=until, limit=limit, order=order)
+    if entries is None:
+        raise HTTPException(status_code=404, detail=f"Device not found with id: {device_id}")
+
+    return [
+        HistoryEntry(id=entry_id, timestamp=int(entry_id.split("-", 1)[0]), changes=changes)
+        for entry_id, changes in entries
+    ]
 
-    if not await r.exists(full_device_id):
-        raise HTTPException(status_code=404, detail=f"Device not found: {device_id}")
 
+async def apply_command(r: StoreLike, device_id: str, command: Dict[str, Any]) -> ReturnObject:
+    logger.debug(f"POST /devices/{device_id}/command path reached with command {command}")
+
+    store = as_store(r)
     command = _sanitize_command(command)
 
     if not command:
+        # error path only: tell a missing device (404) from an empty command (400)
+        if not await store.exists(device_id):
+            raise HTTPException(status_code=404, detail=f"Device not found: {device_id}")
         raise HTTPException(status_code=400, detail="Command payload cannot be empty")
 
-    current = await r.hgetall(full_device_id)
-    if _is_idempotent(current, command):
+    command_for_redis = prepare_for_redis(command)
+    timestamp = datetime.now(timezone.utc).isoformat()
+
+    coalescer = get_write_coalescer()
+    try:
+        if coalescer is not None:
+            result = await coalescer.apply(store, device_id, command_for_redis, timestamp)
+        else:
+            result = await store.apply_update(device_id, command_for_redis, timestamp)
+    except UpdateConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    _invalidate_cached([device_id])
+
+    if result.status == UPDATE_NOT_FOUND:
+        raise HTTPException(status_code=404, detail=f"Device not found: {device_id}")
+
+    if result.status == UPDATE_IDEMPOTENT:
         return ReturnObject(
             device_id=device_id,
             status="success",
             message="No changes applied – command is idempotent"
         )
 
-    command_for_redis = prepare_for_redis(command)
-    await r.hset(full_device_id, mapping=command_for_redis)
+    message = f"Updated fields: {command_for_redis} for device: {device_id}"
+    return ReturnObject(device_id=device_id, status="success", message=message)
+
 
+async def apply_bulk_commands(r: StoreLike, request: BulkCommandRequest) -> BulkCommandResult:
+    """
+    Apply many commands through chunked, pipelined runs of the same script used
+    by apply_command. Up to BULK_CONCURRENCY chunks are in flight at once.
+    """
+    logger.debug("POST /devices/commands path reached")
+    store = as_store(r)
+
+    shared_command = None
+    if request.command is not None:
+        shared_command = _valid_fields(request.command)
+        if not shared_command:
+            raise HTTPException(status_code=400, detail="Command payload cannot be empty")
+        shared_command = prepare_for_redis(shared_command)
+
+    result = BulkCommandResult()
     timestamp = datetime.now(timezone.utc).isoformat()
-    list_length = await write_history_entry(r, history_key, timestamp, command_for_redis)
-
-    await publish_device_events(
-        r=r,
-        device_id=device_id,
-        updated_fields=command_for_redis,
-        history_length=list_length,
-        timestamp=timestamp,
+    semaphore = asyncio.Semaphore(BULK_CONCURRENCY)
+
+    async def run_chunk(chunk: List[Tuple[str, Dict[str, str]]]) -> None:
+        try:
+            await _apply_chunk(store, chunk, timestamp, result)
+        finally:
+            semaphore.release()
+
+    async with asyncio.TaskGroup() as tg:
+        async for chunk in _iter_bulk_chunks(store, request, shared_command, result):
+            await semaphore.acquire()
+            tg.create_task(run_chunk(chunk))
+
+    logger.info(
+        f"Bulk command: {result.total} devices, {len(result.applied)} applied, "
+        f"{len(result.idempotent)} idempotent, {len(result.not_found)} not found"
     )
+    return result
 
-    message = f"Updated fields: {command_for_redis} for device: {device_id}"
-    return ReturnObject(device_id=device_id, status="success", message=message)
+
+async def _iter_bulk_chunks(
+    store: DeviceStore,
+    request: BulkCommandRequest,
+    command: Optional[Dict[str, str]],
+    result: BulkCommandResult,
+) -> AsyncIterator[List[Tuple[str, Dict[str, str]]]]:
+    if request.commands is not None:
+        chunk = []
+        for item in request.commands:
+            result.total += 1
+            item_command = _valid_fields(item.command)
+            if not item_command:
+                result.invalid.append(item.device_id)
+                continue
+
+            chunk.append((item.device_id, prepare_for_redis(item_command)))
+            if len(chunk) >= BULK_CHUNK_SIZE:
+                yield chunk
+                chunk = []
+
+        if chunk:
+            yield chunk
+        return
+
+    selector = request.selector
+    if selector.ids is not None:
+        for i in range(0, len(selector.ids), BULK_CHUNK_SIZE):
+            device_ids = selector.ids[i:i + BULK_CHUNK_SIZE]
+            result.total += len(device_ids)
+            yield [(device_id, command) for device_id in device_ids]
+        return
+
+    async for device_ids in store.iter_batches(selector.filters(), batch_size=BULK_CHUNK_SIZE):
+        result.total += len(device_ids)
+        yield [(device_id, command) for device_id in device_ids]
+
+
+async def _apply_chunk(
+    store: DeviceStore,
+    chunk: List[Tuple[str, Dict[str, str]]],
+    timestamp: str,
+    result: BulkCommandResult,
+) -> None:
+    try:
+        replies = await store.apply_updates(chunk, timestamp)
+    except Exception as e:
+        logger.error(f"Bulk command chunk of {len(chunk)} devices failed: {e}")
+        result.failed.extend(device_id for device_id, _ in chunk)
+        return
+
+    outcomes = {
+        UPDATE_APPLIED: result.applied,
+        UPDATE_IDEMPOTENT: result.idempotent,
+        UPDATE_NOT_FOUND: result.not_found,
+    }
+    _invalidate_cached(device_id for device_id, _ in chunk)
+    for (device_id, _), reply in zip(chunk, replies):
+        if isinstance(reply, Exception):
+            logger.error(f"Bulk command failed for device {device_id}: {reply}")
+            result.failed.append(device_id)
+            continue
+        outcomes[reply.status].append(device_id)
+
+
+def _invalidate_cached(device_ids: Iterable[str]) -> None:
+    # the update channel invalidates every process eventually; this process
+    # drops its own entries right away so it reads its own writes
+    cache = get_device_cache()
+    if cache is not None:
+        for device_id in device_ids:
+            cache.invalidate(device_id)
+
+
+def _valid_fields(command: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in command.items() if k in Device.model_fields}
 
 
 def _sanitize_command(command: Dict[str, Any]) -> Dict[str, Any]:
@@ -103,7 +389,3 @@ def _sanitize_command(command: Dict[str, Any]) -> Dict[str, Any]:
             command.pop(key, None)
 
     return command
-
-
-def _is_idempotent(current: Dict[str, Any], command: Dict[str, Any]) -> bool:
-    return all(current.get(k) == str(v) for k, v in command.items())
@@ -0,0 +1,217 @@
+import json
+import time
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, IO, Iterator, List, Optional
+
+import redis.asyncio as redis
+
+from src.config import logger, SEED_CHUNK_SIZE, REGISTRY_BATCH_SIZE
+from src.services.device_store import StoreLike, as_store
+from src.utils import prepare_device_data, device_key
+
+READ_SIZE = 1 << 16
+
+FORMAT_JSON = "json"
+FORMAT_NDJSON = "ndjson"
+
+
+# ---------- streaming readers ----------
+
+def iter_json_array(stream: IO[str], read_size: int = READ_SIZE) -> Iterator[Dict[str, Any]]:
+    """
+    Yield the elements of a top-level JSON array one at a time without
+    loading the whole document.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    started = False
+    eof = False
+
+    while True:
+        # skip whitespace and separators before the next element
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buffer) or eof:
+                break
+            chunk = stream.read(read_size)
+            buffer, pos = buffer[pos:] + chunk, 0
+            eof = not chunk
+
+        if pos >= len(buffer):
+            raise ValueError("Unexpected end of JSON array")
+
+        if not started:
+            if buffer[pos] != "[":
+                raise ValueError("JSON file must contain a list of devices.")
+            started = True
+            pos += 1
+            continue
+
+        if buffer[pos] == "]":
+            return
+
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            chunk = stream.read(read_size)
+            buffer, pos = buffer[pos:] + chunk, 0
+            eof = not chunk
+            continue
+
+        yield item
+        pos = end
+        if pos > read_size:
+            buffer, pos = buffer[pos:], 0
+
+
+def iter_ndjson(stream: IO[str]) -> Iterator[Dict[str, Any]]:
+    for line_number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON on line {line_number}: {e}") from e
+
+
+def detect_format(path: Path) -> str:
+    if path.suffix.lower() in (".ndjson", ".jsonl"):
+        return FORMAT_NDJSON
+
+    with open(path, "r", encoding="utf-8") as f:
+        while True:
+            char = f.read(1)
+            if not char or not char.isspace():
+                break
+    return FORMAT_JSON if char == "[" else FORMAT_NDJSON
+
+
+def iter_device_records(path: Path, file_format: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    file_format = file_format or detect_format(path)
+    with open(path, "r", encoding="utf-8") as f:
+        reader = iter_json_array(f) if file_format == FORMAT_JSON else iter_ndjson(f)
+        yield from reader
+
+
+# ---------- progress ----------
+
+class ProgressReporter:
+    """
+    Calls `report(count, rate)` at most every `interval` seconds.
+    """
+
+    def __init__(self, report: Callable[[int, float], None], interval: float = 1.0):
+        self._report = report
+        self._interval = interval
+        self._started = time.monotonic()
+        self._last = self._started
+        self.count = 0
+
+    def add(self, count: int) -> None:
+        self.count += count
+        now = time.monotonic()
+        if now - self._last >= self._interval:
+            self._last = now
+            self._report(self.count, self.rate)
+
+    @property
+    def rate(self) -> float:
+        elapsed = time.monotonic() - self._started
+        return self.count / elapsed if elapsed > 0 else 0.0
+
+
+# ---------- redis operations ----------
+
+async def clear_devices(r: redis.Redis, batch_size: int = SEED_CHUNK_SIZE) -> int:
+    """
+    Remove all device hashes, histories, the registry and the indexes with
+    batched UNLINK calls.
+    """
+    deleted = 0
+    for pattern in ("device:*", "devices:*"):
+        batch: List[str] = []
+        async for key in r.scan_iter(match=pattern, count=batch_size):
+            batch.append(key)
+            if len(batch) >= batch_size:
+                deleted += await r.unlink(*batch)
+                batch = []
+        if batch:
+            deleted += await r.unlink(*batch)
+    return deleted
+
+
+async def import_devices(
+    r: StoreLike,
+    records: Iterator[Dict[str, Any]],
+    chunk_size: int = SEED_CHUNK_SIZE,
+    replace_existing: bool = True,
+    progress: Optional[ProgressReporter] = None,
+) -> int:
+    """
+    Save devices from an iterator in pipelined chunks of `chunk_size`.
+    """
+    store = as_store(r)
+    read = 0
+    saved = 0
+    chunk: List[Dict[str, Any]] = []
+
+    async def flush() -> int:
+        count = await store.save_devices(chunk, replace_existing=replace_existing)
+        if progress:
+            progress.add(count)
+        return count
+
+    for record in records:
+        read += 1
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            saved += await flush()
+            chunk = []
+
+    if chunk:
+        saved += await flush()
+
+    skipped = read - saved
+    if skipped:
+        logger.warning(f"Skipped {skipped} records without an id")
+    return saved
+
+
+async def iter_device_snapshot(
+    r: StoreLike,
+    batch_size: int = REGISTRY_BATCH_SIZE,
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Yield batches of raw device records (hash fields plus id), in id order.
+    """
+    store = as_store(r)
+    async for device_ids in store.iter_batches(batch_size=batch_size):
+        hashes = await store.get_many(device_ids)
+        yield [
+            prepare_device_data(device_key(device_id), data)
+            for device_id, data in zip(device_ids, hashes)
+            if data
+        ]
+
+
+async def export_devices(
+    r: StoreLike,
+    out: IO[str],
+    batch_size: int = REGISTRY_BATCH_SIZE,
+    progress: Optional[ProgressReporter] = None,
+) -> int:
+    """
+    Stream the whole fleet to `out` as NDJSON, one device per line.
+    """
+    exported = 0
+    async for records in iter_device_snapshot(r, batch_size):
+        out.write("".join(json.dumps(record) + "\n" for record in records))
+        exported += len(records)
+        if progress:
+            progress.add(len(records))
+    return exported
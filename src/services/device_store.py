@@ -0,0 +1,291 @@
+from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import redis.asyncio as redis
+
+from src.config import logger, REGISTRY_BATCH_SIZE, STORAGE_BACKEND, REDIS_SHARDS
+from src.infrastructure.redis_client import init_redis_client, build_shard_clients
+from src.services.device_events import (
+    UpdateResult,
+    apply_device_update,
+    apply_device_updates,
+)
+from src.services.device_registry import (
+    save_devices,
+    delete_devices,
+    iter_matching_batches,
+    fetch_device_hashes,
+)
+from src.utils import device_key, device_history_key
+
+BACKEND_REDIS = "redis"
+BACKEND_MEMORY = "memory"
+BACKENDS = (BACKEND_REDIS, BACKEND_MEMORY)
+
+# (device id, Redis-ready command)
+Update = Tuple[str, Dict[str, str]]
+# (entry id "<epoch ms>-<seq>", changed fields)
+HistoryRecord = Tuple[str, Dict[str, str]]
+
+_store: Optional["DeviceStore"] = None
+
+
+class DeviceStore(ABC):
+    """
+    Storage operations the device services are built on.
+
+    Devices are flat string hashes, exactly as they are stored in Redis;
+    commands are already sanitized and Redis-ready (see prepare_for_redis).
+    """
+
+    backend = ""
+    # False for stores that may lag behind the master (replicas); what they
+    # return is served but not put into the device cache
+    authoritative = True
+
+    @abstractmethod
+    async def get(self, device_id: str) -> Dict[str, str]:
+        """
+        The device hash, empty when the device does not exist.
+        """
+
+    @abstractmethod
+    async def get_many(self, device_ids: List[str], fields: Optional[List[str]] = None) -> List[Dict[str, str]]:
+        """
+        Hashes in `device_ids` order; with `fields` only those fields.
+        """
+
+    @abstractmethod
+    async def exists(self, device_id: str) -> bool:
+        ...
+
+    @abstractmethod
+    def iter_batches(
+        self,
+        filters: Optional[Dict[str, str]] = None,
+        batch_size: int = REGISTRY_BATCH_SIZE,
+        after: Optional[str] = None,
+    ) -> AsyncIterator[List[str]]:
+        """
+        Batches of device ids matching every `field=value` filter, in id
+        order, starting after the id `after`.
+        """
+
+    @abstractmethod
+    async def apply_update(
+        self,
+        device_id: str,
+        command: Dict[str, str],
+        timestamp: str,
+        publish_commands: bool = True,
+    ) -> UpdateResult:
+        """
+        Atomically apply a command: hash, indexes, history and events.
+        """
+
+    @abstractmethod
+    async def apply_updates(
+        self,
+        updates: Sequence[Update],
+        timestamp: str,
+        publish_commands: bool = True,
+    ) -> List[Union[UpdateResult, Exception]]:
+        """
+        Apply many commands in one go; a failed update is returned as its
+        exception in place of the result.
+        """
+
+    @abstractmethod
+    async def history(
+        self,
+        device_id: str,
+        since: Optional[int] = None,
+        until: Optional[int] = None,
+        limit: Optional[int] = None,
+        order: str = "desc",
+    ) -> Optional[List[HistoryRecord]]:
+        """
+        History entries between `since` and `until` (epoch ms, inclusive);
+        None when the device does not exist.
+        """
+
+    @abstractmethod
+    async def save_devices(self, devices: Iterable[Dict[str, Any]], replace_existing: bool = True) -> int:
+        ...
+
+    @abstractmethod
+    async def delete_devices(self, device_ids: Iterable[str]) -> int:
+        ...
+
+    @abstractmethod
+    async def publish(self, channel: str, message: str) -> int:
+        ...
+
+    @abstractmethod
+    def pubsub(self):
+        """
+        A pub/sub handle with the redis-py interface used here: (p)subscribe,
+        get_message, listen, (p)unsubscribe and aclose.
+        """
+
+    async def ping(self) -> bool:
+        return True
+
+    async def aclose(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        """
+        Release connections the store opened itself; the shared Redis
+        client is closed by close_redis_client.
+        """
+
+
+class RedisDeviceStore(DeviceStore):
+    """
+    The Redis layout: device hashes, the registry and index sorted sets,
+    history streams and the update script.
+    """
+
+    backend = BACKEND_REDIS
+
+    def __init__(self, client: redis.Redis):
+        self.client = client
+
+    async def get(self, device_id: str) -> Dict[str, str]:
+        # an empty hash means the key does not exist, so one HGETALL is enough
+        return await self.client.hgetall(device_key(device_id))
+
+    async def get_many(self, device_ids: List[str], fields: Optional[List[str]] = None) -> List[Dict[str, str]]:
+        return await fetch_device_hashes(self.client, device_ids, fields)
+
+    async def exists(self, device_id: str) -> bool:
+        return bool(await self.client.exists(device_key(device_id)))
+
+    def iter_batches(
+        self,
+        filters: Optional[Dict[str, str]] = None,
+        batch_size: int = REGISTRY_BATCH_SIZE,
+        after: Optional[str] = None,
+    ) -> AsyncIterator[List[str]]:
+        return iter_matching_batches(self.client, filters, batch_size=batch_size, after=after)
+
+    async def apply_update(
+        self,
+        device_id: str,
+        command: Dict[str, str],
+        timestamp: str,
+        publish_commands: bool = True,
+    ) -> UpdateResult:
+        return await apply_device_update(self.client, device_id, command, timestamp, publish_commands)
+
+    async def apply_updates(
+        self,
+        updates: Sequence[Update],
+        timestamp: str,
+        publish_commands: bool = True,
+    ) -> List[Union[UpdateResult, Exception]]:
+        return await apply_device_updates(self.client, updates, timestamp, publish_commands)
+
+    async def history(
+        self,
+        device_id: str,
+        since: Optional[int] = None,
+        until: Optional[int] = None,
+        limit: Optional[int] = None,
+        order: str = "desc",
+    ) -> Optional[List[HistoryRecord]]:
+        start = str(since) if since is not None else "-"
+        end = str(until) if until is not None else "+"
+
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.exists(device_key(device_id))
+            if order == "asc":
+                pipe.xrange(device_history_key(device_id), min=start, max=end, count=limit)
+            else:
+                pipe.xrevrange(device_history_key(device_id), max=end, min=start, count=limit)
+            exists, entries = await pipe.execute(raise_on_error=False)
+
+        if not exists:
+            return None
+
+        if isinstance(entries, Exception):
+            logger.warning(f"History of device {device_id} is not readable as a stream: {entries}")
+            return []
+        return entries
+
+    async def save_devices(self, devices: Iterable[Dict[str, Any]], replace_existing: bool = True) -> int:
+        return await save_devices(self.client, devices, replace_existing=replace_existing)
+
+    async def delete_devices(self, device_ids: Iterable[str]) -> int:
+        return await delete_devices(self.client, device_ids)
+
+    async def publish(self, channel: str, message: str) -> int:
+        return await self.client.publish(channel, message)
+
+    def pubsub(self):
+        return self.client.pubsub()
+
+    async def ping(self) -> bool:
+        return await self.client.ping()
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+
+StoreLike = Union[DeviceStore, redis.Redis]
+
+
+def as_store(r: StoreLike) -> DeviceStore:
+    """
+    The services accept a store or a plain Redis client.
+    """
+    return r if isinstance(r, DeviceStore) else RedisDeviceStore(r)
+
+
+# ---------- application-wide store ----------
+
+def get_device_store() -> Optional[DeviceStore]:
+    return _store
+
+
+async def init_device_store(backend: Optional[str] = None) -> DeviceStore:
+    """
+    Create the store selected by STORAGE_BACKEND: the shared Redis client
+    (spread over REDIS_SHARDS when set), or an in-process store for runs
+    without Redis.
+    """
+    global _store
+    if _store is not None:
+        return _store
+
+    backend = backend or STORAGE_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown storage backend '{backend}', expected one of {BACKENDS}")
+
+    # the memory and sharded store modules build on this one, so they are imported here
+    if backend == BACKEND_MEMORY:
+        from src.services.memory_store import MemoryDeviceStore
+        store = MemoryDeviceStore()
+    elif REDIS_SHARDS:
+        from src.services.sharded_store import ShardedDeviceStore
+        store = ShardedDeviceStore(build_shard_clients(REDIS_SHARDS), await init_redis_client())
+        try:
+            await store.ping()
+        except Exception:
+            await store.close()
+            raise
+        logger.info(f"Devices are sharded over {len(store.shards)} Redis nodes")
+    else:
+        store = RedisDeviceStore(await init_redis_client())
+
+    _store = store
+    logger.info(f"Using the {backend} storage backend")
+    return _store
+
+
+async def close_device_store() -> None:
+    global _store
+    if _store is not None:
+        await _store.close()
+        _store = None
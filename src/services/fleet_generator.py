@@ -0,0 +1,92 @@
+import json
+import random
+from typing import Any, Dict, IO, Iterator, Optional
+
+from src.config import SEED_CHUNK_SIZE
+from src.services.device_snapshot import ProgressReporter, import_devices
+from src.services.device_store import StoreLike
+from src.services.simulation import DEFAULT_PROFILES
+
+DEFAULT_TYPE_WEIGHTS: Dict[str, float] = {
+    "light": 4,
+    "switch": 3,
+    "thermostat": 2,
+    "camera": 2,
+    "lock": 1,
+}
+
+DEFAULT_STATUS_WEIGHTS: Dict[str, Dict[str, float]] = {
+    device_type: {status: 1.0 for status in profile.transitions}
+    for device_type, profile in DEFAULT_PROFILES.items()
+}
+
+DEFAULT_ONLINE_RATIO = 0.9
+
+_ROOMS = ("Living Room", "Kitchen", "Bedroom", "Office", "Garage", "Hallway", "Basement", "Porch")
+
+
+def generate_fleet(
+    size: int,
+    seed: int = 0,
+    type_weights: Optional[Dict[str, float]] = None,
+    status_weights: Optional[Dict[str, Dict[str, float]]] = None,
+    online_ratio: float = DEFAULT_ONLINE_RATIO,
+    id_prefix: str = "device-",
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yield `size` synthetic devices. The same arguments always produce the same
+    fleet; devices are generated lazily so any size can be streamed.
+
+    Types are drawn from `type_weights`, statuses from the per-type
+    `status_weights` (types without an entry get "active"/"idle").
+    """
+    rng = random.Random(seed)
+    type_weights = type_weights or DEFAULT_TYPE_WEIGHTS
+    status_weights = status_weights or DEFAULT_STATUS_WEIGHTS
+
+    types, weights = zip(*type_weights.items())
+    statuses = {
+        device_type: tuple(zip(*status_weights.get(device_type, {"active": 1, "idle": 1}).items()))
+        for device_type in types
+    }
+    width = len(str(max(size - 1, 0)))
+
+    for i in range(size):
+        device_type = rng.choices(types, weights=weights)[0]
+        choices, choice_weights = statuses[device_type]
+        yield {
+            "id": f"{id_prefix}{i:0{width}d}",
+            "name": f"{rng.choice(_ROOMS)} {device_type.capitalize()} {i}",
+            "type": device_type,
+            "status": rng.choices(choices, weights=choice_weights)[0],
+            "online": rng.random() < online_ratio,
+        }
+
+
+async def write_fleet(
+    r: StoreLike,
+    size: int,
+    seed: int = 0,
+    chunk_size: int = SEED_CHUNK_SIZE,
+    progress: Optional[ProgressReporter] = None,
+    **options,
+) -> int:
+    """
+    Generate a fleet straight into the store (Redis or memory) in chunks. Devices are
+    assumed to be new, so existing ones with the same ids should be cleared first.
+    """
+    return await import_devices(
+        r,
+        generate_fleet(size, seed, **options),
+        chunk_size=chunk_size,
+        replace_existing=False,
+        progress=progress,
+    )
+
+
+def write_fleet_ndjson(out: IO[str], size: int, seed: int = 0, **options) -> int:
+    written = 0
+    for device in generate_fleet(size, seed, **options):
+        out.write(json.dumps(device) + "\n")
+        written += 1
+    return written
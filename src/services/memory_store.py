@@ -0,0 +1,361 @@
+import asyncio
+import bisect
+import fnmatch
+import json
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, Iterable, List, Optional, Sequence, Set, Tuple, Union
+
+from src.config import DEVICE_COMMAND_CHANNEL, HISTORY_MAX_ENTRIES, HISTORY_MAX_AGE_SECONDS, REGISTRY_BATCH_SIZE
+from src.services.device_events import DEVICE_EVENT_TYPE, UpdateResult, device_deleted_message, parse_update_result
+from src.services.device_store import BACKEND_MEMORY, DeviceStore, HistoryRecord, Update
+from src.utils import DEVICE_INDEXED_FIELDS, device_updates_channel, prepare_for_redis
+
+# raw replies of the update script, decoded by parse_update_result like Redis replies
+_NOT_FOUND = [0]
+_IDEMPOTENT = [2]
+
+
+class _SortedIds:
+    """
+    A set of device ids kept in sorted order, the in-memory counterpart of a
+    score-0 sorted set walked with ZRANGEBYLEX. Membership is a set lookup;
+    adds and removals find their position by bisection, so walks never sort.
+    """
+
+    __slots__ = ("_members", "_sorted")
+
+    def __init__(self):
+        self._members: Set[str] = set()
+        self._sorted: List[str] = []
+
+    def add(self, device_id: str) -> bool:
+        if device_id in self._members:
+            return False
+        self._members.add(device_id)
+        bisect.insort(self._sorted, device_id)
+        return True
+
+    def discard(self, device_id: str) -> bool:
+        if device_id not in self._members:
+            return False
+        self._members.discard(device_id)
+        del self._sorted[bisect.bisect_left(self._sorted, device_id)]
+        return True
+
+    def __contains__(self, device_id: str) -> bool:
+        return device_id in self._members
+
+    def __len__(self) -> int:
+        return len(self._members)
+
+    def after(self, after: Optional[str], count: int) -> List[str]:
+        start = bisect.bisect_right(self._sorted, after) if after is not None else 0
+        return self._sorted[start:start + count]
+
+
+class MemoryPubSub:
+    """
+    In-process pub/sub handle with the subset of the redis-py PubSub
+    interface the listeners use.
+    """
+
+    def __init__(self, store: "MemoryDeviceStore"):
+        self._store = store
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self.channels: Set[str] = set()
+        self.patterns: Set[str] = set()
+
+    @property
+    def subscribed(self) -> bool:
+        return bool(self.channels or self.patterns)
+
+    def deliver(self, message: Dict[str, Any]) -> None:
+        self._queue.put_nowait(message)
+
+    async def subscribe(self, *channels: str) -> None:
+        for channel in channels:
+            self.channels.add(channel)
+            self._store._channels.setdefault(channel, set()).add(self)
+            self.deliver({"type": "subscribe", "pattern": None, "channel": channel, "data": len(self.channels)})
+
+    async def psubscribe(self, *patterns: str) -> None:
+        for pattern in patterns:
+            self.patterns.add(pattern)
+            self._store._patterns.setdefault(pattern, set()).add(self)
+            self.deliver({"type": "psubscribe", "pattern": None, "channel": pattern, "data": len(self.patterns)})
+
+    async def unsubscribe(self, *channels: str) -> None:
+        for channel in channels or list(self.channels):
+            self.channels.discard(channel)
+            self._store._unsubscribe(self._store._channels, channel, self)
+
+    async def punsubscribe(self, *patterns: str) -> None:
+        for pattern in patterns or list(self.patterns):
+            self.patterns.discard(pattern)
+            self._store._unsubscribe(self._store._patterns, pattern, self)
+
+    async def get_message(self, ignore_subscribe_messages: bool = False, timeout: Optional[float] = 0.0):
+        try:
+            if timeout is None:
+                message = await self._queue.get()
+            elif timeout <= 0:
+                message = self._queue.get_nowait()
+            else:
+                # not wait_for: on 3.11 it can swallow a cancel that races with a message
+                async with asyncio.timeout(timeout):
+                    message = await self._queue.get()
+        except (asyncio.QueueEmpty, TimeoutError):
+            return None
+
+        if ignore_subscribe_messages and message["type"] in ("subscribe", "psubscribe"):
+            return None
+        return message
+
+    async def listen(self) -> AsyncIterator[Dict[str, Any]]:
+        while self.subscribed:
+            yield await self._queue.get()
+
+    async def aclose(self) -> None:
+        await self.unsubscribe()
+        await self.punsubscribe()
+
+
+class MemoryDeviceStore(DeviceStore):
+    """
+    Single-process store on plain dicts: device hashes, the registry and
+    field indexes as sorted id sets, bounded history deques and in-memory
+    pub/sub. Updates follow the update script step by step, so results,
+    history entries and published events match the Redis store.
+    """
+
+    backend = BACKEND_MEMORY
+
+    def __init__(
+        self,
+        history_max_entries: int = HISTORY_MAX_ENTRIES,
+        history_max_age_seconds: int = HISTORY_MAX_AGE_SECONDS,
+    ):
+        self._devices: Dict[str, Dict[str, str]] = {}
+        self._registry = _SortedIds()
+        self._indexes: Dict[Tuple[str, str], _SortedIds] = {}
+        self._history: Dict[str, Deque[HistoryRecord]] = {}
+        self._history_max_entries = history_max_entries or None
+        self._history_max_age_ms = history_max_age_seconds * 1000
+        self._last_entry = (0, 0)
+
+        self._channels: Dict[str, Set[MemoryPubSub]] = {}
+        self._patterns: Dict[str, Set[MemoryPubSub]] = {}
+
+    # ---------- reads ----------
+
+    async def get(self, device_id: str) -> Dict[str, str]:
+        return dict(self._devices.get(device_id, ()))
+
+    async def get_many(self, device_ids: List[str], fields: Optional[List[str]] = None) -> List[Dict[str, str]]:
+        rows = []
+        for device_id in device_ids:
+            data = self._devices.get(device_id, {})
+            rows.append({f: data[f] for f in fields if f in data} if fields else dict(data))
+        return rows
+
+    async def exists(self, device_id: str) -> bool:
+        return device_id in self._devices
+
+    async def iter_batches(
+        self,
+        filters: Optional[Dict[str, str]] = None,
+        batch_size: int = REGISTRY_BATCH_SIZE,
+        after: Optional[str] = None,
+    ) -> AsyncIterator[List[str]]:
+        sets = [self._indexes.get(item) for item in (filters or {}).items()]
+        if not all(s is not None for s in sets):
+            return
+
+        # the smallest index drives the walk, the others are membership checks
+        sets.sort(key=len)
+        driver, others = (sets[0], sets[1:]) if sets else (self._registry, [])
+
+        while True:
+            candidates = driver.after(after, batch_size)
+            if not candidates:
+                return
+
+            matched = [d for d in candidates if all(d in s for s in others)] if others else candidates
+            if matched:
+                yield matched
+
+            if len(candidates) < batch_size:
+                return
+            after = candidates[-1]
+
+    async def history(
+        self,
+        device_id: str,
+        since: Optional[int] = None,
+        until: Optional[int] = None,
+        limit: Optional[int] = None,
+        order: str = "desc",
+    ) -> Optional[List[HistoryRecord]]:
+        if device_id not in self._devices:
+            return None
+
+        entries = self._history.get(device_id, ())
+        result = []
+        for entry_id, changes in (entries if order == "asc" else reversed(entries)):
+            timestamp = int(entry_id.split("-", 1)[0])
+            if (since is not None and timestamp < since) or (until is not None and timestamp > until):
+                continue
+            result.append((entry_id, dict(changes)))
+            if limit is not None and len(result) >= limit:
+                break
+        return result
+
+    # ---------- writes ----------
+
+    async def apply_update(
+        self,
+        device_id: str,
+        command: Dict[str, str],
+        timestamp: str,
+        publish_commands: bool = True,
+    ) -> UpdateResult:
+        return self._apply(device_id, command, timestamp, publish_commands)
+
+    async def apply_updates(
+        self,
+        updates: Sequence[Update],
+        timestamp: str,
+        publish_commands: bool = True,
+    ) -> List[Union[UpdateResult, Exception]]:
+        return [self._apply(device_id, command, timestamp, publish_commands) for device_id, command in updates]
+
+    def _apply(self, device_id: str, command: Dict[str, str], timestamp: str, publish_commands: bool) -> UpdateResult:
+        device = self._devices.get(device_id)
+        if device is None:
+            return parse_update_result(_NOT_FOUND)
+
+        delta = {field: value for field, value in command.items() if device.get(field) != value}
+        if not delta:
+            return parse_update_result(_IDEMPOTENT)
+
+        self._reindex(device_id, device, command)
+        device.update(command)
+        self._registry.add(device_id)
+        history_length = self._append_history(device_id, delta)
+
+        message = json.dumps({
+            "type": DEVICE_EVENT_TYPE,
+            "device_id": device_id,
+            "updated_fields": command,
+            "history_length": history_length,
+            "timestamp": timestamp,
+        }, separators=(",", ":"))
+
+        self._publish(device_updates_channel(device_id), message)
+        subscribers = self._publish(DEVICE_COMMAND_CHANNEL, message) if publish_commands else 0
+        return parse_update_result([1, history_length, subscribers])
+
+    def _reindex(self, device_id: str, old: Dict[str, str], new: Dict[str, str]) -> None:
+        for field in DEVICE_INDEXED_FIELDS:
+            if field not in new or old.get(field) == new[field]:
+                continue
+            if field in old:
+                index = self._indexes.get((field, old[field]))
+                if index is not None:
+                    index.discard(device_id)
+                    if not index:
+                        del self._indexes[(field, old[field])]
+            self._indexes.setdefault((field, new[field]), _SortedIds()).add(device_id)
+
+    def _next_entry_id(self) -> Tuple[int, str]:
+        # stream ids: epoch ms plus a sequence, strictly increasing
+        now_ms = int(time.time() * 1000)
+        last_ms, last_seq = self._last_entry
+        self._last_entry = (now_ms, 0) if now_ms > last_ms else (last_ms, last_seq + 1)
+        return self._last_entry[0], f"{self._last_entry[0]}-{self._last_entry[1]}"
+
+    def _append_history(self, device_id: str, delta: Dict[str, str]) -> int:
+        entries = self._history.get(device_id)
+        if entries is None:
+            entries = self._history[device_id] = deque(maxlen=self._history_max_entries)
+
+        now_ms, entry_id = self._next_entry_id()
+        entries.append((entry_id, delta))
+        if self._history_max_age_ms > 0:
+            min_ms = now_ms - self._history_max_age_ms
+            while entries and int(entries[0][0].split("-", 1)[0]) < min_ms:
+                entries.popleft()
+        return len(entries)
+
+    async def save_devices(self, devices: Iterable[Dict[str, Any]], replace_existing: bool = True) -> int:
+        saved = 0
+        for device in devices:
+            device_id = device.get("id")
+            if not device_id:
+                continue
+            data = prepare_for_redis({k: v for k, v in device.items() if k != "id"})
+            current = self._devices.setdefault(device_id, {})
+            self._reindex(device_id, current, data)
+            current.update(data)
+            self._registry.add(device_id)
+            saved += 1
+        return saved
+
+    async def delete_devices(self, device_ids: Iterable[str]) -> int:
+        deleted = 0
+        for device_id in device_ids:
+            device = self._devices.pop(device_id, None)
+            self._history.pop(device_id, None)
+            self._publish(device_updates_channel(device_id), device_deleted_message(device_id))
+            if device is not None:
+                for field in DEVICE_INDEXED_FIELDS:
+                    index = self._indexes.get((field, device.get(field)))
+                    if index is not None:
+                        index.discard(device_id)
+                        if not index:
+                            del self._indexes[(field, device[field])]
+            deleted += self._registry.discard(device_id)
+        return deleted
+
+    async def flush(self) -> None:
+        self._devices.clear()
+        self._registry = _SortedIds()
+        self._indexes.clear()
+        self._history.clear()
+
+    # ---------- pub/sub ----------
+
+    async def publish(self, channel: str, message: str) -> int:
+        return self._publish(channel, message)
+
+    def _publish(self, channel: str, message: str) -> int:
+        receivers = 0
+        for pubsub in self._channels.get(channel, ()):
+            pubsub.deliver({"type": "message", "pattern": None, "channel": channel, "data": message})
+            receivers += 1
+        for pattern, subscribers in self._patterns.items():
+            if fnmatch.fnmatchcase(channel, pattern):
+                for pubsub in subscribers:
+                    pubsub.deliver({"type": "pmessage", "pattern": pattern, "channel": channel, "data": message})
+                    receivers += 1
+        return receivers
+
+    def pubsub(self) -> MemoryPubSub:
+        return MemoryPubSub(self)
+
+    @staticmethod
+    def _unsubscribe(registry: Dict[str, Set[MemoryPubSub]], name: str, pubsub: MemoryPubSub) -> None:
+        subscribers = registry.get(name)
+        if subscribers is not None:
+            subscribers.discard(pubsub)
+            if not subscribers:
+                del registry[name]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "devices": len(self._devices),
+            "indexes": len(self._indexes),
+            "history_entries": sum(len(entries) for entries in self._history.values()),
+            "subscriptions": sum(len(s) for s in self._channels.values()) + sum(len(s) for s in self._patterns.values()),
+        }
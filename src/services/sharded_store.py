@@ -0,0 +1,290 @@
+import asyncio
+import bisect
+import hashlib
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, Iterable, List, Optional, Sequence, Tuple, TypeVar, Union
+
+import redis.asyncio as redis
+
+from src.config import REGISTRY_BATCH_SIZE, REDIS_SHARD_VNODES
+from src.infrastructure.redis_client import client_pool_stats
+from src.services.device_events import UpdateResult
+from src.services.device_store import BACKEND_REDIS, DeviceStore, HistoryRecord, RedisDeviceStore, Update
+from src.utils import DEVICE_REGISTRY_KEY
+
+T = TypeVar("T")
+
+
+def _point(value: str) -> int:
+    # stable across processes, unlike hash()
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """
+    Consistent hashing: every node owns `vnodes` points on a 64-bit ring and
+    a key belongs to the node of the first point at or after the key's hash.
+    Adding or removing a node only moves the keys next to its points,
+    about 1/N of all keys.
+    """
+
+    def __init__(self, nodes: Iterable[str], vnodes: int = REDIS_SHARD_VNODES):
+        ring = sorted((_point(f"{node}#{i}"), node) for node in nodes for i in range(vnodes))
+        if not ring:
+            raise ValueError("A hash ring needs at least one node")
+        self._points = [point for point, _ in ring]
+        self._nodes = [node for _, node in ring]
+
+    def node_for(self, key: str) -> str:
+        index = bisect.bisect_left(self._points, _point(key))
+        return self._nodes[index % len(self._nodes)]
+
+
+class ShardedPubSub:
+    """
+    Subscribes on every shard and merges their messages into one stream.
+    Update events are published by the update script on the device's own
+    shard, so a pattern subscription has to cover all of them.
+    """
+
+    def __init__(self, clients: Sequence[redis.Redis]):
+        self._pubsubs = [client.pubsub() for client in clients]
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._readers: List[asyncio.Task] = []
+
+    @property
+    def subscribed(self) -> bool:
+        return any(pubsub.subscribed for pubsub in self._pubsubs)
+
+    async def _read(self, pubsub) -> None:
+        try:
+            while True:
+                message = await pubsub.get_message(timeout=None)
+                if message is not None:
+                    self._queue.put_nowait(message)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # surfaces in get_message / listen, so the owner can resubscribe
+            self._queue.put_nowait(e)
+
+    async def _on_all(self, method: str, *args: str) -> None:
+        await asyncio.gather(*(getattr(pubsub, method)(*args) for pubsub in self._pubsubs))
+        if not self._readers:
+            self._readers = [asyncio.create_task(self._read(pubsub)) for pubsub in self._pubsubs]
+
+    async def subscribe(self, *channels: str) -> None:
+        await self._on_all("subscribe", *channels)
+
+    async def psubscribe(self, *patterns: str) -> None:
+        await self._on_all("psubscribe", *patterns)
+
+    async def unsubscribe(self, *channels: str) -> None:
+        await asyncio.gather(*(pubsub.unsubscribe(*channels) for pubsub in self._pubsubs))
+
+    async def punsubscribe(self, *patterns: str) -> None:
+        await asyncio.gather(*(pubsub.punsubscribe(*patterns) for pubsub in self._pubsubs))
+
+    async def get_message(self, ignore_subscribe_messages: bool = False, timeout: Optional[float] = 0.0):
+        try:
+            if timeout is None:
+                message = await self._queue.get()
+            elif timeout <= 0:
+                message = self._queue.get_nowait()
+            else:
+                # not wait_for: on 3.11 it can swallow a cancel that races with a message
+                async with asyncio.timeout(timeout):
+                    message = await self._queue.get()
+        except (asyncio.QueueEmpty, TimeoutError):
+            return None
+
+        if isinstance(message, Exception):
+            raise message
+        if ignore_subscribe_messages and message["type"] in ("subscribe", "psubscribe", "unsubscribe", "punsubscribe"):
+            return None
+        return message
+
+    async def listen(self) -> AsyncIterator[Dict[str, Any]]:
+        while self._readers:
+            message = await self.get_message(timeout=None)
+            if message is not None:
+                yield message
+
+    async def aclose(self) -> None:
+        for reader in self._readers:
+            reader.cancel()
+        await asyncio.gather(*self._readers, return_exceptions=True)
+        self._readers = []
+        await asyncio.gather(*(pubsub.aclose() for pubsub in self._pubsubs), return_exceptions=True)
+
+
+class ShardedDeviceStore(DeviceStore):
+    """
+    Devices spread over several Redis nodes by consistent hashing of the
+    device id. A device's hash, history stream and registry / index entries
+    all live on its shard, so single-device operations (including the
+    update script) stay one round trip to one node. Multi-device
+    operations are split by shard and run concurrently; listing walks
+    every shard's registry in id order and merges the walks.
+
+    `client` is the control node (DB_HOST or the Sentinel master), used for
+    the command stream and the leader lease, not for device data.
+    """
+
+    backend = BACKEND_REDIS
+
+    def __init__(self, shards: Dict[str, redis.Redis], client: redis.Redis, vnodes: int = REDIS_SHARD_VNODES):
+        if not shards:
+            raise ValueError("ShardedDeviceStore needs at least one shard")
+        self.client = client
+        self.shards = {name: RedisDeviceStore(shard) for name, shard in shards.items()}
+        self._ring = HashRing(self.shards, vnodes)
+
+    def shard_for(self, device_id: str) -> RedisDeviceStore:
+        return self.shards[self._ring.node_for(device_id)]
+
+    def _group(self, items: Iterable[T], key=lambda item: item) -> Dict[str, List[Tuple[int, T]]]:
+        groups: Dict[str, List[Tuple[int, T]]] = {}
+        for position, item in enumerate(items):
+            groups.setdefault(self._ring.node_for(key(item)), []).append((position, item))
+        return groups
+
+    async def _scatter(self, items: Sequence[T], call, key=lambda item: item) -> List[Any]:
+        """
+        Run `call(shard, items_of_shard)` on every shard concurrently and put
+        the per-item results back in input order.
+        """
+        groups = self._group(items, key)
+        replies = await asyncio.gather(*(
+            call(self.shards[name], [item for _, item in group]) for name, group in groups.items()
+        ))
+        results: List[Any] = [None] * len(items)
+        for group, reply in zip(groups.values(), replies):
+            for (position, _), result in zip(group, reply):
+                results[position] = result
+        return results
+
+    # ---------- reads ----------
+
+    async def get(self, device_id: str) -> Dict[str, str]:
+        return await self.shard_for(device_id).get(device_id)
+
+    async def get_many(self, device_ids: List[str], fields: Optional[List[str]] = None) -> List[Dict[str, str]]:
+        return await self._scatter(device_ids, lambda shard, ids: shard.get_many(ids, fields))
+
+    async def exists(self, device_id: str) -> bool:
+        return await self.shard_for(device_id).exists(device_id)
+
+    async def iter_batches(
+        self,
+        filters: Optional[Dict[str, str]] = None,
+        batch_size: int = REGISTRY_BATCH_SIZE,
+        after: Optional[str] = None,
+    ) -> AsyncIterator[List[str]]:
+        walks = [shard.iter_batches(filters, batch_size=batch_size, after=after) for shard in self.shards.values()]
+        buffers: List[Deque[str]] = [deque() for _ in walks]
+        live = set(range(len(walks)))
+
+        async def refill(i: int) -> None:
+            try:
+                buffers[i].extend(await walks[i].__anext__())
+            except StopAsyncIteration:
+                live.discard(i)
+
+        try:
+            while True:
+                # the next id overall can only be picked once every live walk has a head
+                while starving := [i for i in live if not buffers[i]]:
+                    await asyncio.gather(*(refill(i) for i in starving))
+
+                batch: List[str] = []
+                while len(batch) < batch_size:
+                    heads = [i for i, buffer in enumerate(buffers) if buffer]
+                    if not heads:
+                        break
+                    i = min(heads, key=lambda i: buffers[i][0])
+                    batch.append(buffers[i].popleft())
+                    if not buffers[i] and i in live:
+                        break
+
+                if batch:
+                    yield batch
+                if not live and not any(buffers):
+                    return
+        finally:
+            await asyncio.gather(*(walk.aclose() for walk in walks), return_exceptions=True)
+
+    async def history(
+        self,
+        device_id: str,
+        since: Optional[int] = None,
+        until: Optional[int] = None,
+        limit: Optional[int] = None,
+        order: str = "desc",
+    ) -> Optional[List[HistoryRecord]]:
+        return await self.shard_for(device_id).history(device_id, since, until, limit, order)
+
+    # ---------- writes ----------
+
+    async def apply_update(
+        self,
+        device_id: str,
+        command: Dict[str, str],
+        timestamp: str,
+        publish_commands: bool = True,
+    ) -> UpdateResult:
+        return await self.shard_for(device_id).apply_update(device_id, command, timestamp, publish_commands)
+
+    async def apply_updates(
+        self,
+        updates: Sequence[Update],
+        timestamp: str,
+        publish_commands: bool = True,
+    ) -> List[Union[UpdateResult, Exception]]:
+        return await self._scatter(
+            updates,
+            lambda shard, group: shard.apply_updates(group, timestamp, publish_commands),
+            key=lambda update: update[0],
+        )
+
+    async def save_devices(self, devices: Iterable[Dict[str, Any]], replace_existing: bool = True) -> int:
+        groups = self._group([device for device in devices if device.get("id")], key=lambda device: device["id"])
+        saved = await asyncio.gather(*(
+            self.shards[name].save_devices([device for _, device in group], replace_existing)
+            for name, group in groups.items()
+        ))
+        return sum(saved)
+
+    async def delete_devices(self, device_ids: Iterable[str]) -> int:
+        groups = self._group(list(device_ids))
+        deleted = await asyncio.gather(*(
+            self.shards[name].delete_devices([device_id for _, device_id in group])
+            for name, group in groups.items()
+        ))
+        return sum(deleted)
+
+    # ---------- pub/sub ----------
+
+    async def publish(self, channel: str, message: str) -> int:
+        # subscribers listen on every shard, so one shard is enough
+        return await self.shard_for(channel).publish(channel, message)
+
+    def pubsub(self) -> ShardedPubSub:
+        return ShardedPubSub([shard.client for shard in self.shards.values()])
+
+    async def ping(self) -> bool:
+        return all(await asyncio.gather(*(shard.ping() for shard in self.shards.values())))
+
+    async def close(self) -> None:
+        await asyncio.gather(*(shard.client.aclose() for shard in self.shards.values()))
+
+    async def shard_stats(self) -> Dict[str, Any]:
+        names = list(self.shards)
+        counts = await asyncio.gather(*(self.shards[name].client.zcard(DEVICE_REGISTRY_KEY) for name in names))
+        return {
+            "sharded": True,
+            "shards": {
+                name: {"devices": count, **client_pool_stats(self.shards[name].client)}
+                for name, count in zip(names, counts)
+            },
+        }
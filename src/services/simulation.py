@@ -0,0 +1,279 @@
+import asyncio
+import heapq
+import random
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from src.config import (
+    logger,
+    SIMULATION_RATE,
+    SIMULATION_BATCH_SIZE,
+    SIMULATION_TICK_SECONDS,
+)
+from src.services.device_events import UPDATE_APPLIED, UPDATE_NOT_FOUND
+from src.services.device_store import StoreLike, as_store
+
+
+class SimulationProfile(BaseModel):
+    # status -> {next status: weight}
+    transitions: Dict[str, Dict[str, float]]
+    # mean seconds between two events of one device; only the ratio between
+    # profiles matters, the engine scales all intervals to the target rate
+    interval_seconds: float = 60.0
+    # share of events that flip the online flag instead of changing status
+    flap_probability: float = 0.05
+
+
+DEFAULT_PROFILES: Dict[str, SimulationProfile] = {
+    "thermostat": SimulationProfile(
+        transitions={
+            "active": {"idle": 3, "heating": 1, "cooling": 1},
+            "idle": {"active": 2, "heating": 1, "cooling": 1},
+            "heating": {"active": 2, "idle": 1},
+            "cooling": {"active": 2, "idle": 1},
+        },
+        interval_seconds=30,
+    ),
+    "light": SimulationProfile(transitions={"on": {"off": 1}, "off": {"on": 1}}, interval_seconds=120),
+    "switch": SimulationProfile(transitions={"on": {"off": 1}, "off": {"on": 1}}, interval_seconds=120),
+    "camera": SimulationProfile(
+        transitions={
+            "recording": {"idle": 1, "motion_detected": 2},
+            "idle": {"recording": 2, "motion_detected": 1},
+            "motion_detected": {"recording": 3, "idle": 1},
+        },
+        interval_seconds=20,
+        flap_probability=0.1,
+    ),
+    "lock": SimulationProfile(
+        transitions={"locked": {"unlocked": 1}, "unlocked": {"locked": 4}},
+        interval_seconds=300,
+    ),
+}
+
+FALLBACK_PROFILE = SimulationProfile(
+    transitions={"active": {"idle": 1}, "idle": {"active": 1}},
+    interval_seconds=60,
+    flap_probability=0.1,
+)
+
+ScheduleEntry = Tuple[float, int, str]
+
+
+def next_update(
+    profile: SimulationProfile,
+    status: Optional[str],
+    online: Optional[str],
+    rng: random.Random,
+) -> Dict[str, str]:
+    """
+    Pick the next state change for a device: an online/offline flip or a
+    weighted status transition.
+    """
+    if rng.random() < profile.flap_probability:
+        return {"online": "false" if online == "true" else "true"}
+
+    choices = profile.transitions.get(status)
+    if not choices:
+        # unknown status: move into the profile's state machine
+        choices = {state: 1.0 for state in profile.transitions}
+
+    states, weights = zip(*choices.items())
+    return {"status": rng.choices(states, weights=weights)[0]}
+
+
+class SimulationEngine:
+    """
+    Generates device state changes at a steady target rate.
+
+    A single loop drives every device: the next event time of each device sits
+    in a heap, a token bucket caps the aggregate rate, and due updates are
+    written in batches through the same store update as apply_command
+    (pipelined runs of the update script on Redis).
+    """
+
+    def __init__(
+        self,
+        r: StoreLike,
+        target_rate: float = SIMULATION_RATE,
+        batch_size: int = SIMULATION_BATCH_SIZE,
+        tick_seconds: float = SIMULATION_TICK_SECONDS,
+        profiles: Optional[Dict[str, SimulationProfile]] = None,
+        seed: Optional[int] = None,
+    ):
+        self._store = as_store(r)
+        self.target_rate = target_rate
+        self._batch_size = batch_size
+        self._tick = tick_seconds
+        self._profiles = profiles or DEFAULT_PROFILES
+        self._rng = random.Random(seed)
+
+        self._schedule: List[ScheduleEntry] = []
+        self._devices: Dict[str, List[Optional[str]]] = {}
+        self._interval_scale = 1.0
+        self._sequence = 0
+        self._task: Optional[asyncio.Task] = None
+        self._stopping: Optional[asyncio.Event] = None
+        self._window: Deque[Tuple[float, int]] = deque()
+
+        self.events = 0
+        self.applied = 0
+        self.started_at: Optional[float] = None
+
+    def _profile(self, device_type: Optional[str]) -> SimulationProfile:
+        return self._profiles.get(device_type, FALLBACK_PROFILE)
+
+    def _schedule_device(self, device_id: str, now: float) -> None:
+        profile = self._profile(self._devices[device_id][0])
+        mean_interval = profile.interval_seconds * self._interval_scale
+        self._sequence += 1
+        heapq.heappush(self._schedule, (now + self._rng.expovariate(1 / mean_interval), self._sequence, device_id))
+
+    async def load_devices(self) -> int:
+        fields = ["type", "status", "online"]
+        async for device_ids in self._store.iter_batches():
+            rows = await self._store.get_many(device_ids, fields)
+            for device_id, row in zip(device_ids, rows):
+                if row:
+                    self._devices[device_id] = [row.get(f) for f in fields]
+
+        natural_rate = sum(1 / self._profile(state[0]).interval_seconds for state in self._devices.values())
+        if natural_rate and self.target_rate > 0:
+            self._interval_scale = natural_rate / self.target_rate
+
+        now = time.monotonic()
+        self._schedule = []
+        for device_id in self._devices:
+            self._schedule_device(device_id, now)
+
+        logger.info(f"Simulation loaded {len(self._devices)} devices, target {self.target_rate} events/sec")
+        return len(self._devices)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self.started_at = time.monotonic()
+            self._stopping = asyncio.Event()
+            self._task = asyncio.create_task(self._run(), name="simulation-engine")
+
+    async def stop(self) -> None:
+        """
+        Finish the batch in progress and stop the loop.
+        """
+        if self._task is not None:
+            self._stopping.set()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def _run(self) -> None:
+        tokens = 0.0
+        last = time.monotonic()
+
+        while not self._stopping.is_set():
+            now = time.monotonic()
+            tokens = min(tokens + (now - last) * self.target_rate, max(self.target_rate, 1.0))
+            last = now
+
+            due: List[str] = []
+            while self._schedule and self._schedule[0][0] <= now and len(due) < int(tokens):
+                _, _, device_id = heapq.heappop(self._schedule)
+                due.append(device_id)
+
+            tokens -= len(due)
+            for i in range(0, len(due), self._batch_size):
+                try:
+                    await self._write_batch(due[i:i + self._batch_size])
+                except Exception as e:
+                    logger.error(f"Simulation batch failed: {e}")
+
+            for device_id in due:
+                if device_id in self._devices:
+                    self._schedule_device(device_id, now)
+
+            self._record(now, len(due))
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self._tick)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _write_batch(self, device_ids: List[str]) -> None:
+        timestamp = datetime.now(timezone.utc).isoformat()
+        updates = []
+
+        for device_id in device_ids:
+            device_type, status, online = self._devices[device_id]
+            updates.append((device_id, next_update(self._profile(device_type), status, online, self._rng)))
+        results = await self._store.apply_updates(updates, timestamp, publish_commands=False)
+
+        for (device_id, update), result in zip(updates, results):
+            self.events += 1
+            if isinstance(result, Exception):
+                logger.error(f"Simulated update failed for {device_id}: {result}")
+                continue
+            status = result.status
+            if status == UPDATE_NOT_FOUND:
+                # device was deleted, stop simulating it
+                self._devices.pop(device_id, None)
+                continue
+            if status == UPDATE_APPLIED:
+                self.applied += 1
+            state = self._devices[device_id]
+            state[1] = update.get("status", state[1])
+            state[2] = update.get("online", state[2])
+
+    def _record(self, now: float, count: int) -> None:
+        self._window.append((now, count))
+        while self._window and now - self._window[0][0] > 10:
+            self._window.popleft()
+
+    def measured_rate(self) -> float:
+        if len(self._window) < 2:
+            return 0.0
+        elapsed = self._window[-1][0] - self._window[0][0]
+        events = sum(count for _, count in list(self._window)[1:])
+        return events / elapsed if elapsed > 0 else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        behind = now - self._schedule[0][0] if self._schedule else 0.0
+        return {
+            "running": self.running,
+            "devices": len(self._devices),
+            "target_rate": self.target_rate,
+            "measured_rate": round(self.measured_rate(), 1),
+            "events": self.events,
+            "applied": self.applied,
+            "behind_seconds": round(max(behind, 0.0), 3),
+            "uptime_seconds": round(now - self.started_at, 1) if self.started_at else 0.0,
+        }
+
+
+_engine: Optional[SimulationEngine] = None
+
+
+async def start_simulation(r: StoreLike, **settings) -> SimulationEngine:
+    global _engine
+    await stop_simulation()
+
+    _engine = SimulationEngine(r, **settings)
+    await _engine.load_devices()
+    _engine.start()
+    return _engine
+
+
+async def stop_simulation() -> None:
+    if _engine is not None:
+        await _engine.stop()
+
+
+def simulation_stats() -> Dict[str, Any]:
+    if _engine is None:
+        return {"running": False}
+    return _engine.stats()
@@ -0,0 +1,166 @@
+import asyncio
+from typing import Any, Dict, Optional
+
+from src.config import logger, WRITE_COALESCE_WINDOW_MS
+from src.services.device_events import UpdateResult
+from src.services.device_store import StoreLike, as_store
+
+_coalescer: Optional["WriteCoalescer"] = None
+
+
+class WriteCancelled(Exception):
+    """
+    The merged write of a window was cancelled before it landed, e.g. on shutdown.
+    """
+
+
+class _PendingWrite:
+    __slots__ = ("r", "command", "timestamp", "commands", "future", "timer")
+
+    def __init__(self, r: StoreLike, future: asyncio.Future):
+        self.r = r
+        self.command: Dict[str, str] = {}
+        self.timestamp = ""
+        self.commands = 0
+        self.future = future
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class WriteCoalescer:
+    """
+    Merges the commands a device receives within `window` seconds into one
+    update: one hash write, one history entry and one event per window.
+
+    Fields are merged in arrival order, so the device ends in the same state
+    as if the commands had been applied one by one. Every command of a window
+    resolves with the result of the merged update. Writes for the same device
+    stay in order across windows.
+    """
+
+    def __init__(self, window: float = WRITE_COALESCE_WINDOW_MS / 1000):
+        self._window = window
+        self._pending: Dict[str, _PendingWrite] = {}
+        self._writing: Dict[str, asyncio.Task] = {}
+
+        self.commands = 0
+        self.merged = 0
+        self.writes = 0
+        self.failed = 0
+
+    def submit(self, r: StoreLike, device_id: str, command: Dict[str, str], timestamp: str) -> asyncio.Future:
+        """
+        Add an already sanitized, Redis-ready command to the device's current
+        window. Returns a future shared by the whole window; await it through
+        `apply` (or asyncio.shield) so one cancelled caller does not cancel it
+        for the others.
+        """
+        self.commands += 1
+        pending = self._pending.get(device_id)
+        if pending is None:
+            loop = asyncio.get_running_loop()
+            pending = self._pending[device_id] = _PendingWrite(r, loop.create_future())
+            pending.timer = loop.call_later(self._window, self._start_write, device_id)
+        else:
+            self.merged += 1
+
+        pending.command.update(command)
+        pending.timestamp = timestamp
+        pending.commands += 1
+        return pending.future
+
+    async def apply(self, r: StoreLike, device_id: str, command: Dict[str, str], timestamp: str) -> UpdateResult:
+        future = self.submit(r, device_id, command, timestamp)
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            if not future.cancelled() or asyncio.current_task().cancelling():
+                # this caller was cancelled, not the write
+                raise
+            raise WriteCancelled(f"Coalesced write for {device_id} was cancelled") from None
+
+    def _start_write(self, device_id: str) -> None:
+        pending = self._pending.pop(device_id, None)
+        if pending is None:
+            return
+
+        task = asyncio.create_task(self._write(device_id, pending, self._writing.get(device_id)))
+        self._writing[device_id] = task
+        task.add_done_callback(lambda t: self._write_done(device_id, t))
+
+    def _write_done(self, device_id: str, task: asyncio.Task) -> None:
+        if self._writing.get(device_id) is task:
+            del self._writing[device_id]
+
+    async def _write(self, device_id: str, pending: _PendingWrite, previous: Optional[asyncio.Task]) -> None:
+        try:
+            if previous is not None:
+                # the previous window of this device is still being written
+                await asyncio.wait([previous])
+            result = await as_store(pending.r).apply_update(device_id, pending.command, pending.timestamp)
+        except asyncio.CancelledError:
+            # callers and listeners waiting on the window must not hang
+            self.failed += 1
+            logger.warning(f"Coalesced write of {pending.commands} commands was cancelled for {device_id}")
+            pending.future.cancel()
+            raise
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"Coalesced write of {pending.commands} commands failed for {device_id}: {e}")
+            pending.future.set_exception(e)
+            return
+
+        self.writes += 1
+        if pending.commands > 1:
+            logger.debug(f"Coalesced {pending.commands} commands for {device_id} into one write")
+        pending.future.set_result(result)
+
+    async def flush(self) -> None:
+        """
+        Write every open window now and wait for all writes, e.g. before shutdown.
+        """
+        for device_id in list(self._pending):
+            self._pending[device_id].timer.cancel()
+            self._start_write(device_id)
+        if self._writing:
+            await asyncio.gather(*self._writing.values(), return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "window_ms": self._window * 1000,
+            "commands": self.commands,
+            "merged": self.merged,
+            "writes": self.writes,
+            "failed": self.failed,
+            "pending_devices": len(self._pending),
+            "writing_devices": len(self._writing),
+        }
+
+
+def get_write_coalescer() -> Optional[WriteCoalescer]:
+    return _coalescer
+
+
+def enable_write_coalescer(**settings) -> WriteCoalescer:
+    global _coalescer
+    if _coalescer is None:
+        _coalescer = WriteCoalescer(**settings)
+        logger.info(f"Write coalescing enabled ({_coalescer.stats()['window_ms']} ms window)")
+    return _coalescer
+
+
+async def flush_write_coalescer() -> None:
+    if _coalescer is not None:
+        await _coalescer.flush()
+
+
+async def disable_write_coalescer() -> None:
+    global _coalescer
+    if _coalescer is not None:
+        await _coalescer.flush()
+        _coalescer = None
+
+
+def write_coalescer_stats() -> Dict[str, Any]:
+    if _coalescer is None:
+        return {"enabled": False}
+    return {"enabled": True, **_coalescer.stats()}
@@ -1,3 +1,4 @@
+import asyncio
 import json
 import os
 import random
@@ -7,6 +8,64 @@ import redis.asyncio as aioredis
 from starlette.testclient import TestClient
 from src.app import app
 from src.config import DB_HOST, DB_PORT, REDIS_DB
+from src.services.device_registry import save_devices, delete_devices
+from src.services.fleet_generator import write_fleet
+
+
+# Fleet sizes for scaling tests, e.g. PERF_FLEET_SIZES=10000,100000,1000000
+FLEET_SIZES = [int(size) for size in os.getenv("PERF_FLEET_SIZES", "1000,10000").split(",") if size.strip()]
+
+
+class RestartableRedis:
+    """
+    A TCP proxy in front of the test Redis that can be "restarted": open
+    connections are cut and new ones refused until it is started again,
+    like a Redis restart as seen from the client.
+    """
+
+    def __init__(self):
+        self.port = 0
+        self._server = None
+        self._writers = set()
+
+    async def _pipe(self, reader, writer):
+        try:
+            while data := await reader.read(65536):
+                writer.write(data)
+                await writer.drain()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            writer.close()
+
+    async def _accept(self, client_reader, client_writer):
+        upstream_reader, upstream_writer = await asyncio.open_connection(DB_HOST, DB_PORT)
+        self._writers.update((client_writer, upstream_writer))
+        await asyncio.gather(
+            self._pipe(client_reader, upstream_writer),
+            self._pipe(upstream_reader, client_writer),
+        )
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._accept, "127.0.0.1", self.port, reuse_address=True)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self._server.close()
+        for writer in self._writers:
+            writer.transport.abort()
+        self._writers.clear()
+        await self._server.wait_closed()
+
+
+@pytest.fixture
+async def restartable_redis():
+    proxy = RestartableRedis()
+    await proxy.start()
+    try:
+        yield proxy
+    finally:
+        await proxy.stop()
 
 
 @pytest.fixture(scope="function")
@@ -53,37 +112,25 @@ def devices_data_realistic():
 
 @pytest.fixture(scope="function")
 async def populated_devices(redis_client, devices_data_realistic):
-    for device_data in devices_data_realistic:
-        device_id = device_data["id"]
-        full_key = f"device:{device_id}"
+    await save_devices(redis_client, devices_data_realistic)
+    return devices_data_realistic
 
-        data_to_save = {
-            k: str(v).lower() if isinstance(v, bool) else str(v)
-            for k, v in device_data.items()
-            if k != "id"
-        }
-        await redis_client.hset(full_key, mapping=data_to_save)
 
-    return devices_data_realistic
+@pytest.fixture(params=FLEET_SIZES, ids=lambda size: f"fleet-{size}", scope="function")
+async def generated_fleet(request, redis_client):
+    size = await write_fleet(redis_client, request.param, seed=42)
+    return size
 
 
 @pytest.fixture(params=["missing_device", "existing_device"], scope="function")
 async def device_scenario(request, redis_client, devices_data_realistic):
     device = random.choice(devices_data_realistic)
     device_id = device["id"]
-    key = f"device:{device_id}"
-    history_key = f"device:history:{device_id}"
 
-    await redis_client.delete(key)
-    await redis_client.delete(history_key)
+    await delete_devices(redis_client, [device_id])
 
     if request.param == "existing_device":
-        mapping = {
-            k: str(v).lower() if isinstance(v, bool) else str(v)
-            for k, v in device.items()
-            if k != "id"
-        }
-        await redis_client.hset(key, mapping=mapping)
+        await save_devices(redis_client, [device])
 
     return {"scenario": request.param, "device_id": device_id, "device": device}
 
@@ -0,0 +1,75 @@
+from starlette.testclient import TestClient
+from src.services.device_registry import save_devices
+
+
+def _fleet(n, **overrides):
+    return [
+        dict({"id": f"bulk-{i:04d}", "name": f"Device {i}", "type": "light", "status": "on", "online": True}, **overrides)
+        for i in range(n)
+    ]
+
+
+async def test_bulk_commands_per_device(app_client: TestClient, redis_client):
+    await save_devices(redis_client, _fleet(3))
+
+    response = app_client.post("/devices/commands", json={"commands": [
+        {"device_id": "bulk-0000", "command": {"status": "off"}},
+        {"device_id": "bulk-0001", "command": {"status": "on"}},
+        {"device_id": "missing", "command": {"status": "off"}},
+        {"device_id": "bulk-0002", "command": {"hacker": "x"}},
+    ]})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["total"] == 4
+    assert body["applied"] == ["bulk-0000"]
+    assert body["idempotent"] == ["bulk-0001"]
+    assert body["not_found"] == ["missing"]
+    assert body["invalid"] == ["bulk-0002"]
+
+    assert (await redis_client.hgetall("device:bulk-0000"))["status"] == "off"
+    assert await redis_client.xlen("device:history:bulk-0000") == 1
+    assert await redis_client.xlen("device:history:bulk-0001") == 0
+
+
+async def test_bulk_command_with_selector_spans_chunks(app_client: TestClient, redis_client, monkeypatch):
+    monkeypatch.setattr("src.services.device_service.BULK_CHUNK_SIZE", 7)
+    await save_devices(redis_client, _fleet(30) + [
+        {"id": "cam-1", "name": "Camera", "type": "camera", "status": "on", "online": True},
+    ])
+
+    response = app_client.post("/devices/commands", json={
+        "command": {"online": False, "status": "maintenance"},
+        "selector": {"type": "light"},
+    })
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["total"] == 30
+    assert len(body["applied"]) == 30
+    assert await redis_client.zcard("devices:index:status:maintenance") == 30
+    assert await redis_client.zrange("devices:index:online:true", 0, -1) == ["cam-1"]
+
+
+async def test_bulk_command_with_ids_selector(app_client: TestClient, redis_client):
+    await save_devices(redis_client, _fleet(2))
+
+    response = app_client.post("/devices/commands", json={
+        "command": {"status": "off"},
+        "selector": {"ids": ["bulk-0001", "nope"]},
+    })
+
+    body = response.json()
+    assert body["applied"] == ["bulk-0001"]
+    assert body["not_found"] == ["nope"]
+
+
+def test_bulk_command_request_validation(app_client: TestClient):
+    assert app_client.post("/devices/commands", json={}).status_code == 422
+    assert app_client.post("/devices/commands", json={"command": {"status": "x"}}).status_code == 422
+    assert app_client.post("/devices/commands", json={
+        "command": {"status": "x"}, "selector": {"ids": ["a"], "type": "light"},
+    }).status_code == 422
+    assert app_client.post("/devices/commands", json={
+        "command": {"bogus": "x"}, "selector": {"ids": ["a"]},
+    }).status_code == 400
@@ -0,0 +1,95 @@
+import asyncio
+import pytest
+from src.infrastructure.command_workers import CommandWorkerPool
+from src.services.commands_service import process_command_message
+
+
+async def test_same_device_is_serialized_and_devices_run_in_parallel():
+    running = {}
+    max_parallel = 0
+    order = []
+
+    async def handler(payload):
+        nonlocal max_parallel
+        device_id = payload["device_id"]
+        assert device_id not in running, "two commands for one device ran concurrently"
+        running[device_id] = True
+        max_parallel = max(max_parallel, len(running))
+        await asyncio.sleep(0.01)
+        order.append((device_id, payload["n"]))
+        del running[device_id]
+
+    pool = CommandWorkerPool(handler, workers=4, queue_size=100)
+    pool.start()
+    for n in range(5):
+        for device_id in ("a", "b", "c", "d", "e", "f"):
+            await pool.submit({"device_id": device_id, "n": n})
+    await pool.stop()
+
+    assert pool.processed == 30
+    assert max_parallel > 1
+    for device_id in ("a", "b", "c"):
+        assert [n for d, n in order if d == device_id] == [0, 1, 2, 3, 4]
+
+
+@pytest.mark.parametrize("policy, expected", [
+    ("drop_newest", [0, 1]),
+    ("drop_oldest", [0, 2]),
+])
+async def test_overflow_policies(policy, expected):
+    release = asyncio.Event()
+    seen = []
+
+    async def handler(payload):
+        await release.wait()
+        seen.append(payload["n"])
+
+    pool = CommandWorkerPool(handler, workers=1, queue_size=1, overflow=policy)
+    pool.start()
+    await pool.submit({"device_id": "x", "n": 0})
+    await asyncio.sleep(0)  # worker picks up n=0 and blocks
+    await pool.submit({"device_id": "x", "n": 1})
+    await pool.submit({"device_id": "x", "n": 2})
+
+    assert pool.dropped == 1
+    release.set()
+    await pool.stop()
+    assert seen == expected
+
+
+async def test_failures_are_counted_and_stop_drains():
+    async def handler(payload):
+        await asyncio.sleep(0.001)
+        if payload["n"] % 2:
+            raise RuntimeError("boom")
+
+    pool = CommandWorkerPool(handler, workers=2, queue_size=50)
+    pool.start()
+    for n in range(10):
+        await pool.submit({"device_id": str(n), "n": n})
+    await pool.stop()
+
+    stats = pool.stats()
+    assert stats["processed"] == 5
+    assert stats["failed"] == 5
+    assert stats["queue_depth"] == 0
+    assert stats["in_flight"] == 0
+    assert not await pool.submit({"device_id": "late", "n": 0})
+
+
+def test_unknown_overflow_policy():
+    with pytest.raises(ValueError):
+        CommandWorkerPool(lambda payload: None, overflow="explode")
+
+
+async def test_pool_runs_command_processing(redis_client):
+    await redis_client.hset("device:w1", mapping={"status": "normal"})
+
+    pool = CommandWorkerPool(lambda payload: process_command_message(redis_client, payload), workers=2)
+    pool.start()
+    for status in ("a", "b", "c"):
+        await pool.submit({"device_id": "w1", "command": {"status": status}})
+    await pool.stop()
+
+    assert (await redis_client.hgetall("device:w1"))["status"] == "c"
+    assert await redis_client.xlen("device:history:w1") == 3
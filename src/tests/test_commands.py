@@ -1,6 +1,6 @@
 from starlette.testclient import TestClient
 from src.utils import device_updates_channel
-import json
+from src.services.commands_service import process_command_message
 
 
 async def test_post_command_success_and_full_update(
@@ -23,11 +23,11 @@ async def test_post_command_success_and_full_update(
     assert device_state['status'] == new_status
     assert device_state['online'] == 'false'
 
-    history = await redis_client.lrange(f"device:history:{target_id}", 0, -1)
+    history = await redis_client.xrange(f"device:history:{target_id}")
     assert len(history) == 1
 
-    history_entry = json.loads(history[0])
-    assert history_entry['command']['status'] == new_status
+    _, history_entry = history[0]
+    assert history_entry['status'] == new_status
 
 def test_post_command_device_not_found(app_client: TestClient):
     non_existent_id = "device-not-a-chance-command"
@@ -77,5 +77,29 @@ async def test_command_creates_history_entry(app_client, redis_client):
 
     app_client.post("/devices/1/command", json={"status": "warning"})
 
-    history = await redis_client.lrange("device:history:1", 0, -1)
+    history = await redis_client.xrange("device:history:1")
     assert len(history) == 1
+
+
+async def test_command_survives_script_cache_flush(app_client, redis_client):
+    await redis_client.hset("device:1", mapping={"status": "normal"})
+    app_client.post("/devices/1/command", json={"status": "warning"})
+
+    await redis_client.script_flush()
+
+    r = app_client.post("/devices/1/command", json={"status": "error"})
+    assert r.status_code == 200
+    assert (await redis_client.hgetall("device:1"))["status"] == "error"
+    assert await redis_client.xlen("device:history:1") == 2
+
+
+async def test_pubsub_command_uses_atomic_update(redis_client):
+    await redis_client.hset("device:7", mapping={"status": "normal", "type": "light"})
+
+    await process_command_message(redis_client, {"device_id": "7", "command": {"status": "off", "bogus": 1}})
+    await process_command_message(redis_client, {"device_id": "7", "command": {"status": "off"}})
+
+    saved = await redis_client.hgetall("device:7")
+    assert saved == {"status": "off", "type": "light"}
+    assert await redis_client.xlen("device:history:7") == 1
+    assert await redis_client.zrange("devices:index:status:off", 0, -1) == ["7"]
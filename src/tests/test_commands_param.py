@@ -1,5 +1,3 @@
-import json
-
 async def test_send_command_parametrized(app_client, redis_client, device_scenario, command_payload):
     device_id = device_scenario["device_id"]
     scenario = device_scenario["scenario"]
@@ -24,7 +22,7 @@ async def test_send_command_parametrized(app_client, redis_client, device_scenar
             continue
         expected = str(v).lower() if isinstance(v, bool) else str(v)
         assert state.get(k) == expected
-    history = await redis_client.lrange(f"device:history:{device_id}", 0, -1)
+    history = await redis_client.xrange(f"device:history:{device_id}")
     assert len(history) == 1
-    history_entry = json.loads(history[0])
-    assert history_entry["command"]["status"] == str(payload.get("status", state.get("status")))
+    _, history_entry = history[0]
+    assert history_entry["status"] == str(payload.get("status", state.get("status")))
@@ -0,0 +1,149 @@
+import asyncio
+import time
+from starlette.testclient import TestClient
+from src.infrastructure.redis_client import build_listener_client
+from src.infrastructure.update_broker import UpdateBroker, get_update_broker
+from src.models import Device
+from src.services.device_cache import DeviceCache, enable_device_cache, disable_device_cache
+from src.services.device_events import apply_device_update
+from src.services.device_registry import delete_devices, save_devices
+
+
+def make_device(device_id, status="on"):
+    return Device(id=device_id, name="n", type="light", status=status, online=True)
+
+
+def test_cache_evicts_least_recently_used():
+    cache = DeviceCache(max_size=2, ttl=60)
+    for device_id in ("a", "b"):
+        cache.put(make_device(device_id), cache.generation)
+
+    cache.get("a")
+    cache.put(make_device("c"), cache.generation)
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_cache_entries_expire(monkeypatch):
+    cache = DeviceCache(max_size=10, ttl=5)
+    cache.put(make_device("a"), cache.generation)
+
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 6)
+
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_put_after_concurrent_invalidation_is_skipped():
+    cache = DeviceCache()
+    generation = cache.generation
+
+    cache.invalidate("a")
+
+    assert cache.put(make_device("a", "stale"), generation) is False
+    assert cache.get("a") is None
+
+
+def test_updates_of_other_devices_do_not_block_puts():
+    cache = DeviceCache(max_size=2)
+    generation = cache.generation
+
+    cache.invalidate("b")
+    assert cache.put(make_device("a"), generation) is True
+
+    # once "a"'s invalidation is forgotten to bound memory, older reads are refused
+    cache.invalidate("a")
+    cache.invalidate("c")
+    cache.invalidate("d")
+    assert cache.put(make_device("a", "stale"), generation) is False
+    assert cache.put(make_device("e"), cache.generation) is True
+
+
+async def test_cache_is_invalidated_by_updates_from_other_writers(app_client: TestClient, redis_client):
+    await save_devices(redis_client, [{"id": "c-1", "name": "n", "type": "light", "status": "off", "online": True}])
+    broker = app_client.portal.call(get_update_broker)
+    cache = enable_device_cache(broker)
+    try:
+        assert app_client.get("/devices/c-1").json()["status"] == "off"
+        assert app_client.get("/devices/c-1").json()["status"] == "off"
+        assert cache.stats()["hits"] == 1
+
+        # another process writes: only the update channel tells this one
+        await apply_device_update(redis_client, "c-1", {"status": "on"}, "t")
+        for _ in range(50):
+            if cache.stats()["invalidations"]:
+                break
+            await asyncio.sleep(0.02)
+
+        assert app_client.get("/devices/c-1").json()["status"] == "on"
+        assert app_client.get("/admin/cache").json()["enabled"] is True
+    finally:
+        disable_device_cache(broker)
+
+
+async def test_deleted_devices_leave_the_cache(app_client: TestClient, redis_client):
+    await save_devices(redis_client, [{"id": "d-1", "name": "n", "type": "light", "status": "off", "online": True}])
+    broker = app_client.portal.call(get_update_broker)
+    cache = enable_device_cache(broker)
+    try:
+        assert app_client.get("/devices/d-1").status_code == 200
+        await delete_devices(redis_client, ["d-1"])
+        for _ in range(50):
+            if cache.stats()["invalidations"]:
+                break
+            await asyncio.sleep(0.02)
+
+        assert app_client.get("/devices/d-1").status_code == 404
+    finally:
+        disable_device_cache(broker)
+
+
+async def test_cached_list_reads_own_writes(app_client: TestClient, redis_client):
+    await save_devices(redis_client, [
+        {"id": f"l-{i}", "name": "n", "type": "light", "status": "off", "online": True} for i in range(3)
+    ])
+    broker = app_client.portal.call(get_update_broker)
+    cache = enable_device_cache(broker)
+    try:
+        assert len(app_client.get("/devices/").json()) == 3
+        assert app_client.post("/devices/l-1/command", json={"status": "on"}).status_code == 200
+
+        devices = app_client.get("/devices/", params={"fields": "id,status"}).json()
+
+        assert devices[1] == {"id": "l-1", "status": "on"}
+        assert cache.stats()["hits"] == 2
+    finally:
+        disable_device_cache(broker)
+
+
+async def test_cache_is_bypassed_while_the_broker_is_disconnected(restartable_redis):
+    client = build_listener_client("127.0.0.1", restartable_redis.port)
+    broker = UpdateBroker(client)
+    await broker.start()
+    cache = enable_device_cache(broker)
+
+    async def wait_for(condition):
+        deadline = time.monotonic() + 5
+        while not condition():
+            assert time.monotonic() < deadline
+            await asyncio.sleep(0.05)
+
+    try:
+        cache.put(make_device("a"), cache.generation)
+
+        await restartable_redis.stop()
+        await wait_for(lambda: cache.bypassed)
+        assert cache.get("a") is None
+        assert cache.put(make_device("a", "stale"), cache.generation) is False
+
+        await restartable_redis.start()
+        await wait_for(lambda: not cache.bypassed)
+        assert cache.get("a") is None
+        assert cache.put(make_device("a"), cache.generation) is True
+    finally:
+        disable_device_cache(broker)
+        await broker.stop()
+        await client.aclose()
@@ -0,0 +1,132 @@
+import pytest
+from starlette.testclient import TestClient
+from src.services import device_registry
+from src.services.device_registry import save_devices, rebuild_registry
+from src.services.device_service import list_devices
+from src.services.device_store import RedisDeviceStore
+from src.services.fleet_generator import write_fleet
+
+
+FLEET = [
+    {"id": f"dev-{i:02d}", "name": f"Device {i}", "type": t, "status": s, "online": o}
+    for i, (t, s, o) in enumerate([
+        ("thermostat", "active", True),
+        ("thermostat", "idle", False),
+        ("light", "on", True),
+        ("thermostat", "active", True),
+        ("light", "off", False),
+        ("camera", "recording", True),
+        ("thermostat", "active", False),
+    ])
+]
+
+
+@pytest.fixture(scope="function")
+async def fleet(redis_client):
+    await save_devices(redis_client, FLEET)
+    return FLEET
+
+
+def _page_through(app_client: TestClient, params: dict):
+    ids, cursor, pages = [], None, 0
+    while True:
+        query = dict(params, **({"cursor": cursor} if cursor else {}))
+        response = app_client.get("/devices/", params=query)
+        assert response.status_code == 200
+        ids.extend(d["id"] for d in response.json())
+        pages += 1
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            return ids, pages
+
+
+async def test_pagination_returns_every_device_once(app_client: TestClient, fleet):
+    ids, pages = _page_through(app_client, {"limit": 3})
+
+    assert ids == [d["id"] for d in fleet]
+    assert pages == 3
+
+
+async def test_small_page_reads_about_one_page_of_hashes(redis_client, monkeypatch):
+    await write_fleet(redis_client, 2000, seed=1)
+    reads = []
+    get_many = RedisDeviceStore.get_many
+
+    async def counting_get_many(self, device_ids, fields=None):
+        reads.append(len(device_ids))
+        return await get_many(self, device_ids, fields)
+
+    monkeypatch.setattr(RedisDeviceStore, "get_many", counting_get_many)
+
+    page, cursor = await list_devices(redis_client, limit=1)
+    assert len(page) == 1 and cursor is not None
+    assert reads == [2]
+
+    reads.clear()
+    page, cursor = await list_devices(redis_client, filters={"type": "light"}, limit=10, cursor=cursor)
+    assert len(page) == 10 and sum(reads) <= 11
+
+
+async def test_filters_use_indexes(app_client: TestClient, fleet):
+    response = app_client.get("/devices/", params={"type": "thermostat", "online": "true"})
+
+    assert response.status_code == 200
+    assert [d["id"] for d in response.json()] == ["dev-00", "dev-03"]
+
+
+async def test_filtered_pagination(app_client: TestClient, fleet):
+    ids, _ = _page_through(app_client, {"type": "thermostat", "status": "active", "limit": 1})
+
+    assert ids == ["dev-00", "dev-03", "dev-06"]
+
+
+async def test_field_projection(app_client: TestClient, fleet):
+    response = app_client.get("/devices/", params={"fields": "id,online", "limit": 2})
+
+    assert response.status_code == 200
+    assert response.json() == [{"id": "dev-00", "online": True}, {"id": "dev-01", "online": False}]
+    assert response.headers.get("X-Next-Cursor")
+
+
+async def test_unknown_field_and_bad_cursor_are_rejected(app_client: TestClient, fleet):
+    assert app_client.get("/devices/", params={"fields": "id,secret"}).status_code == 400
+    assert app_client.get("/devices/", params={"cursor": "%%%"}).status_code == 400
+
+
+async def test_command_moves_device_between_indexes(app_client: TestClient, fleet):
+    app_client.post("/devices/dev-02/command", json={"status": "off", "online": False})
+
+    response = app_client.get("/devices/", params={"type": "light", "status": "off"})
+    assert [d["id"] for d in response.json()] == ["dev-02", "dev-04"]
+
+    response = app_client.get("/devices/", params={"status": "on"})
+    assert response.json() == []
+
+
+async def test_rebuild_registry_rebuilds_indexes(app_client: TestClient, redis_client, fleet):
+    await redis_client.delete("devices:index:type:camera")
+    await redis_client.zadd("devices:index:status:bogus", {"dev-00": 0})
+
+    await rebuild_registry(redis_client)
+
+    assert await redis_client.zrange("devices:index:type:camera", 0, -1) == ["dev-05"]
+    assert not await redis_client.exists("devices:index:status:bogus")
+
+
+async def test_rebuild_registry_keeps_indexes_queryable(redis_client, fleet, monkeypatch):
+    await redis_client.hset("device:dev-03", "status", "idle")
+    seen = []
+    fetch = device_registry._fetch_indexed_fields
+
+    async def observing_fetch(r, device_ids):
+        seen.append(await redis_client.zrange("devices:index:status:active", 0, -1))
+        return await fetch(r, device_ids)
+
+    monkeypatch.setattr(device_registry, "_fetch_indexed_fields", observing_fetch)
+
+    result = await rebuild_registry(redis_client)
+
+    assert seen == [["dev-00", "dev-03", "dev-06"]]
+    assert result["pruned"] == 1
+    assert await redis_client.zrange("devices:index:status:active", 0, -1) == ["dev-00", "dev-06"]
+    assert await redis_client.zrange("devices:index:status:idle", 0, -1) == ["dev-01", "dev-03"]
@@ -0,0 +1,82 @@
+import io
+import json
+import pytest
+from src.services.device_registry import save_devices
+from src.services.device_snapshot import (
+    iter_json_array,
+    iter_ndjson,
+    iter_device_records,
+    clear_devices,
+    import_devices,
+    export_devices,
+)
+from src.utils import DEVICE_REGISTRY_KEY, device_index_key
+
+
+def make_devices(count):
+    return [
+        {"id": f"snap-{i:04d}", "name": f"Device {i}", "type": "light", "status": "on", "online": i % 2 == 0}
+        for i in range(count)
+    ]
+
+
+def test_iter_json_array_reads_across_chunk_boundaries():
+    devices = make_devices(50)
+    stream = io.StringIO(json.dumps(devices, indent=2))
+
+    assert list(iter_json_array(stream, read_size=7)) == devices
+
+
+def test_iter_json_array_rejects_non_list():
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.StringIO('{"id": "x"}')))
+
+
+@pytest.mark.parametrize("suffix", [".json", ".ndjson"])
+def test_iter_device_records_detects_format(tmp_path, suffix):
+    devices = make_devices(5)
+    path = tmp_path / f"devices{suffix}"
+    if suffix == ".json":
+        path.write_text(json.dumps(devices))
+    else:
+        path.write_text("\n".join(json.dumps(d) for d in devices) + "\n")
+
+    assert list(iter_device_records(path)) == devices
+
+
+async def test_import_devices_in_chunks(redis_client):
+    saved = await import_devices(redis_client, iter(make_devices(25)), chunk_size=10, replace_existing=False)
+
+    assert saved == 25
+    assert await redis_client.zcard(DEVICE_REGISTRY_KEY) == 25
+    assert await redis_client.zcard(device_index_key("online", "true")) == 13
+
+
+async def test_clear_devices_removes_all_device_keys(redis_client):
+    await save_devices(redis_client, make_devices(12))
+    await redis_client.set("unrelated", "1")
+
+    deleted = await clear_devices(redis_client, batch_size=5)
+
+    assert deleted > 12
+    assert await redis_client.keys("device*") == []
+    assert await redis_client.get("unrelated") == "1"
+
+
+async def test_export_then_import_round_trip(redis_client):
+    devices = make_devices(30)
+    await save_devices(redis_client, devices)
+
+    out = io.StringIO()
+    exported = await export_devices(redis_client, out, batch_size=7)
+    lines = out.getvalue().splitlines()
+
+    assert exported == 30
+    assert [json.loads(line)["id"] for line in lines] == [d["id"] for d in devices]
+
+    await clear_devices(redis_client)
+    out.seek(0)
+    assert await import_devices(redis_client, iter_ndjson(out), chunk_size=8) == 30
+    assert await redis_client.hgetall("device:snap-0003") == {
+        "name": "Device 3", "type": "light", "status": "on", "online": "false"
+    }
@@ -0,0 +1,184 @@
+import asyncio
+import json
+import time
+import pytest
+from starlette.testclient import TestClient
+from src.app import app
+from src.config import DEVICE_COMMAND_CHANNEL
+from src.services import device_events, device_store
+from src.services.device_events import UPDATE_APPLIED, UPDATE_IDEMPOTENT, UPDATE_NOT_FOUND, UpdateConflict
+from src.services.device_service import list_devices
+from src.services.device_store import RedisDeviceStore, get_device_store
+from src.services.memory_store import MemoryDeviceStore
+from src.utils import device_updates_channel
+
+
+DEVICES = [
+    {"id": "dev-1", "name": "Lamp", "type": "light", "status": "on", "online": True},
+    {"id": "dev-2", "name": "Door", "type": "lock", "status": "locked", "online": True},
+    {"id": "dev-3", "name": "Lamp", "type": "light", "status": "off", "online": False},
+    {"id": "dev-4", "name": "Lamp", "type": "light", "status": "on", "online": True},
+]
+
+
+@pytest.fixture(params=["redis", "memory"])
+async def store(request, redis_client):
+    store = RedisDeviceStore(redis_client) if request.param == "redis" else MemoryDeviceStore()
+    await store.save_devices(DEVICES)
+    return store
+
+
+async def _collect(batches):
+    return [device_id async for batch in batches for device_id in batch]
+
+
+async def test_reads_and_filtered_batches(store):
+    assert (await store.get("dev-1"))["status"] == "on"
+    assert await store.get("missing") == {}
+    assert await store.exists("dev-2") and not await store.exists("missing")
+    assert await store.get_many(["dev-2", "missing"], fields=["type"]) == [{"type": "lock"}, {}]
+
+    assert await _collect(store.iter_batches(batch_size=3)) == ["dev-1", "dev-2", "dev-3", "dev-4"]
+    assert await _collect(store.iter_batches({"type": "light", "online": "true"}, batch_size=1)) == ["dev-1", "dev-4"]
+    assert await _collect(store.iter_batches({"type": "light"}, after="dev-1")) == ["dev-3", "dev-4"]
+    assert await _collect(store.iter_batches({"type": "fridge"})) == []
+
+
+async def test_update_statuses_reindex_and_history(store):
+    applied = await store.apply_update("dev-1", {"status": "off"}, "2024-01-01T00:00:00")
+    repeated = await store.apply_update("dev-1", {"status": "off"}, "2024-01-01T00:00:01")
+    missing = await store.apply_update("missing", {"status": "off"}, "2024-01-01T00:00:02")
+
+    assert (applied.status, applied.history_length) == (UPDATE_APPLIED, 1)
+    assert repeated.status == UPDATE_IDEMPOTENT
+    assert missing.status == UPDATE_NOT_FOUND
+    assert await _collect(store.iter_batches({"status": "off"})) == ["dev-1", "dev-3"]
+
+    await store.apply_update("dev-1", {"status": "on", "name": "Desk lamp"}, "2024-01-01T00:00:03")
+    history = await store.history("dev-1")
+    assert [changes for _, changes in history] == [{"status": "on", "name": "Desk lamp"}, {"status": "off"}]
+    assert [changes for _, changes in await store.history("dev-1", order="asc", limit=1)] == [{"status": "off"}]
+    assert await store.history("dev-2") == []
+    assert await store.history("missing") is None
+
+
+async def test_bulk_updates_and_deletes(store):
+    results = await store.apply_updates(
+        [("dev-1", {"status": "off"}), ("missing", {"status": "off"}), ("dev-3", {"status": "off"})],
+        "2024-01-01T00:00:00",
+    )
+
+    assert [result.status for result in results] == [UPDATE_APPLIED, UPDATE_NOT_FOUND, UPDATE_IDEMPOTENT]
+    assert await store.delete_devices(["dev-1", "missing"]) == 1
+    assert await _collect(store.iter_batches({"status": "off"})) == ["dev-3"]
+
+
+async def test_batches_stay_in_id_order_across_changes(store):
+    await store.delete_devices(["dev-2"])
+    await store.save_devices([
+        {"id": "dev-0", "name": "Fan", "type": "light", "status": "on", "online": True},
+        {"id": "dev-25", "name": "Fan", "type": "light", "status": "on", "online": True},
+    ])
+    await store.apply_update("dev-3", {"status": "on"}, "2024-01-01T00:00:00")
+
+    assert await _collect(store.iter_batches(batch_size=2)) == ["dev-0", "dev-1", "dev-25", "dev-3", "dev-4"]
+    assert await _collect(store.iter_batches({"status": "on"}, after="dev-1")) == ["dev-25", "dev-3", "dev-4"]
+    assert await _collect(store.iter_batches({"status": "off"})) == []
+
+
+async def test_update_racing_an_index_change_is_retried(redis_client, monkeypatch):
+    store = RedisDeviceStore(redis_client)
+    await store.save_devices(DEVICES)
+    read_indexed_values = device_events._read_indexed_values
+    reads = []
+
+    async def racing_read(r, updates):
+        values = await read_indexed_values(r, updates)
+        reads.append(values)
+        if len(reads) == 1:
+            # another writer changes the status after it was read
+            await store.apply_update("dev-1", {"status": "standby"}, "2024-01-01T00:00:00")
+        return values
+
+    monkeypatch.setattr(device_events, "_read_indexed_values", racing_read)
+    result = await store.apply_update("dev-1", {"status": "off"}, "2024-01-01T00:00:01")
+
+    assert result.status == UPDATE_APPLIED
+    assert [values[0]["status"] for values in reads] == ["on", "on", "standby"]
+    assert await _collect(store.iter_batches({"status": "off"})) == ["dev-1", "dev-3"]
+    assert await _collect(store.iter_batches({"status": "standby"})) == []
+    assert await _collect(store.iter_batches({"status": "on"})) == ["dev-4"]
+
+
+async def test_update_racing_index_changes_gives_up(redis_client, monkeypatch):
+    store = RedisDeviceStore(redis_client)
+    await store.save_devices(DEVICES)
+    read_indexed_values = device_events._read_indexed_values
+    statuses = iter(f"s{i}" for i in range(100))
+    reads = []
+
+    async def always_racing_read(r, updates):
+        values = await read_indexed_values(r, updates)
+        reads.append(values)
+        await redis_client.hset("device:dev-1", "status", next(statuses))
+        return values
+
+    monkeypatch.setattr(device_events, "_read_indexed_values", always_racing_read)
+
+    with pytest.raises(UpdateConflict):
+        await store.apply_update("dev-1", {"status": "off"}, "2024-01-01T00:00:01")
+    assert len(reads) == device_events._MAX_UPDATE_ATTEMPTS
+
+    results = await store.apply_updates([("dev-1", {"status": "off"})], "2024-01-01T00:00:02")
+    assert isinstance(results[0], UpdateConflict)
+
+
+async def test_updates_are_published(store):
+    pubsub = store.pubsub()
+    await pubsub.psubscribe("device:updates:*")
+    await pubsub.subscribe(DEVICE_COMMAND_CHANNEL)
+    # drain the subscribe confirmations
+    for _ in range(2):
+        await pubsub.get_message(timeout=1.0)
+
+    result = await store.apply_update("dev-2", {"status": "unlocked"}, "2024-01-01T00:00:00")
+    messages = [await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0) for _ in range(2)]
+    await pubsub.aclose()
+
+    assert result.subscribers == 1
+    assert sorted(m["channel"] for m in messages) == sorted([device_updates_channel("dev-2"), DEVICE_COMMAND_CHANNEL])
+    event = json.loads(messages[0]["data"])
+    assert (event["device_id"], event["updated_fields"]) == ("dev-2", {"status": "unlocked"})
+
+
+async def test_services_run_on_either_store(store):
+    devices, next_cursor = await list_devices(store, filters={"type": "light"}, limit=2)
+
+    assert [device.id for device in devices] == ["dev-1", "dev-3"]
+    assert next_cursor is not None
+
+
+def test_app_on_the_memory_backend(monkeypatch):
+    monkeypatch.setattr(device_store, "STORAGE_BACKEND", "memory")
+    monkeypatch.setenv("ENABLE_PUBSUB", "true")
+
+    with TestClient(app) as client:
+        store = get_device_store()
+        assert isinstance(store, MemoryDeviceStore)
+        client.portal.call(store.save_devices, DEVICES)
+
+        assert client.post("/devices/dev-2/command", json={"status": "unlocked"}).status_code == 200
+        assert client.get("/devices/dev-2").json()["status"] == "unlocked"
+        assert [d["id"] for d in client.get("/devices/", params={"type": "light", "online": True}).json()] == ["dev-1", "dev-4"]
+
+        # commands published on the command channel reach the in-process listener
+        command = json.dumps({"device_id": "dev-3", "command": {"online": True}})
+        client.portal.call(store.publish, DEVICE_COMMAND_CHANNEL, command)
+        deadline = time.monotonic() + 2
+        while client.get("/devices/dev-3").json()["online"] is not True and time.monotonic() < deadline:
+            client.portal.call(asyncio.sleep, 0.01)
+
+        assert client.get("/devices/dev-3").json()["online"] is True
+        assert len(client.get("/devices/dev-3/history").json()) == 1
+
+    assert get_device_store() is None
@@ -0,0 +1,48 @@
+import json
+from starlette.testclient import TestClient
+from src.serialization import aiter_json_array
+from src.services.device_store import RedisDeviceStore
+from src.services.device_service import stream_devices
+from src.services.fleet_generator import write_fleet, generate_fleet
+
+
+async def test_stream_devices_as_json_array_and_ndjson(app_client: TestClient, redis_client):
+    await write_fleet(redis_client, 1200, seed=3)
+    expected = [device["id"] for device in generate_fleet(1200, seed=3)]
+
+    array = app_client.get("/devices/", params={"stream": True})
+    ndjson = app_client.get("/devices/", params={"stream": True}, headers={"Accept": "application/x-ndjson"})
+
+    assert array.status_code == 200
+    assert [d["id"] for d in array.json()] == expected
+    assert [json.loads(line)["id"] for line in ndjson.text.splitlines()] == expected
+
+
+async def test_stream_honours_filters_projection_and_limit(app_client: TestClient, redis_client):
+    await write_fleet(redis_client, 300, seed=4)
+    locks = [d["id"] for d in generate_fleet(300, seed=4) if d["type"] == "lock"]
+
+    response = app_client.get("/devices/", params={"stream": True, "type": "lock", "fields": "id", "limit": 5})
+
+    assert response.json() == [{"id": device_id} for device_id in locks[:5]]
+    assert app_client.get("/devices/", params={"stream": True, "cursor": "###"}).status_code == 400
+
+
+async def test_closing_the_stream_stops_redis_reads(redis_client, monkeypatch):
+    await write_fleet(redis_client, 500, seed=5)
+    reads = []
+    fetch = RedisDeviceStore.get_many
+
+    async def counting_fetch(store, device_ids, fields=None):
+        reads.append(len(device_ids))
+        return await fetch(store, device_ids, fields)
+
+    monkeypatch.setattr(RedisDeviceStore, "get_many", counting_fetch)
+
+    body = aiter_json_array(stream_devices(redis_client, batch_size=100))
+    assert await body.__anext__() == b"["
+    await body.__anext__()
+    # the client went away after the first batch
+    await body.aclose()
+
+    assert reads == [100]
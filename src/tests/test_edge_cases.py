@@ -1,4 +1,5 @@
 from starlette.testclient import TestClient
+from src.services.device_registry import register_devices
 
 
 async def test_send_command_with_empty_payload(app_client, redis_client):
@@ -42,6 +43,7 @@ async def test_get_devices_handles_corrupted_data(app_client: TestClient, redis_
         "status": "ready",
         "online": "true"
     })
+    await register_devices(redis_client, ["corrupt-001", "valid-002"])
 
     response = app_client.get("/devices")
 
@@ -0,0 +1,38 @@
+import io
+import json
+from collections import Counter
+from src.services.fleet_generator import generate_fleet, write_fleet, write_fleet_ndjson, DEFAULT_STATUS_WEIGHTS
+from src.utils import DEVICE_REGISTRY_KEY, device_index_key
+
+
+def test_generate_fleet_is_deterministic():
+    assert list(generate_fleet(200, seed=7)) == list(generate_fleet(200, seed=7))
+    assert list(generate_fleet(200, seed=7)) != list(generate_fleet(200, seed=8))
+
+
+def test_generate_fleet_follows_distribution():
+    fleet = list(generate_fleet(5000, seed=1, type_weights={"light": 3, "lock": 1}, online_ratio=0.5))
+    types = Counter(device["type"] for device in fleet)
+
+    assert len({device["id"] for device in fleet}) == 5000
+    assert set(types) == {"light", "lock"}
+    assert 0.7 < types["light"] / len(fleet) < 0.8
+    assert 0.45 < sum(device["online"] for device in fleet) / len(fleet) < 0.55
+    assert all(device["status"] in DEFAULT_STATUS_WEIGHTS[device["type"]] for device in fleet)
+
+
+def test_write_fleet_ndjson_matches_generator():
+    out = io.StringIO()
+
+    assert write_fleet_ndjson(out, 20, seed=3) == 20
+    assert [json.loads(line) for line in out.getvalue().splitlines()] == list(generate_fleet(20, seed=3))
+
+
+async def test_write_fleet_populates_registry_and_indexes(redis_client):
+    fleet = list(generate_fleet(300, seed=5))
+
+    assert await write_fleet(redis_client, 300, seed=5, chunk_size=64) == 300
+    assert await redis_client.zcard(DEVICE_REGISTRY_KEY) == 300
+
+    locks = sum(device["type"] == "lock" for device in fleet)
+    assert await redis_client.zcard(device_index_key("type", "lock")) == locks
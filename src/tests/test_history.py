@@ -0,0 +1,105 @@
+import json
+import time
+from datetime import datetime, timedelta, timezone
+from starlette.testclient import TestClient
+from src.services import device_events
+
+
+async def _send(app_client, device_id, statuses):
+    for status in statuses:
+        assert app_client.post(f"/devices/{device_id}/command", json={"status": status}).status_code == 200
+
+
+async def test_history_endpoint_returns_newest_first(app_client: TestClient, redis_client):
+    await redis_client.hset("device:h1", mapping={"status": "s0", "online": "true"})
+    await _send(app_client, "h1", ["s1", "s2", "s3"])
+
+    response = app_client.get("/devices/h1/history")
+
+    assert response.status_code == 200
+    entries = response.json()
+    assert [e["changes"] for e in entries] == [{"status": "s3"}, {"status": "s2"}, {"status": "s1"}]
+    assert all(isinstance(e["timestamp"], int) for e in entries)
+
+    response = app_client.get("/devices/h1/history", params={"order": "asc", "limit": 2})
+    assert [e["changes"]["status"] for e in response.json()] == ["s1", "s2"]
+
+
+async def test_history_time_range(app_client: TestClient, redis_client):
+    await redis_client.hset("device:h2", mapping={"status": "s0"})
+    await redis_client.xadd("device:history:h2", {"status": "old"}, id="1000-0")
+    await redis_client.xadd("device:history:h2", {"status": "mid"}, id="2000-0")
+    await redis_client.xadd("device:history:h2", {"status": "new"}, id="3000-0")
+
+    response = app_client.get("/devices/h2/history", params={"since": 1500, "until": 3000})
+
+    assert [(e["timestamp"], e["changes"]["status"]) for e in response.json()] == [(3000, "new"), (2000, "mid")]
+
+
+async def test_history_stores_only_changed_fields(app_client: TestClient, redis_client):
+    await redis_client.hset("device:h3", mapping={"status": "on", "online": "true"})
+
+    app_client.post("/devices/h3/command", json={"status": "on", "online": False})
+
+    history = await redis_client.xrange("device:history:h3")
+    assert [fields for _, fields in history] == [{"online": "false"}]
+
+
+async def test_history_is_capped_by_count(app_client: TestClient, redis_client, monkeypatch):
+    monkeypatch.setattr(device_events, "HISTORY_MAX_ENTRIES", 3)
+    await redis_client.hset("device:h4", mapping={"status": "s0"})
+
+    await _send(app_client, "h4", [f"s{i}" for i in range(1, 8)])
+
+    history = await redis_client.xrange("device:history:h4")
+    assert [fields["status"] for _, fields in history] == ["s5", "s6", "s7"]
+
+
+async def test_history_is_capped_by_age(app_client: TestClient, redis_client, monkeypatch):
+    monkeypatch.setattr(device_events, "HISTORY_MAX_AGE_SECONDS", 60)
+    await redis_client.hset("device:h5", mapping={"status": "s0"})
+    stale_ms = int(time.time() * 1000) - 120_000
+    await redis_client.xadd("device:history:h5", {"status": "stale"}, id=f"{stale_ms}-0")
+
+    await _send(app_client, "h5", ["fresh"])
+
+    history = await redis_client.xrange("device:history:h5")
+    assert [fields["status"] for _, fields in history] == ["fresh"]
+
+
+async def test_age_cap_follows_the_redis_clock(app_client: TestClient, redis_client, monkeypatch):
+    monkeypatch.setattr(device_events, "HISTORY_MAX_AGE_SECONDS", 60)
+    await redis_client.hset("device:h7", mapping={"status": "s0"})
+    await _send(app_client, "h7", ["s1"])
+
+    # an app host whose clock runs an hour ahead must not trim fresh entries
+    host_time = time.time
+    monkeypatch.setattr(time, "time", lambda: host_time() + 3600)
+    await _send(app_client, "h7", ["s2"])
+
+    history = await redis_client.xrange("device:history:h7")
+    assert [fields["status"] for _, fields in history] == ["s1", "s2"]
+
+
+async def test_legacy_list_history_is_migrated(app_client: TestClient, redis_client):
+    await redis_client.hset("device:h6", mapping={"status": "s0"})
+    now = datetime.now(timezone.utc)
+    await redis_client.rpush(
+        "device:history:h6",
+        json.dumps({"timestamp": (now - timedelta(minutes=2)).isoformat(), "command": {"status": "s0"}}),
+        json.dumps({"timestamp": (now - timedelta(minutes=1)).isoformat(), "command": {"online": "true"}}),
+        "not json",
+    )
+
+    await _send(app_client, "h6", ["s1"])
+
+    assert await redis_client.type("device:history:h6") == "stream"
+    entries = app_client.get("/devices/h6/history", params={"order": "asc"}).json()
+    assert [e["changes"] for e in entries] == [{"status": "s0"}, {"online": "true"}, {"status": "s1"}]
+    assert entries[0]["timestamp"] == int((now - timedelta(minutes=2)).timestamp() * 1000)
+
+
+def test_history_of_unknown_device(app_client: TestClient):
+    response = app_client.get("/devices/nope/history")
+
+    assert response.status_code == 404
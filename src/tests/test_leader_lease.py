@@ -0,0 +1,109 @@
+import asyncio
+import time
+from starlette.testclient import TestClient
+from src import app as app_module
+from src.app import app
+from src.config import LEADER_KEY
+from src.infrastructure.leader_lease import Leadership, leadership_stats
+
+LEASE = 0.3
+
+
+async def _wait_for(condition, timeout: float = 3.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not met in time"
+        await asyncio.sleep(0.01)
+
+
+def _worker(redis_client, running: list, name: str) -> Leadership:
+    async def job():
+        running.append(name)
+        try:
+            await asyncio.Future()
+        finally:
+            running.remove(name)
+
+    return Leadership(redis_client, job, key="test:leader", lease=LEASE)
+
+
+async def test_one_leader_and_takeover_on_shutdown(redis_client):
+    running = []
+    workers = [_worker(redis_client, running, name) for name in ("a", "b", "c")]
+    tasks = [asyncio.create_task(worker.run()) for worker in workers]
+
+    await _wait_for(lambda: running)
+    await asyncio.sleep(LEASE * 2)
+    assert len(running) == 1
+    leader = next(i for i, worker in enumerate(workers) if worker.leader)
+    assert await redis_client.get("test:leader") == workers[leader].token
+
+    # a stopping leader releases the lease, a standby takes over within one retry interval
+    tasks[leader].cancel()
+    await asyncio.gather(tasks[leader], return_exceptions=True)
+    await _wait_for(lambda: len(running) == 1, timeout=LEASE * 3)
+    assert not workers[leader].leader and workers[leader].elections_won == 1
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    assert running == []
+    assert await redis_client.get("test:leader") is None
+
+
+async def test_leader_that_loses_the_lease_stops_its_job(redis_client):
+    running = []
+    worker = _worker(redis_client, running, "a")
+    task = asyncio.create_task(worker.run())
+    await _wait_for(lambda: running)
+
+    # e.g. the process stalled past the lease and another worker took over
+    await redis_client.set("test:leader", "someone-else")
+    await _wait_for(lambda: not running)
+
+    assert worker.leases_lost == 1
+    assert await redis_client.get("test:leader") == "someone-else"
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+
+async def test_failed_job_is_restarted(redis_client):
+    attempts = []
+
+    async def job():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("listener crashed")
+        await asyncio.Future()
+
+    worker = Leadership(redis_client, job, key="test:leader", lease=LEASE)
+    task = asyncio.create_task(worker.run())
+    await _wait_for(lambda: len(attempts) == 2)
+
+    assert worker.stats()["job_failures"] == 1
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+
+def test_app_elects_a_leader_for_the_command_listener(monkeypatch):
+    monkeypatch.setenv("ENABLE_PUBSUB", "true")
+
+    with TestClient(app) as client:
+        deadline = time.monotonic() + 3
+        while not client.get("/admin/leader").json().get("leader") and time.monotonic() < deadline:
+            client.portal.call(asyncio.sleep, 0.01)
+
+        stats = client.get("/admin/leader").json()
+        assert stats["coordinated"] and stats["leader"] and stats["key"] == LEADER_KEY
+
+    assert leadership_stats() == {"coordinated": False}
+
+
+def test_reload_is_turned_off_for_several_workers(monkeypatch):
+    monkeypatch.setattr(app_module, "APP_RELOAD", True)
+    monkeypatch.setattr(app_module, "APP_WORKERS", 4)
+    assert app_module.server_options()["reload"] is False
+    assert app_module.server_options()["workers"] == 4
+
+    monkeypatch.setattr(app_module, "APP_WORKERS", 1)
+    assert app_module.server_options()["reload"] is True
@@ -0,0 +1,90 @@
+import json
+import os
+import pytest
+from src.scripts.load_test import LatencyRecorder, compare_to_baseline, open_client, run_load
+from src.scripts.worker_scaling import measure, scaling_table
+from src.services.fleet_generator import generate_fleet, write_fleet
+
+
+def test_latency_recorder_percentiles():
+    recorder = LatencyRecorder()
+    for ms in range(1, 1001):
+        recorder.record(ms / 1000, ok=ms % 100 != 0)
+
+    summary = recorder.summary(elapsed=2.0)
+
+    assert summary["count"] == 1000
+    assert summary["errors"] == 10
+    assert summary["rps"] == 500
+    assert summary["p50_ms"] == pytest.approx(500)
+    assert summary["p99_ms"] == pytest.approx(990)
+    assert summary["p999_ms"] == pytest.approx(999)
+    assert sum(summary["histogram_ms"].values()) == 1000
+
+
+def test_compare_to_baseline_flags_regressions():
+    baseline = {"overall": {"rps": 1000, "p99_ms": 10}, "operations": {"get": {"rps": 500, "p99_ms": 5}}}
+    results = {"overall": {"rps": 950, "p99_ms": 11}, "operations": {"get": {"rps": 300, "p99_ms": 8}}}
+
+    regressions = compare_to_baseline(results, baseline, tolerance=0.2)
+
+    assert len(regressions) == 2
+    assert all(regression.startswith("get:") for regression in regressions)
+
+
+async def test_run_load_in_process(redis_client):
+    await write_fleet(redis_client, 200, seed=1)
+    device_ids = [device["id"] for device in generate_fleet(200, seed=1)]
+
+    async with open_client("asgi") as client:
+        results = await run_load(client, device_ids, concurrency=4, requests=60, duration=None)
+
+    assert results["overall"]["count"] == 60
+    assert results["overall"]["errors"] == 0
+    assert sum(op["count"] for op in results["operations"].values()) == 60
+
+
+@pytest.mark.performance
+async def test_load_against_baseline(redis_client):
+    baseline_path = os.getenv("LOADTEST_BASELINE")
+    if not baseline_path or not os.path.exists(baseline_path):
+        pytest.skip("Skipping: LOADTEST_BASELINE is not set")
+
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+
+    size = baseline.get("fleet_size", 10000)
+    await write_fleet(redis_client, size, seed=42)
+    device_ids = [device["id"] for device in generate_fleet(size, seed=42)]
+
+    async with open_client("asgi") as client:
+        results = await run_load(client, device_ids, concurrency=baseline.get("concurrency", 32), duration=10)
+
+    assert compare_to_baseline(results, baseline) == []
+
+
+def test_scaling_table_speedup_and_efficiency():
+    results = scaling_table([{"workers": 1, "rps": 1000}, {"workers": 2, "rps": 1900}, {"workers": 4, "rps": 3000}])
+
+    assert [r["speedup"] for r in results] == pytest.approx([1, 1.9, 3])
+    assert [r["efficiency"] for r in results] == pytest.approx([1, 0.95, 0.75])
+
+
+@pytest.mark.performance
+async def test_worker_scaling(redis_client):
+    counts = os.getenv("PERF_WORKER_COUNTS")
+    if not counts:
+        pytest.skip("Skipping: PERF_WORKER_COUNTS is not set, e.g. 1,2,4")
+
+    await write_fleet(redis_client, 10000, seed=42)
+    device_ids = [device["id"] for device in generate_fleet(10000, seed=42)]
+    # scaling is measured on HTTP handling; one elected worker consumes commands
+    results = scaling_table([
+        measure(int(workers), device_ids, duration=float(os.getenv("PERF_WORKER_DURATION", "10")))
+        for workers in counts.split(",")
+    ])
+
+    for result in results:
+        print(f"\n{result['workers']} workers: {result['rps']:.0f} req/s, efficiency {result['efficiency']:.2f}")
+    assert all(result["errors"] == 0 for result in results)
+    assert results[-1]["efficiency"] >= float(os.getenv("PERF_MIN_SCALING_EFFICIENCY", "0.7"))
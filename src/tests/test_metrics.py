@@ -0,0 +1,52 @@
+from starlette.testclient import TestClient
+from src.infrastructure import metrics
+from src.services.device_registry import save_devices
+
+
+DEVICE = {"id": "metrics-1", "name": "Lamp", "type": "light", "status": "on", "online": True}
+
+
+def test_metrics_endpoint_uses_prometheus_text_format(app_client: TestClient):
+    response = app_client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == metrics.CONTENT_TYPE
+    assert "# TYPE http_request_duration_seconds histogram" in response.text
+    assert "# TYPE redis_commands counter" in response.text
+
+
+async def test_route_latency_is_labelled_by_route_template(app_client: TestClient, redis_client):
+    await save_devices(redis_client, [DEVICE])
+    before = metrics.HTTP_LATENCY.count(("GET", "/devices/{device_id}"))
+
+    assert app_client.get("/devices/metrics-1").status_code == 200
+    assert app_client.get("/devices/metrics-missing").status_code == 404
+
+    assert metrics.HTTP_LATENCY.count(("GET", "/devices/{device_id}")) == before + 2
+    body = app_client.get("/metrics").text
+    assert 'http_requests_total{method="GET",route="/devices/{device_id}",status="404"}' in body
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/devices/{device_id}",le="+Inf"}' in body
+    assert "metrics-missing" not in body
+
+
+async def test_redis_round_trips_are_counted_per_command(app_client: TestClient, redis_client):
+    await save_devices(redis_client, [DEVICE])
+    hgetall = metrics.REDIS_COMMANDS.value(("HGETALL",))
+    evalsha = metrics.REDIS_COMMANDS.value(("EVALSHA",))
+    applied = metrics.DEVICE_UPDATES.value(("applied",))
+
+    app_client.get("/devices/metrics-1")
+    app_client.post("/devices/metrics-1/command", json={"status": "off"})
+
+    assert metrics.REDIS_COMMANDS.value(("HGETALL",)) == hgetall + 1
+    assert metrics.REDIS_COMMANDS.value(("EVALSHA",)) >= evalsha + 1
+    assert metrics.DEVICE_UPDATES.value(("applied",)) == applied + 1
+
+
+def test_component_stats_are_exposed_as_gauges(app_client: TestClient):
+    body = app_client.get("/metrics").text
+
+    assert "redis_pool_in_use " in body
+    assert "redis_pool_max_connections " in body
+    assert "command_listener_running " in body
+    assert "update_broker_running " in body
@@ -1,4 +1,32 @@
+import asyncio
+import itertools
+import json
+import time
+import tracemalloc
 import pytest
+import redis.asyncio as aioredis
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from redis.asyncio.connection import Connection
+from src.config import DB_HOST, DB_PORT, DEVICE_COMMAND_CHANNEL, REDIS_DB
+from src.infrastructure.metrics import (
+    HTTP_LATENCY,
+    HTTP_REQUESTS,
+    MetricsMiddleware,
+    REDIS_COMMANDS,
+    REDIS_LATENCY,
+)
+from src.infrastructure.profiling import STAGE_REDIS, STAGE_SERIALIZATION, current_profile, record_stage, timed
+from src.models import Device
+from src.serialization import aiter_json_array, encode
+from src.services.device_events import apply_device_update
+from src.services.device_service import fetch_device, apply_command, list_devices, stream_devices
+from src.services.device_registry import save_devices
+from src.services.device_store import RedisDeviceStore
+from src.services.fleet_generator import generate_fleet, write_fleet
+from src.services.memory_store import MemoryDeviceStore
+from src.utils import device_updates_channel
 pytestmark = pytest.mark.performance
 
 def test_benchmark_get_devices_empty(app_client, benchmark):
@@ -43,4 +71,337 @@ def test_benchmark_get_device_not_found(app_client, benchmark):
 
     stats = benchmark.stats.stats
     assert stats.median < 0.03
-    assert stats.max < 0.08
\ No newline at end of file
+    assert stats.max < 0.08
+
+async def _legacy_apply_command(r, device_id, command):
+    # the pre-script sequence: EXISTS, HGETALL, HSET, RPUSH and two PUBLISH calls
+    if not await r.exists(f"device:{device_id}"):
+        return
+    current = await r.hgetall(f"device:{device_id}")
+    if all(current.get(k) == v for k, v in command.items()):
+        return
+    await r.hset(f"device:{device_id}", mapping=command)
+    length = await r.rpush(f"device:history:{device_id}", json.dumps({"timestamp": "t", "command": command}))
+    message = json.dumps({"device_id": device_id, "updated_fields": command, "history_length": length})
+    await r.publish(device_updates_channel(device_id), message)
+    await r.publish(DEVICE_COMMAND_CHANNEL, message)
+
+
+async def _legacy_fetch_device(r, device_id):
+    # the pre-change read: EXISTS, then HGETALL
+    if not await r.exists(f"device:{device_id}"):
+        return None
+    return await r.hgetall(f"device:{device_id}")
+
+
+@pytest.fixture
+def round_trips(monkeypatch):
+    """
+    Counts writes to Redis sockets; a pipeline or script call is one round trip.
+    """
+    counter = {"count": 0}
+    send = Connection.send_packed_command
+
+    async def counting_send(self, command, check_health=True):
+        counter["count"] += 1
+        return await send(self, command, check_health)
+
+    monkeypatch.setattr(Connection, "send_packed_command", counting_send)
+
+    async def measure(call):
+        counter["count"] = 0
+        try:
+            await call()
+        except HTTPException:
+            pass
+        return counter["count"]
+
+    return measure
+
+
+async def test_round_trips_single_device_paths(redis_client, round_trips):
+    await save_devices(redis_client, [
+        {"id": device_id, "name": "n", "type": "light", "status": "off", "online": True}
+        for device_id in ("rt-1", "rt-legacy")
+    ])
+    # load the script once so EVALSHA does not pay for a reload below
+    await apply_device_update(redis_client, "rt-1", {"status": "warmup"}, "t")
+
+    counts = {
+        "get legacy": await round_trips(lambda: _legacy_fetch_device(redis_client, "rt-1")),
+        "get": await round_trips(lambda: fetch_device(redis_client, "rt-1")),
+        "get missing legacy": await round_trips(lambda: _legacy_fetch_device(redis_client, "nope")),
+        "get missing": await round_trips(lambda: fetch_device(redis_client, "nope")),
+        "command legacy": await round_trips(lambda: _legacy_apply_command(redis_client, "rt-legacy", {"status": "a"})),
+        "command": await round_trips(lambda: apply_command(redis_client, "rt-1", {"name": "b"})),
+        "indexed command": await round_trips(lambda: apply_command(redis_client, "rt-1", {"status": "b"})),
+        "command missing": await round_trips(lambda: apply_command(redis_client, "nope", {"name": "b"})),
+    }
+
+    assert counts == {
+        "get legacy": 2,
+        "get": 1,
+        "get missing legacy": 1,
+        "get missing": 1,
+        "command legacy": 6,
+        "command": 1,
+        # the indexed values are read first to name their index keys
+        "indexed command": 2,
+        "command missing": 1,
+    }
+
+
+@pytest.fixture
+def own_loop_client():
+    """
+    A Redis client on a private event loop, for driving async code from the
+    synchronous benchmark fixture.
+    """
+    loop = asyncio.new_event_loop()
+    client = aioredis.Redis(host=DB_HOST, port=DB_PORT, db=REDIS_DB, decode_responses=True)
+    try:
+        yield loop, client
+    finally:
+        loop.run_until_complete(client.aclose())
+        loop.close()
+
+
+@pytest.mark.benchmark(group="command-script-vs-sequential")
+@pytest.mark.parametrize("path", ["sequential", "script"])
+def test_benchmark_script_vs_sequential_command(own_loop_client, benchmark, path):
+    loop, client = own_loop_client
+    loop.run_until_complete(client.hset("device:bench", mapping={"status": "normal", "online": "true"}))
+    statuses = itertools.cycle(("a", "b"))
+
+    if path == "script":
+        apply = lambda: apply_device_update(client, "bench", {"status": next(statuses)}, "t")
+    else:
+        apply = lambda: _legacy_apply_command(client, "bench", {"status": next(statuses)})
+
+    benchmark.pedantic(lambda: loop.run_until_complete(apply()), rounds=200, warmup_rounds=5)
+
+
+async def test_bulk_command_throughput(app_client, redis_client, benchmark):
+    fleet = [
+        {"id": f"perf-{i:05d}", "name": "n", "type": "sensor", "status": "idle", "online": True}
+        for i in range(2000)
+    ]
+    await save_devices(redis_client, fleet)
+    statuses = itertools.cycle(("active", "idle"))
+
+    def run():
+        response = app_client.post("/devices/commands", json={
+            "command": {"status": next(statuses)},
+            "selector": {"type": "sensor"},
+        })
+        assert response.status_code == 200
+        assert len(response.json()["applied"]) == len(fleet)
+
+    benchmark.pedantic(run, rounds=3, warmup_rounds=1)
+
+    benchmark.extra_info["updates_per_second"] = round(len(fleet) / benchmark.stats.stats.median)
+    # at least 200 updates/sec even on a slow CI host
+    assert benchmark.stats.stats.median < 10
+
+
+# ---------- scaling curves (fleet sizes from PERF_FLEET_SIZES) ----------
+
+@pytest.mark.benchmark(group="scaling-list-first-page")
+async def test_scaling_list_first_page(app_client, generated_fleet, benchmark):
+    benchmark.extra_info["fleet_size"] = generated_fleet
+
+    def run():
+        r = app_client.get("/devices", params={"limit": 100})
+        assert r.status_code == 200
+        assert len(r.json()) == min(100, generated_fleet)
+
+    benchmark.pedantic(run, rounds=20, warmup_rounds=3)
+
+
+@pytest.mark.benchmark(group="scaling-filtered-query")
+async def test_scaling_filtered_query(app_client, generated_fleet, benchmark):
+    benchmark.extra_info["fleet_size"] = generated_fleet
+
+    def run():
+        r = app_client.get("/devices", params={"type": "lock", "online": True, "limit": 100})
+        assert r.status_code == 200
+
+    benchmark.pedantic(run, rounds=20, warmup_rounds=3)
+
+
+@pytest.mark.benchmark(group="scaling-get-device")
+async def test_scaling_get_device(app_client, generated_fleet, benchmark):
+    benchmark.extra_info["fleet_size"] = generated_fleet
+    device_id = next(generate_fleet(generated_fleet, seed=42))["id"]
+
+    def run():
+        r = app_client.get(f"/devices/{device_id}")
+        assert r.status_code == 200
+
+    benchmark.pedantic(run, rounds=30, warmup_rounds=5)
+
+
+SERIALIZATION_DEVICES = [
+    Device(id=f"ser-{i:05d}", name="n", type="light", status="on", online=True)
+    for i in range(20000)
+]
+
+
+def _response_model_path(devices):
+    # what response_model did: validate the returned models again, then encode
+    revalidated = TypeAdapter(list[Device]).validate_python([d.model_dump() for d in devices])
+    return json.dumps(jsonable_encoder(revalidated)).encode()
+
+
+def test_serialization_fast_path_matches_response_model():
+    devices = SERIALIZATION_DEVICES[:100]
+    assert json.loads(encode(devices)) == json.loads(_response_model_path(devices))
+
+
+@pytest.mark.benchmark(group="serialization")
+@pytest.mark.parametrize("path", ["response_model", "fast"])
+def test_benchmark_serialization_paths(benchmark, path):
+    encode_devices = _response_model_path if path == "response_model" else encode
+    benchmark.pedantic(encode_devices, args=(SERIALIZATION_DEVICES,), rounds=5, warmup_rounds=1)
+
+
+async def test_streaming_list_memory_stays_flat(redis_client):
+    async def buffered():
+        devices, _ = await list_devices(redis_client)
+        return len(encode(devices))
+
+    async def streamed():
+        size = 0
+        async for chunk in aiter_json_array(stream_devices(redis_client, batch_size=500)):
+            size += len(chunk)
+        return size
+
+    async def peak(run):
+        tracemalloc.start()
+        try:
+            size = await run()
+            return size, tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    peaks = {}
+    for fleet_size in (1000, 4000):
+        await redis_client.flushdb()
+        await write_fleet(redis_client, fleet_size, seed=11)
+        buffered_bytes, peaks["buffered", fleet_size] = await peak(buffered)
+        streamed_bytes, peaks["streamed", fleet_size] = await peak(streamed)
+        assert streamed_bytes == buffered_bytes
+
+    # four times the devices: the buffered peak grows with them, the streamed one stays at about one batch
+    assert peaks["buffered", 4000] > 2 * peaks["buffered", 1000]
+    assert peaks["streamed", 4000] < 1.5 * peaks["streamed", 1000]
+
+
+async def _bare_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+
+async def _receive():
+    return {"type": "http.request", "body": b""}
+
+
+async def _send(_message):
+    pass
+
+
+async def _call_app(app, calls):
+    for _ in range(calls):
+        await app({"type": "http", "method": "GET", "path": "/bench"}, _receive, _send)
+
+
+async def test_metrics_middleware_records_every_request():
+    labels = ("GET", "unmatched")
+    requests, observed = HTTP_REQUESTS.value(labels + ("200",)), HTTP_LATENCY.count(labels)
+
+    await _call_app(MetricsMiddleware(_bare_app), 100)
+
+    assert HTTP_REQUESTS.value(labels + ("200",)) == requests + 100
+    assert HTTP_LATENCY.count(labels) == observed + 100
+
+
+@pytest.mark.benchmark(group="metrics-request-overhead")
+@pytest.mark.parametrize("path", ["bare", "instrumented"])
+def test_benchmark_metrics_middleware(benchmark, path):
+    app = MetricsMiddleware(_bare_app) if path == "instrumented" else _bare_app
+    loop = asyncio.new_event_loop()
+    try:
+        # 1000 requests per round; a request costs milliseconds, the middleware microseconds
+        benchmark.pedantic(lambda: loop.run_until_complete(_call_app(app, 1000)), rounds=20, warmup_rounds=2)
+    finally:
+        loop.close()
+
+
+@pytest.mark.benchmark(group="metrics-command-overhead")
+def test_benchmark_metrics_command_recording(benchmark):
+    # what InstrumentedRedis adds to every round trip, next to one that takes tens of microseconds
+    def record():
+        t = time.perf_counter()
+        REDIS_LATENCY.observe(time.perf_counter() - t, ("BENCH",))
+        REDIS_COMMANDS.inc(("BENCH",))
+
+    observed = REDIS_LATENCY.count(("BENCH",))
+    benchmark(record)
+    assert REDIS_LATENCY.count(("BENCH",)) > observed
+
+
+def test_profiling_hooks_are_no_ops_when_disabled():
+    assert current_profile() is None
+    assert timed(STAGE_SERIALIZATION) is timed(STAGE_REDIS)
+
+    with timed(STAGE_SERIALIZATION):
+        record_stage(STAGE_REDIS, 1.0)
+
+    assert current_profile() is None
+
+
+@pytest.mark.benchmark(group="profiling-hooks-disabled")
+def test_benchmark_profiling_hooks_when_disabled(benchmark):
+    def hooks():
+        with timed(STAGE_SERIALIZATION):
+            pass
+        record_stage(STAGE_REDIS, 0.0)
+
+    benchmark(hooks)
+
+
+@pytest.fixture(params=["redis", "memory"])
+def store_on_own_loop(request, own_loop_client, benchmark):
+    """
+    A store with a small fleet; its benchmarks are grouped per store, so the
+    memory store shows what the app costs without Redis round trips.
+    """
+    loop, client = own_loop_client
+    store = RedisDeviceStore(client) if request.param == "redis" else MemoryDeviceStore()
+    fleet = list(generate_fleet(500, seed=21))
+    loop.run_until_complete(store.save_devices(fleet))
+    benchmark.group = f"store-{request.param}"
+    return loop, store, fleet
+
+
+def test_benchmark_command_and_read_per_store(store_on_own_loop, benchmark):
+    loop, store, fleet = store_on_own_loop
+    commands = itertools.cycle(enumerate(fleet))
+
+    async def command_and_read():
+        n, device = next(commands)
+        await apply_command(store, device["id"], {"status": "off" if n % 2 else "maintenance"})
+        await fetch_device(store, device["id"])
+
+    benchmark.pedantic(lambda: loop.run_until_complete(command_and_read()), rounds=len(fleet), warmup_rounds=10)
+
+
+def test_benchmark_bulk_updates_per_store(store_on_own_loop, benchmark):
+    loop, store, fleet = store_on_own_loop
+    statuses = itertools.cycle(("on", "off"))
+
+    def run():
+        updates = [(device["id"], {"status": next(statuses)}) for device in fleet]
+        loop.run_until_complete(store.apply_updates(updates, "2024-01-01T00:00:00", publish_commands=False))
+
+    benchmark.pedantic(run, rounds=5, warmup_rounds=1)
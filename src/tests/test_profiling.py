@@ -0,0 +1,104 @@
+import threading
+import time
+from starlette.testclient import TestClient
+from src.app import app
+from src.infrastructure.profiling import (
+    ProfileBuffer,
+    RequestProfiler,
+    StackSampler,
+    STAGE_VALIDATION,
+    current_profile,
+    get_profile_buffer,
+    timed,
+)
+from src.services.device_registry import save_devices
+
+
+DEVICE = {"id": "profiled-1", "name": "Lamp", "type": "light", "status": "on", "online": True}
+
+
+def profiled_client(**settings):
+    return TestClient(RequestProfiler(app, **settings))
+
+
+async def test_sampled_request_has_time_breakdown(redis_client):
+    await save_devices(redis_client, [DEVICE])
+    buffer = ProfileBuffer(10)
+
+    with profiled_client(sample_rate=1.0, slow_ms=60_000, buffer=buffer) as client:
+        assert client.get("/devices/profiled-1").status_code == 200
+
+    [capture] = buffer.captures()
+    assert capture["reason"] == "sampled"
+    assert capture["route"] == "/devices/{device_id}"
+    assert capture["status"] == 200
+    assert capture["calls"] == {"redis": 1, "validation": 1, "serialization": 1}
+    assert set(capture["breakdown_ms"]) == {"redis", "validation", "serialization", "other"}
+    assert sum(capture["breakdown_ms"].values()) <= capture["duration_ms"] + 0.01
+    assert "trace" not in capture
+
+
+def test_slow_requests_are_always_captured():
+    buffer = ProfileBuffer(10)
+
+    with profiled_client(sample_rate=0.0, slow_ms=0, buffer=buffer) as client:
+        client.get("/devices/profiled-missing")
+
+    [capture] = buffer.captures()
+    assert capture["reason"] == "slow"
+    assert capture["status"] == 404
+
+
+def test_fast_unsampled_requests_are_not_kept():
+    buffer = ProfileBuffer(10)
+
+    with profiled_client(sample_rate=0.0, slow_ms=60_000, buffer=buffer) as client:
+        for _ in range(5):
+            client.get("/devices/status")
+
+    assert buffer.captures() == []
+    assert buffer.stats()["profiled"] == 5
+
+
+def test_buffer_keeps_most_recent_captures():
+    buffer = ProfileBuffer(2)
+    for i in range(3):
+        buffer.add({"reason": "sampled", "path": f"/{i}"})
+
+    assert [c["path"] for c in buffer.captures()] == ["/2", "/1"]
+    assert buffer.stats()["captured_sampled"] == 3
+
+
+def test_admin_endpoint_returns_captures():
+    get_profile_buffer().clear()
+
+    with profiled_client(sample_rate=1.0, slow_ms=60_000) as client:
+        client.get("/devices/status")
+        body = client.get("/admin/profiles", params={"reason": "sampled"}).json()
+        assert client.delete("/admin/profiles").json()["buffered"] == 0
+
+    assert body["captures"][0]["path"] == "/devices/status"
+
+
+def test_hooks_are_noops_outside_profiled_requests():
+    assert current_profile() is None
+    assert timed(STAGE_VALIDATION) is timed(STAGE_VALIDATION)
+
+
+def _spin(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+def test_stack_sampler_attributes_samples_to_running_code():
+    sampler = StackSampler(threading.get_ident(), interval=0.001)
+    sampler.start()
+    started = time.perf_counter()
+    _spin(0.1)
+    finished = time.perf_counter()
+    sampler.stop()
+
+    trace = sampler.trace(started, finished)
+    assert trace["samples"] > 0
+    assert "test_profiling.py:_spin" in trace["stacks"][0]["stack"]
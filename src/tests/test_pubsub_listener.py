@@ -0,0 +1,98 @@
+import asyncio
+import json
+import time
+import pytest
+from src.config import DEVICE_COMMAND_CHANNEL
+from src.infrastructure import pubsub_listener as listener_module
+from src.infrastructure.pubsub_listener import pubsub_listener, pubsub_stats
+from src.infrastructure.redis_client import build_listener_client
+from src.services.device_store import RedisDeviceStore
+from src.services.fleet_generator import generate_fleet
+
+
+async def _wait_for(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not await condition():
+        assert time.monotonic() < deadline, "condition not met in time"
+        await asyncio.sleep(0.01)
+
+
+@pytest.fixture
+def proxy(monkeypatch, restartable_redis):
+    monkeypatch.setattr(
+        listener_module, "build_listener_client", lambda: build_listener_client("127.0.0.1", restartable_redis.port)
+    )
+    monkeypatch.setattr(listener_module, "PUBSUB_RECONNECT_BASE", 0.05)
+    monkeypatch.setattr(listener_module, "PUBSUB_RECONNECT_MAX", 0.2)
+    return restartable_redis
+
+
+async def test_listener_recovers_after_a_redis_restart(redis_client, proxy):
+    store = RedisDeviceStore(redis_client)
+    devices = list(generate_fleet(50, seed=4))
+    await store.save_devices(devices)
+    before = pubsub_stats()
+    task = asyncio.create_task(pubsub_listener(store))
+
+    async def send(round_: str):
+        for device in devices:
+            command = {"device_id": device["id"], "command": {"status": f"round-{round_}"}}
+            await redis_client.publish(DEVICE_COMMAND_CHANNEL, json.dumps(command))
+
+    async def applied(round_: str):
+        rows = await store.get_many([device["id"] for device in devices], fields=["status"])
+        return all(row["status"] == f"round-{round_}" for row in rows)
+
+    async def subscribed():
+        return pubsub_stats()["connected"]
+
+    async def disconnected():
+        return not pubsub_stats()["connected"]
+
+    try:
+        await _wait_for(subscribed)
+        await send("1")
+        await _wait_for(lambda: applied("1"))
+
+        await proxy.stop()
+        await _wait_for(disconnected)
+        await asyncio.sleep(0.5)
+        await proxy.start()
+        restarted = time.monotonic()
+
+        # ingestion is back once the channel is subscribed again
+        await _wait_for(subscribed)
+        await send("2")
+        await _wait_for(lambda: applied("2"))
+        recovery = time.monotonic() - restarted
+
+        stats = pubsub_stats()
+        assert recovery < 3
+        assert stats["reconnects"] - before["reconnects"] == 1
+        assert stats["disconnects"] - before["disconnects"] == 1
+        assert stats["downtime_seconds"] - before["downtime_seconds"] >= 0.5
+        assert stats["received"] - before["received"] >= 2 * len(devices)
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    assert pubsub_stats()["connected"] is False
+
+
+async def test_listener_waits_for_redis_at_startup(proxy):
+    await proxy.stop()
+    before = pubsub_stats()
+    task = asyncio.create_task(pubsub_listener(None))
+
+    async def subscribed():
+        return pubsub_stats()["connected"]
+
+    try:
+        await asyncio.sleep(0.3)
+        assert not task.done() and not pubsub_stats()["connected"]
+        await proxy.start()
+        await _wait_for(subscribed)
+        assert pubsub_stats()["reconnects"] - before["reconnects"] == 1
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
@@ -0,0 +1,27 @@
+from starlette.testclient import TestClient
+from src.config import STREAM_ENABLED
+from src.dependencies import get_redis
+from src.infrastructure.redis_client import get_redis_client
+
+
+async def test_dependency_returns_shared_client(app_client: TestClient):
+    first = app_client.portal.call(get_redis)
+    second = app_client.portal.call(get_redis)
+
+    assert first is second
+    assert first is app_client.portal.call(get_redis_client)
+
+
+def test_pool_is_reused_across_requests(app_client: TestClient):
+    for _ in range(20):
+        assert app_client.get("/devices/").status_code == 200
+
+    response = app_client.get("/admin/redis/pool")
+
+    assert response.status_code == 200
+    stats = response.json()
+    assert stats["initialized"] is True
+    assert stats["mode"] == "direct"
+    # the update broker keeps one connection for its pattern subscription
+    assert stats["in_use"] == (1 if STREAM_ENABLED else 0)
+    assert 1 <= stats["created"] <= stats["max_connections"]
@@ -0,0 +1,71 @@
+from starlette.testclient import TestClient
+from src.services.device_registry import (
+    save_devices,
+    delete_devices,
+    rebuild_registry,
+    iter_registry_batches,
+)
+from src.utils import DEVICE_REGISTRY_KEY
+
+
+async def test_save_devices_registers_ids(redis_client):
+    saved = await save_devices(redis_client, [
+        {"id": "a-1", "name": "A", "type": "light", "status": "on", "online": True},
+        {"id": "a-2", "name": "B", "type": "lock", "status": "locked", "online": False},
+        {"name": "no id"},
+    ])
+
+    assert saved == 2
+    assert await redis_client.zrange(DEVICE_REGISTRY_KEY, 0, -1) == ["a-1", "a-2"]
+    assert (await redis_client.hgetall("device:a-2"))["online"] == "false"
+
+
+async def test_get_devices_ignores_history_and_unregistered_keys(app_client: TestClient, redis_client):
+    await save_devices(redis_client, [
+        {"id": "r-1", "name": "Registered", "type": "light", "status": "on", "online": True},
+    ])
+    await redis_client.rpush("device:history:r-1", "{}")
+    await redis_client.hset("device:stray", mapping={
+        "name": "Stray", "type": "light", "status": "on", "online": "true"
+    })
+
+    response = app_client.get("/devices")
+
+    assert response.status_code == 200
+    assert [d["id"] for d in response.json()] == ["r-1"]
+
+
+async def test_iter_registry_batches_walks_all_ids(redis_client):
+    devices = [
+        {"id": f"dev-{i:03d}", "name": "n", "type": "t", "status": "s", "online": True}
+        for i in range(25)
+    ]
+    await save_devices(redis_client, devices)
+
+    batches = [ids async for ids in iter_registry_batches(redis_client, batch_size=10)]
+
+    assert [len(b) for b in batches] == [10, 10, 5]
+    assert [i for b in batches for i in b] == [d["id"] for d in devices]
+
+
+async def test_rebuild_registry_repairs_drift(redis_client):
+    await redis_client.hset("device:missing-1", mapping={"name": "n", "type": "t", "status": "s", "online": "true"})
+    await redis_client.rpush("device:history:missing-1", "{}")
+    await redis_client.zadd(DEVICE_REGISTRY_KEY, {"gone-1": 0})
+
+    result = await rebuild_registry(redis_client)
+
+    assert result == {"devices": 1, "added": 1, "removed": 1, "pruned": 0, "migrated": 1}
+    assert await redis_client.zrange(DEVICE_REGISTRY_KEY, 0, -1) == ["missing-1"]
+    assert await redis_client.type("device:history:missing-1") == "none"
+
+
+async def test_delete_devices_unregisters(redis_client):
+    await save_devices(redis_client, [
+        {"id": "d-1", "name": "n", "type": "t", "status": "s", "online": True},
+    ])
+
+    await delete_devices(redis_client, ["d-1"])
+
+    assert not await redis_client.exists("device:d-1")
+    assert await redis_client.zcard(DEVICE_REGISTRY_KEY) == 0
@@ -0,0 +1,130 @@
+import time
+import pytest
+import redis.asyncio as aioredis
+from starlette.testclient import TestClient
+from src import app as app_module
+from src.app import app
+from src.config import DB_HOST, DB_PORT
+from src.infrastructure import replica_router
+from src.infrastructure.replica_router import HEARTBEAT_KEY, ReplicaReadStore, ReplicaRouter
+from src.services.device_store import RedisDeviceStore
+from src.services.fleet_generator import generate_fleet
+
+# the test "replicas" are databases of the local Redis, kept in sync by hand
+REPLICA_DBS = (4, 5)
+# nothing listens there, so connecting fails right away
+DOWN = "127.0.0.1:1/0"
+
+
+def _name(db: int) -> str:
+    return f"{DB_HOST}:{DB_PORT}/{db}"
+
+
+@pytest.fixture
+async def replicas():
+    clients = [aioredis.Redis(host=DB_HOST, port=DB_PORT, db=db, decode_responses=True) for db in REPLICA_DBS]
+    for client in clients:
+        await client.flushdb()
+    try:
+        yield clients
+    finally:
+        for client in clients:
+            await client.flushdb()
+            await client.aclose()
+
+
+async def _heartbeat(master, replicas, lags_ms):
+    beat = int(time.time() * 1000)
+    await master.set(HEARTBEAT_KEY, beat)
+    for replica, lag in zip(replicas, lags_ms):
+        await replica.set(HEARTBEAT_KEY, beat - lag)
+
+
+async def test_lagging_silent_and_down_replicas_get_no_reads(redis_client, replicas):
+    _, lagging = replicas
+    await _heartbeat(redis_client, replicas, [0, 5000])
+    router = ReplicaRouter(redis_client, replicas=",".join([_name(4), _name(5), _name(6), DOWN]), max_lag_ms=1000)
+    await router.check()
+
+    stats = router.stats()["replicas"]
+    assert stats[_name(4)]["healthy"] and stats[_name(4)]["lag_ms"] == 0
+    assert stats[_name(5)]["error"] == "lagging 5000 ms"
+    assert stats[_name(6)]["error"] == "no heartbeat"
+    assert not stats[DOWN]["healthy"] and stats[DOWN]["latency_ms"] is None
+    assert {router.pick().name for _ in range(10)} == {_name(4)}
+
+    # once the replica catches up it is back in the rotation
+    await lagging.set(HEARTBEAT_KEY, await redis_client.get(HEARTBEAT_KEY))
+    await router.check()
+    assert {router.pick().name for _ in range(10)} == {_name(4), _name(5)}
+    await router.stop()
+
+
+async def test_round_robin_and_least_latency(redis_client, replicas):
+    await _heartbeat(redis_client, replicas, [0, 0])
+    round_robin = ReplicaRouter(redis_client, replicas=f"{_name(4)},{_name(5)}")
+    least_latency = ReplicaRouter(redis_client, replicas=f"{_name(4)},{_name(5)}", selection="least_latency")
+    await round_robin.check()
+    await least_latency.check()
+
+    picks = [round_robin.pick().name for _ in range(6)]
+    assert picks[0::2] != picks[1::2] and len(set(picks[0::2])) == 1
+
+    least_latency.replicas[_name(4)].latency_ms = 5.0
+    least_latency.replicas[_name(5)].latency_ms = 0.5
+    assert {least_latency.pick().name for _ in range(5)} == {_name(5)}
+
+    with pytest.raises(ValueError):
+        ReplicaRouter(redis_client, replicas="", selection="random")
+    await round_robin.stop()
+    await least_latency.stop()
+
+
+async def test_failed_replica_read_finishes_on_the_master(redis_client):
+    fleet = list(generate_fleet(30, seed=3))
+    master = RedisDeviceStore(redis_client)
+    await master.save_devices(fleet)
+    router = ReplicaRouter(redis_client, replicas=DOWN)
+    await router._sync_members()
+    replica = router.replicas[DOWN]
+    replica.healthy = True
+
+    store = router.read_store(master)
+    assert isinstance(store, ReplicaReadStore) and not store.authoritative
+    assert (await store.get(fleet[0]["id"]))["type"] == fleet[0]["type"]
+    assert [device_id async for batch in store.iter_batches(batch_size=7) for device_id in batch] == sorted(
+        device["id"] for device in fleet
+    )
+
+    # the replica is out of the rotation until the next check finds it healthy
+    assert not replica.healthy and replica.failures == 1
+    assert router.read_store(master) is master
+    assert router.stats()["master_reads"] == 1
+    await router.stop()
+
+
+def test_app_reads_from_replicas_unless_consistent(monkeypatch, replicas):
+    monkeypatch.setattr(app_module, "REDIS_READ_FROM_REPLICAS", True)
+    monkeypatch.setattr(replica_router, "REDIS_REPLICAS", _name(4))
+    device = next(generate_fleet(1, seed=5))
+    stale = {**device, "status": "replica-copy"}
+
+    with TestClient(app) as client:
+        router = replica_router.get_replica_router()
+        # the fixture's clients belong to the test's event loop, this one to the app's
+        replica = RedisDeviceStore(aioredis.Redis(host=DB_HOST, port=DB_PORT, db=REPLICA_DBS[0], decode_responses=True))
+        client.portal.call(RedisDeviceStore(router.master).save_devices, [device])
+        client.portal.call(replica.save_devices, [stale])
+        client.portal.call(_heartbeat, router.master, [replica.client], [0])
+        client.portal.call(router.check)
+        client.portal.call(replica.client.aclose)
+
+        assert client.get(f"/devices/{device['id']}").json()["status"] == "replica-copy"
+        assert client.get("/devices/", params={"fields": "id,status"}).json()[0]["status"] == "replica-copy"
+        assert client.get(f"/devices/{device['id']}", params={"consistent": "true"}).json()["status"] == device["status"]
+
+        stats = client.get("/admin/redis/replicas").json()
+        assert stats["enabled"] and stats["healthy"] == 1
+        assert stats["replica_reads"] == 2 and stats["consistent_reads"] == 1
+
+    assert replica_router.replica_router_stats() == {"enabled": False}
@@ -0,0 +1,46 @@
+import json
+from starlette.testclient import TestClient
+from src.models import Device
+from src.serialization import encode, iter_json_array, iter_ndjson
+from src.services.device_registry import save_devices
+
+
+def make_devices(count):
+    return [
+        Device(id=f"s-{i:03d}", name=f"Déjà {i}", type="light", status="on", online=i % 2 == 0)
+        for i in range(count)
+    ]
+
+
+def test_encode_matches_pydantic_json():
+    devices = make_devices(3)
+
+    assert json.loads(encode(devices)) == [d.model_dump() for d in devices]
+    assert json.loads(encode(devices[0])) == devices[0].model_dump()
+    assert json.loads(encode([{"id": "x", "online": True}])) == [{"id": "x", "online": True}]
+    assert encode([]) == b"[]"
+
+
+def test_chunked_encoders_produce_valid_output():
+    devices = make_devices(7)
+    expected = [d.model_dump() for d in devices]
+
+    assert json.loads(b"".join(iter_json_array(devices, chunk_size=3))) == expected
+    assert json.loads(b"".join(iter_json_array([], chunk_size=3))) == []
+
+    lines = b"".join(iter_ndjson(devices, chunk_size=3)).splitlines()
+    assert [json.loads(line) for line in lines] == expected
+
+
+async def test_get_devices_large_and_ndjson_responses(app_client: TestClient, redis_client, monkeypatch):
+    await save_devices(redis_client, [d.model_dump() for d in make_devices(12)])
+    monkeypatch.setattr("src.routers.device.JSON_CHUNK_SIZE", 5)
+
+    chunked = app_client.get("/devices/", params={"limit": 10})
+    ndjson = app_client.get("/devices/", params={"limit": 10}, headers={"Accept": "application/x-ndjson"})
+
+    assert chunked.status_code == 200
+    assert [d["id"] for d in chunked.json()] == [f"s-{i:03d}" for i in range(10)]
+    assert chunked.headers["x-next-cursor"]
+    assert ndjson.headers["content-type"] == "application/x-ndjson"
+    assert [json.loads(line)["id"] for line in ndjson.text.splitlines()] == [f"s-{i:03d}" for i in range(10)]
@@ -0,0 +1,135 @@
+import json
+import time
+import pytest
+import redis.asyncio as aioredis
+from starlette.testclient import TestClient
+from src.app import app
+from src.config import DB_HOST, DB_PORT
+from src.services import device_store
+from src.services.device_events import UPDATE_APPLIED, UPDATE_NOT_FOUND
+from src.services.device_service import list_devices
+from src.services.fleet_generator import generate_fleet
+from src.services.sharded_store import HashRing, ShardedDeviceStore
+from src.utils import device_key, device_history_key
+
+# the test "nodes" are databases of the local Redis
+SHARD_DBS = (1, 2, 3)
+SHARDS = ",".join(f"{DB_HOST}:{DB_PORT}/{db}" for db in SHARD_DBS)
+
+
+@pytest.fixture
+async def shard_clients():
+    clients = {
+        f"{DB_HOST}:{DB_PORT}/{db}": aioredis.Redis(host=DB_HOST, port=DB_PORT, db=db, decode_responses=True)
+        for db in SHARD_DBS
+    }
+    for client in clients.values():
+        await client.flushdb()
+    try:
+        yield clients
+    finally:
+        for client in clients.values():
+            await client.flushdb()
+            await client.aclose()
+
+
+@pytest.fixture
+async def sharded(shard_clients, redis_client):
+    store = ShardedDeviceStore(shard_clients, redis_client)
+    fleet = list(generate_fleet(300, seed=8))
+    await store.save_devices(fleet)
+    return store, fleet
+
+
+def test_hash_ring_spreads_keys_and_moves_few_on_resize():
+    keys = [f"device-{i}" for i in range(20000)]
+    three = HashRing(["a", "b", "c"])
+    four = HashRing(["a", "b", "c", "d"])
+
+    owners = [three.node_for(key) for key in keys]
+    shares = [owners.count(node) / len(keys) for node in "abc"]
+    moved = sum(owner != four.node_for(key) for owner, key in zip(owners, keys)) / len(keys)
+
+    assert all(0.25 < share < 0.42 for share in shares)
+    assert 0.15 < moved < 0.35
+    assert HashRing(["a", "b", "c"]).node_for("device-1") == owners[1]
+
+
+async def test_devices_live_on_their_shard(sharded, shard_clients):
+    store, fleet = sharded
+    device_id = fleet[0]["id"]
+    home = store.shard_for(device_id).client
+
+    assert await home.exists(device_key(device_id))
+    assert sum([await client.exists(device_key(device_id)) for client in shard_clients.values()]) == 1
+    assert all([await client.zcard("devices:registry") > 50 for client in shard_clients.values()])
+
+    ids = [fleet[5]["id"], "missing", fleet[2]["id"]]
+    assert [row.get("type") for row in await store.get_many(ids, fields=["type"])] == [fleet[5]["type"], None, fleet[2]["type"]]
+
+
+async def test_listing_merges_shards_in_id_order(sharded):
+    store, fleet = sharded
+    ids = sorted(device["id"] for device in fleet)
+    locks = sorted(device["id"] for device in fleet if device["type"] == "lock")
+
+    walked = [device_id async for batch in store.iter_batches(batch_size=40) for device_id in batch]
+    filtered = [device_id async for batch in store.iter_batches({"type": "lock"}, batch_size=7) for device_id in batch]
+    assert walked == ids
+    assert filtered == locks
+
+    pages, cursor = [], None
+    while True:
+        page, cursor = await list_devices(store, fields=["id"], limit=64, cursor=cursor)
+        pages.extend(item["id"] for item in page)
+        if cursor is None:
+            break
+    assert pages == ids
+
+
+async def test_updates_and_history_go_to_the_owning_shard(sharded):
+    store, fleet = sharded
+    first, second = fleet[0]["id"], fleet[1]["id"]
+    pubsub = store.pubsub()
+    await pubsub.psubscribe("device:updates:*")
+
+    results = await store.apply_updates(
+        [(first, {"status": "maintenance"}), ("missing", {"status": "off"}), (second, {"status": "maintenance"})],
+        "2024-01-01T00:00:00",
+    )
+    assert [result.status for result in results] == [UPDATE_APPLIED, UPDATE_NOT_FOUND, UPDATE_APPLIED]
+    assert [changes for _, changes in await store.history(first)] == [{"status": "maintenance"}]
+    assert await store.shard_for(first).client.xlen(device_history_key(first)) == 1
+
+    received = set()
+    deadline = time.monotonic() + 3
+    while len(received) < 2 and time.monotonic() < deadline:
+        # subscribe confirmations come back as None
+        message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+        if message is not None:
+            received.add(json.loads(message["data"])["device_id"])
+    await pubsub.aclose()
+    assert received == {first, second}
+
+    assert await store.delete_devices([first, "missing"]) == 1
+    assert not await store.exists(first)
+
+
+def test_app_with_sharded_storage(monkeypatch, shard_clients):
+    monkeypatch.setattr(device_store, "REDIS_SHARDS", SHARDS)
+    fleet = list(generate_fleet(120, seed=9))
+
+    with TestClient(app) as client:
+        store = device_store.get_device_store()
+        assert isinstance(store, ShardedDeviceStore)
+        client.portal.call(store.save_devices, fleet)
+
+        listed = client.get("/devices/", params={"fields": "id"}).json()
+        stats = client.get("/admin/shards").json()
+        device_id = fleet[3]["id"]
+        command = client.post(f"/devices/{device_id}/command", json={"status": "maintenance"})
+
+        assert [item["id"] for item in listed] == sorted(device["id"] for device in fleet)
+        assert sum(shard["devices"] for shard in stats["shards"].values()) == 120
+        assert command.status_code == 200
+        assert client.get(f"/devices/{device_id}").json()["status"] == "maintenance"
@@ -0,0 +1,91 @@
+import asyncio
+import random
+import time
+from starlette.testclient import TestClient
+from src.app import app
+from src.config import LEADER_KEY
+from src.services.device_registry import save_devices
+from src.services.simulation import SimulationEngine, DEFAULT_PROFILES, next_update
+
+
+def _fleet(n):
+    types = ["thermostat", "light", "camera", "lock", "vacuum"]
+    return [
+        {"id": f"sim-{i:04d}", "name": "n", "type": types[i % len(types)], "status": "idle", "online": True}
+        for i in range(n)
+    ]
+
+
+def test_next_update_follows_profile():
+    rng = random.Random(1)
+    profile = DEFAULT_PROFILES["lock"]
+
+    updates = [next_update(profile, "locked", "true", rng) for _ in range(200)]
+
+    statuses = {u["status"] for u in updates if "status" in u}
+    flips = [u for u in updates if "online" in u]
+    assert statuses == {"unlocked"}
+    assert flips and all(u == {"online": "false"} for u in flips)
+
+
+async def test_engine_holds_target_rate_and_writes_updates(redis_client):
+    await save_devices(redis_client, _fleet(200))
+
+    engine = SimulationEngine(redis_client, target_rate=400, batch_size=50, tick_seconds=0.02, seed=7)
+    assert await engine.load_devices() == 200
+
+    engine.start()
+    await asyncio.sleep(1.0)
+    await engine.stop()
+
+    stats = engine.stats()
+    assert abs(stats["measured_rate"] - 400) / 400 < 0.25
+    assert stats["applied"] > 0
+
+    changed = 0
+    for device in _fleet(200):
+        changed += await redis_client.xlen(f"device:history:{device['id']}")
+    assert changed == stats["applied"]
+
+
+async def test_engine_forgets_deleted_devices(redis_client):
+    await save_devices(redis_client, _fleet(5))
+    engine = SimulationEngine(redis_client, target_rate=1000, tick_seconds=0.01, seed=1)
+    await engine.load_devices()
+    await redis_client.delete(*[f"device:{d['id']}" for d in _fleet(5)])
+
+    engine.start()
+    await asyncio.sleep(0.3)
+    await engine.stop()
+
+    assert engine.stats()["devices"] < 5
+
+
+def _wait_for_leadership(client: TestClient) -> None:
+    deadline = time.monotonic() + 3
+    while not client.get("/admin/leader").json().get("leader") and time.monotonic() < deadline:
+        client.portal.call(asyncio.sleep, 0.01)
+
+
+async def test_simulation_admin_endpoints(app_client: TestClient, redis_client):
+    await save_devices(redis_client, _fleet(20))
+    _wait_for_leadership(app_client)
+
+    response = app_client.post("/admin/simulation", json={"target_rate": 200, "seed": 3})
+    assert response.status_code == 200
+    assert response.json()["running"] is True
+    assert response.json()["devices"] == 20
+
+    response = app_client.delete("/admin/simulation")
+    assert response.json()["running"] is False
+
+
+async def test_simulation_is_controlled_by_the_leader_only(redis_client):
+    await save_devices(redis_client, _fleet(5))
+    # another worker holds the lease
+    await redis_client.set(LEADER_KEY, "other-worker", px=10_000)
+
+    with TestClient(app) as client:
+        assert client.post("/admin/simulation", json={"target_rate": 50}).status_code == 409
+        assert client.delete("/admin/simulation").status_code == 409
+        assert client.get("/admin/simulation").json()["running"] is False
@@ -0,0 +1,162 @@
+import asyncio
+import pytest
+from src.config import COMMAND_STREAM, COMMAND_STREAM_GROUP
+from src.infrastructure import stream_listener as listener_module
+from src.infrastructure.redis_client import build_listener_client
+from src.infrastructure.stream_listener import stream_listener, stream_stats, ensure_consumer_group
+from src.services.commands_service import enqueue_command
+
+
+@pytest.fixture
+def fast_stream(monkeypatch):
+    monkeypatch.setattr(listener_module, "COMMAND_STREAM_BLOCK_MS", 50)
+    monkeypatch.setattr(listener_module, "COMMAND_STREAM_CLAIM_IDLE_MS", 0)
+
+
+async def _run_listener_until(predicate, timeout=3.0):
+    task = asyncio.create_task(stream_listener())
+    try:
+        deadline = asyncio.get_running_loop().time() + timeout
+        while not await predicate():
+            assert asyncio.get_running_loop().time() < deadline, "listener did not catch up in time"
+            await asyncio.sleep(0.05)
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
+async def test_stream_commands_are_processed_and_acked(redis_client, fast_stream):
+    await redis_client.hset("device:s1", mapping={"status": "normal"})
+    for status in ("a", "b", "c"):
+        await enqueue_command(redis_client, "s1", {"status": status})
+
+    async def done():
+        return await redis_client.xlen("device:history:s1") == 3
+
+    await _run_listener_until(done)
+
+    assert (await redis_client.hgetall("device:s1"))["status"] == "c"
+    pending = await redis_client.xpending(COMMAND_STREAM, COMMAND_STREAM_GROUP)
+    assert pending["pending"] == 0
+
+
+async def test_pending_entries_of_dead_consumer_are_reclaimed(redis_client, fast_stream):
+    await redis_client.hset("device:s2", mapping={"status": "normal"})
+    await ensure_consumer_group(redis_client)
+    await enqueue_command(redis_client, "s2", {"status": "claimed"})
+
+    # a consumer that read the entry and died before acknowledging it
+    await redis_client.xreadgroup(COMMAND_STREAM_GROUP, "dead-consumer", {COMMAND_STREAM: ">"}, count=10)
+
+    async def done():
+        return (await redis_client.hgetall("device:s2"))["status"] == "claimed"
+
+    await _run_listener_until(done)
+
+    pending = await redis_client.xpending(COMMAND_STREAM, COMMAND_STREAM_GROUP)
+    assert pending["pending"] == 0
+
+
+async def test_enqueue_command_trims_stream(redis_client, monkeypatch):
+    monkeypatch.setattr("src.services.commands_service.COMMAND_STREAM_MAXLEN", 10)
+    for i in range(500):
+        await enqueue_command(redis_client, "t", {"status": str(i)})
+
+    assert await redis_client.xlen(COMMAND_STREAM) < 500
+
+
+@pytest.fixture
+def flaky_handler(monkeypatch, fast_stream):
+    """
+    Applies commands for real, after failing the first attempt per device
+    and taking `delay` seconds per attempt.
+    """
+    monkeypatch.setattr(listener_module, "COMMAND_STREAM_CLAIM_INTERVAL", 0.05)
+    attempts = []
+    settings = {"fail_first": True, "delay": 0.0}
+    process = listener_module.process_command_message
+
+    async def handle(target, payload):
+        attempts.append(payload["device_id"])
+        await asyncio.sleep(settings["delay"])
+        if settings["fail_first"] and attempts.count(payload["device_id"]) == 1:
+            raise ConnectionError("Redis went away")
+        return await process(target, payload)
+
+    monkeypatch.setattr(listener_module, "process_command_message", handle)
+    return attempts, settings
+
+
+async def test_failed_commands_stay_pending_and_are_retried(redis_client, flaky_handler):
+    attempts, _ = flaky_handler
+    await redis_client.hset("device:s3", mapping={"status": "normal"})
+    await enqueue_command(redis_client, "s3", {"status": "retried"})
+
+    async def done():
+        return (await redis_client.hgetall("device:s3"))["status"] == "retried"
+
+    await _run_listener_until(done)
+
+    assert attempts == ["s3", "s3"]
+    assert listener_module.stream_stats()["failed"] >= 1
+    pending = await redis_client.xpending(COMMAND_STREAM, COMMAND_STREAM_GROUP)
+    assert pending["pending"] == 0
+
+
+async def test_entries_still_queued_locally_are_not_claimed_again(redis_client, flaky_handler):
+    attempts, settings = flaky_handler
+    settings.update(fail_first=False, delay=0.3)
+    await redis_client.hset("device:s4", mapping={"status": "normal"})
+    await enqueue_command(redis_client, "s4", {"status": "once"})
+
+    async def done():
+        return await redis_client.xlen("device:history:s4") == 1
+
+    await _run_listener_until(done)
+
+    # several claim rounds ran while the command was being applied
+    assert attempts == ["s4"]
+
+
+async def test_listener_recovers_after_a_redis_restart(redis_client, fast_stream, restartable_redis, monkeypatch):
+    monkeypatch.setattr(
+        listener_module, "build_listener_client", lambda: build_listener_client("127.0.0.1", restartable_redis.port)
+    )
+    monkeypatch.setattr(listener_module, "PUBSUB_RECONNECT_BASE", 0.05)
+    monkeypatch.setattr(listener_module, "PUBSUB_RECONNECT_MAX", 0.2)
+    await redis_client.hset("device:s5", mapping={"status": "normal"})
+    before = stream_stats()
+    task = asyncio.create_task(stream_listener())
+
+    async def status_is(status):
+        return (await redis_client.hgetall("device:s5"))["status"] == status
+
+    async def wait_until(predicate):
+        deadline = asyncio.get_running_loop().time() + 5
+        while not await predicate():
+            assert asyncio.get_running_loop().time() < deadline, "condition not met in time"
+            await asyncio.sleep(0.02)
+
+    try:
+        await enqueue_command(redis_client, "s5", {"status": "before"})
+        await wait_until(lambda: status_is("before"))
+
+        await restartable_redis.stop()
+        # enqueued while the listener cannot reach Redis
+        await enqueue_command(redis_client, "s5", {"status": "during"})
+        await asyncio.sleep(0.5)
+        assert not stream_stats()["connected"]
+        await restartable_redis.start()
+
+        await wait_until(lambda: status_is("during"))
+        await enqueue_command(redis_client, "s5", {"status": "after"})
+        await wait_until(lambda: status_is("after"))
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    stats = stream_stats()
+    assert stats["reconnects"] - before["reconnects"] == 1
+    assert stats["disconnects"] - before["disconnects"] == 1
+    pending = await redis_client.xpending(COMMAND_STREAM, COMMAND_STREAM_GROUP)
+    assert pending["pending"] == 0
@@ -0,0 +1,85 @@
+import json
+import pytest
+from starlette.testclient import TestClient
+from src.infrastructure.update_broker import UpdateBroker, CLOSED_SLOW_CONSUMER, BrokerFull
+from src.routers.stream import sse_events
+from src.services.device_registry import save_devices
+
+
+def make_broker(redis_client, **settings):
+    # fan-out only; the Redis subscription is not started
+    return UpdateBroker(redis_client, **settings)
+
+
+async def test_broker_fans_out_by_device_and_pattern(redis_client):
+    broker = make_broker(redis_client)
+    one = broker.subscribe(device_id="lamp-1")
+    lamps = broker.subscribe(pattern="lamp-*")
+    everything = broker.subscribe()
+
+    broker.publish_local("lamp-1", "a")
+    broker.publish_local("lock-1", "b")
+
+    assert one.queue.qsize() == 1
+    assert lamps.queue.qsize() == 1
+    assert everything.queue.qsize() == 2
+    assert broker.stats()["clients"] == 3
+
+
+async def test_slow_consumer_is_disconnected(redis_client):
+    broker = make_broker(redis_client, buffer_size=2)
+    slow = broker.subscribe(device_id="d-1")
+
+    for i in range(3):
+        broker.publish_local("d-1", str(i))
+
+    assert slow.closed_reason == CLOSED_SLOW_CONSUMER
+    assert await slow.get() is None
+    assert broker.stats() == {"clients": 0, "devices_watched": 0, "received": 3, "slow_consumers_disconnected": 1}
+
+
+async def test_drop_oldest_keeps_newest_updates(redis_client):
+    broker = make_broker(redis_client, buffer_size=2, overflow="drop_oldest")
+    subscription = broker.subscribe()
+
+    for i in range(5):
+        broker.publish_local("d-1", str(i))
+
+    assert [await subscription.get(), await subscription.get()] == ["3", "4"]
+    assert subscription.dropped == 3
+
+
+async def test_max_clients(redis_client):
+    broker = make_broker(redis_client, max_clients=1)
+    broker.subscribe()
+
+    with pytest.raises(BrokerFull):
+        broker.subscribe()
+
+
+async def test_sse_events_format(redis_client):
+    broker = make_broker(redis_client, buffer_size=1)
+    subscription = broker.subscribe(device_id="d-1")
+    broker.publish_local("d-1", '{"device_id": "d-1"}')
+    broker.publish_local("d-1", '{"device_id": "d-1"}')
+
+    events = [event async for event in sse_events(broker, subscription, heartbeat=0.1)]
+
+    assert events[0] == ": connected\n\n"
+    assert events[-1] == f"event: close\ndata: {json.dumps({'reason': CLOSED_SLOW_CONSUMER})}\n\n"
+    assert broker.clients == 0
+
+
+async def test_websocket_receives_device_updates(app_client: TestClient, redis_client):
+    await save_devices(redis_client, [{"id": "ws-1", "name": "n", "type": "light", "status": "off", "online": True}])
+
+    with app_client.websocket_connect("/stream/ws?device_id=ws-1") as ws:
+        assert app_client.get("/admin/stream").json()["clients"] == 1
+
+        response = app_client.post("/devices/ws-1/command", json={"status": "on"})
+        assert response.status_code == 200
+
+        message = json.loads(ws.receive_text())
+
+    assert message["device_id"] == "ws-1"
+    assert message["updated_fields"] == {"status": "on"}
@@ -0,0 +1,188 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+from src.infrastructure.command_workers import CommandWorkerPool
+from src.services import write_coalescer
+from src.services.commands_service import process_command_message
+from src.services.device_events import UPDATE_APPLIED
+from src.services.device_registry import save_devices
+from src.services.device_service import apply_command
+from src.services.device_store import RedisDeviceStore
+from src.services.write_coalescer import WriteCancelled, WriteCoalescer
+from src.utils import device_key, device_history_key
+
+
+DEVICES = [
+    {"id": f"chatty-{i}", "name": "Lamp", "type": "light", "status": "on", "online": True}
+    for i in range(2)
+]
+
+
+@pytest.fixture
+async def coalescing(redis_client):
+    await save_devices(redis_client, DEVICES)
+    coalescer = write_coalescer.enable_write_coalescer(window=0.05)
+    try:
+        yield coalescer
+    finally:
+        await write_coalescer.disable_write_coalescer()
+
+
+async def test_burst_becomes_one_write(redis_client):
+    await save_devices(redis_client, DEVICES)
+    coalescer = WriteCoalescer(window=0.05)
+
+    futures = [
+        coalescer.submit(redis_client, "chatty-0", {"status": status}, f"2024-01-01T00:00:0{i}")
+        for i, status in enumerate(["off", "dim", "on", "off"])
+    ]
+    futures.append(coalescer.submit(redis_client, "chatty-0", {"online": "false"}, "2024-01-01T00:00:05"))
+    results = await asyncio.gather(*futures)
+
+    assert {result.status for result in results} == {UPDATE_APPLIED}
+    state = await redis_client.hgetall(device_key("chatty-0"))
+    assert (state["status"], state["online"]) == ("off", "false")
+    assert await redis_client.xlen(device_history_key("chatty-0")) == 1
+    stats = coalescer.stats()
+    assert (stats["commands"], stats["merged"], stats["writes"], stats["pending_devices"]) == (5, 4, 1, 0)
+
+
+async def test_burst_across_devices_writes_each_device_once(redis_client):
+    devices = [
+        {"id": f"burst-{i}", "name": "n", "type": "light", "status": "on", "online": True}
+        for i in range(10)
+    ]
+    await save_devices(redis_client, devices)
+    coalescer = WriteCoalescer(window=0.05)
+
+    # every device flips its status 50 times in a burst
+    await asyncio.gather(*(
+        coalescer.submit(redis_client, device["id"], {"status": "off" if n % 2 else "on", "name": f"lamp-{n}"}, str(n))
+        for n in range(50)
+        for device in devices
+    ))
+
+    stats = coalescer.stats()
+    assert (stats["commands"], stats["writes"]) == (50 * len(devices), len(devices))
+    assert [await redis_client.xlen(device_history_key(device["id"])) for device in devices] == [1] * len(devices)
+
+
+async def test_cancelled_write_releases_its_waiters(redis_client, monkeypatch):
+    await save_devices(redis_client, DEVICES)
+    started = asyncio.Event()
+
+    async def stuck_update(self, device_id, command, timestamp, publish_commands=True):
+        started.set()
+        await asyncio.sleep(60)
+
+    monkeypatch.setattr(RedisDeviceStore, "apply_update", stuck_update)
+    coalescer = WriteCoalescer(window=0.01)
+    caller = asyncio.create_task(coalescer.apply(redis_client, "chatty-0", {"status": "off"}, "t1"))
+    window = coalescer.submit(redis_client, "chatty-0", {"status": "dim"}, "t2")
+    await started.wait()
+
+    # what happens to open writes on shutdown
+    for task in list(coalescer._writing.values()):
+        task.cancel()
+
+    with pytest.raises(WriteCancelled):
+        await asyncio.wait_for(caller, 1)
+    assert window.cancelled()
+    assert coalescer.stats()["failed"] == 1
+
+
+async def test_windows_of_one_device_are_written_in_order(redis_client):
+    await save_devices(redis_client, DEVICES)
+    coalescer = WriteCoalescer(window=0.01)
+
+    first = coalescer.submit(redis_client, "chatty-0", {"status": "off"}, "t1")
+    await asyncio.sleep(0.02)
+    second = coalescer.submit(redis_client, "chatty-0", {"status": "dim"}, "t2")
+    await asyncio.gather(first, second)
+
+    assert await redis_client.hget(device_key("chatty-0"), "status") == "dim"
+    assert await redis_client.xlen(device_history_key("chatty-0")) == 2
+
+
+async def test_concurrent_http_commands_get_their_own_responses(redis_client, coalescing):
+    responses = await asyncio.gather(
+        apply_command(redis_client, "chatty-0", {"status": "off"}),
+        apply_command(redis_client, "chatty-0", {"status": "blinking"}),
+        apply_command(redis_client, "chatty-1", {"online": False}),
+    )
+
+    assert [response.device_id for response in responses] == ["chatty-0", "chatty-0", "chatty-1"]
+    assert "'status': 'off'" in responses[0].message
+    assert "'status': 'blinking'" in responses[1].message
+    assert await redis_client.hget(device_key("chatty-0"), "status") == "blinking"
+    assert await redis_client.xlen(device_history_key("chatty-0")) == 1
+    assert coalescing.stats()["writes"] == 2
+
+
+async def test_missing_device_fails_every_caller(redis_client, coalescing):
+    results = await asyncio.gather(
+        apply_command(redis_client, "chatty-missing", {"status": "off"}),
+        apply_command(redis_client, "chatty-missing", {"status": "on"}),
+        return_exceptions=True,
+    )
+
+    assert [getattr(result, "status_code", None) for result in results] == [404, 404]
+    assert all(isinstance(result, HTTPException) for result in results)
+
+
+async def test_cancelled_caller_does_not_cancel_the_window(redis_client, coalescing):
+    impatient = asyncio.create_task(apply_command(redis_client, "chatty-0", {"status": "off"}))
+    patient = asyncio.create_task(apply_command(redis_client, "chatty-0", {"online": False}))
+    await asyncio.sleep(0)
+    impatient.cancel()
+
+    response = await patient
+    assert response.status == "success"
+    state = await redis_client.hgetall(device_key("chatty-0"))
+    assert (state["status"], state["online"]) == ("off", "false")
+
+
+async def test_listener_commands_complete_when_merged_write_lands(redis_client, coalescing):
+    done = []
+
+    async def handle(payload):
+        return await process_command_message(redis_client, payload)
+
+    pool = CommandWorkerPool(handle, workers=1, queue_size=100)
+    pool.start()
+    for n, status in enumerate(["off", "on", "off"]):
+        await pool.submit({"device_id": "chatty-0", "command": {"status": status}}, on_done=lambda ok, n=n: done.append((n, ok)))
+    await asyncio.sleep(0.01)
+    # the single worker is free while the window is open, nothing is acknowledged yet
+    assert pool.in_flight == 0 and done == []
+
+    await coalescing.flush()
+    await pool.stop()
+
+    assert sorted(done) == [(0, True), (1, True), (2, True)]
+    assert pool.processed == 3
+    assert await redis_client.xlen(device_history_key("chatty-0")) == 1
+
+
+async def test_failed_or_cancelled_merged_write_is_not_acknowledged():
+    writes = []
+
+    async def handle(payload):
+        writes.append(asyncio.get_running_loop().create_future())
+        return writes[-1]
+
+    done = []
+    pool = CommandWorkerPool(handle, workers=1, queue_size=10)
+    pool.start()
+    for n in range(3):
+        await pool.submit({"device_id": "chatty-0", "command": {}}, on_done=lambda ok, n=n: done.append((n, ok)))
+    await asyncio.sleep(0.01)
+
+    writes[0].set_result(None)
+    writes[1].set_exception(ConnectionError("Redis went away"))
+    writes[2].cancel()
+    await asyncio.sleep(0)
+    await pool.stop()
+
+    assert done == [(0, True), (1, False), (2, False)]
+    assert (pool.processed, pool.failed) == (1, 2)
@@ -1,4 +1,35 @@
-from typing import Dict
+import base64
+import binascii
+from typing import Dict, Optional
+
+
+DEVICE_REGISTRY_KEY = "devices:registry"
+DEVICE_INDEX_PREFIX = "devices:index:"
+DEVICE_INDEXED_FIELDS = ("type", "status", "online")
+
+
+def device_key(device_id: str) -> str:
+    return f"device:{device_id}"
+
+
+def device_history_key(device_id: str) -> str:
+    return f"device:history:{device_id}"
+
+
+def device_index_key(field: str, value: str) -> str:
+    return f"{DEVICE_INDEX_PREFIX}{field}:{value}"
+
+
+def encode_cursor(device_id: str) -> str:
+    return base64.urlsafe_b64encode(device_id.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Optional[str]:
+    padded = cursor + "=" * (-len(cursor) % 4)
+    try:
+        return base64.b64decode(padded.encode("ascii"), altchars=b"-_", validate=True).decode("utf-8")
+    except (binascii.Error, UnicodeError, ValueError):
+        return None
 
 
 def prepare_device_data(key: str, data: Dict[str, str]) -> Dict[str, str]:
@@ -20,4 +51,4 @@ def prepare_for_redis(data: dict) -> dict:
             prepared_data[k] = str(v).lower()
         else:
             prepared_data[k] = str(v)
-    return prepared_data
\ No newline at end of file
+    return prepared_data